@@ -6,6 +6,9 @@ import sys
 import json
 import pickle
 import operator
+import time
+
+import numpy as np
 
 import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
@@ -13,6 +16,7 @@ ROOT.PyConfig.IgnoreCommandLineOptions = True
 from DevTools.Utilities.utilities import *
 from DevTools.Limits.Optimizer import Optimizer
 from DevTools.Plotter.Counter import Counter
+from DevTools.Plotter.JointScan import JointScan
 from DevTools.Plotter.higgsUtilities import *
 
 
@@ -24,7 +28,7 @@ def parse_command_line(argv):
     parser = argparse.ArgumentParser(description='Optimize a selection')
 
     parser.add_argument('analysis', type=str, help='Analysis to optimize')
-    parser.add_argument('variable', type=str, help='Variable to optimize')
+    parser.add_argument('variable', type=str, help='Variable to optimize, joint for the best combination of all variables')
 
     return parser.parse_args(argv)
 
@@ -109,6 +113,67 @@ def main(argv=None):
                 totErr2 = perr**2
         return (tot,totErr2**0.5)
 
+    def getScan(counters,sig,directory):
+        return counters[sig].getJointScan(sig,'joint',directory)
+
+    def mergeScans(scans):
+        '''Sum the bins of joint scans with the same axes, None if there are none'''
+        total = None
+        for scan in scans:
+            if scan is None: continue
+            if total is None: total = JointScan(scan.axes)
+            total.merge(scan.bins)
+        return total
+
+    def getBackgroundScan(counters,directories):
+        '''
+        Datadriven background passing each point of the joint scan summed over the directories,
+        with the Poisson floor of each directory as in getBackgroundCount
+        '''
+        parts = [(s,['3P0F'] if args.analysis=='Hpp3l' else ['4P0F']) for s in samples]
+        parts += [(s,['2P1F','1P2F','0P3F'] if args.analysis=='Hpp3l' else ['3P1F','2P2F','1P3F']) for s in samples+['data']]
+        poisErr2s = np.array([getPoisson(n)**2 for n in range(10)])
+        tot, totErr2 = None, 0.
+        for directory in directories:
+            dirdirs = directory.split('/')
+            scan = mergeScans(getScan(counters,s,'/'.join([reg]+dirdirs)) for s, regions in parts for reg in regions)
+            if scan is None:
+                # nothing passes anywhere
+                totErr2 = totErr2 + poisErr2s[0]
+                continue
+            val, err2 = scan.passing()
+            val = np.maximum(val,0.)
+            poisErr2 = poisErr2s[np.minimum(val,9).astype(int)]
+            err2 = np.where((val<10) & (poisErr2>err2), poisErr2, err2)
+            tot = val if tot is None else tot + val
+            totErr2 = totErr2 + err2
+        if tot is None: return None
+        return (tot,totErr2)
+
+    def asimovGrid(sig,bg,bgErr):
+        '''Asimov significance with background uncertainty for arrays of counts'''
+        s = np.maximum(sig,0.)
+        b = bg
+        b2 = bgErr**2
+        with np.errstate(divide='ignore',invalid='ignore'):
+            z2 = 2*((s+b)*np.log((s+b)*(b+b2)/(b**2+(s+b)*b2)) - b**2/b2*np.log(1+b2*s/(b*(b+b2))))
+        return np.sqrt(np.maximum(np.nan_to_num(z2),0.))
+
+    # signal for all modes from the counts of each gen channel
+    nl = 3 if args.analysis=='Hpp3l' else 4 # 3 for AP, 4 for PP
+    modeIndex = dict([(mode,i) for i,mode in enumerate(modes)])
+    brMatrices = {}
+    signalCache = {}
+    def getSignalCount(counters,sig,directory,reco,mode):
+        if reco not in brMatrices:
+            genChans = [gen for gen in genRecoMap if len(gen)==nl and reco in genRecoMap[gen]]
+            brMatrices[reco] = (genChans, getBRMatrix(args.analysis,modes,genChans))
+        if (sig,directory) not in signalCache:
+            genChans, brMatrix = brMatrices[reco]
+            signalCache[(sig,directory)] = counters[sig].getBenchmarkCounts(sig,directory,genChans,brMatrix)
+        vals, errs = signalCache[(sig,directory)]
+        return (vals[modeIndex[mode]], errs[modeIndex[mode]])
+
     def getRecoChans(mode):
         # find out what reco/gen channels can exist for this mode
         recoChans = set()
@@ -167,6 +232,73 @@ def main(argv=None):
     }
 
 
+    if args.variable=='joint':
+        # all combinations of cuts at once from the joint scans of the skims
+        values = dict([(mode,{}) for mode in modes])
+        # modes with the same mass window share the scan directories
+        groups = {}
+        for mode in modes:
+            hpphm = 'hpp{0}'.format(modeMap[mode][0])
+            hpphmm = 'hpp{0}hmm{1}'.format(modeMap[mode][0],modeMap[mode][1])
+            name = hpphm if args.analysis=='Hpp3l' else hpphmm
+            groups.setdefault(name,[]).append(mode)
+        for mass in masses:
+            proc = 'HppHm{0}GeV'.format(mass) if args.analysis=='Hpp3l' else 'HppHmm{0}GeV'.format(mass)
+            for name in sorted(groups):
+                start = time.time()
+                groupModes = groups[name]
+                modeRecoChans = dict([(mode,getRecoChans(mode)) for mode in groupModes])
+                recoChans = set().union(*modeRecoChans.values())
+                directory = 'optimize/joint/{0}/{1}'.format(mass,name)
+                # signal of every mode from the scan of each gen channel, merged over the reco channels
+                genChans = [gen for gen in sorted(genRecoMap) if len(gen)==nl and recoChans & set(genRecoMap[gen])] # 3 for AP, 4 for PP
+                genScans = [(gen,mergeScans(getScan(counters,proc,'{0}/{1}/gen_{2}'.format(directory,reco,gen)) for reco in genRecoMap[gen] if reco in recoChans)) for gen in genChans]
+                genScans = [(gen,scan) for gen,scan in genScans if scan is not None]
+                if not genScans:
+                    logging.warning('No joint scan for {0} {1}'.format(' '.join(groupModes),mass))
+                    continue
+                gridScan = genScans[0][1]
+                genVals, genErr2s = zip(*[scan.passing() for gen,scan in genScans])
+                brMatrix = getBRMatrix(args.analysis,groupModes,[gen for gen,scan in genScans])
+                sigVals = np.tensordot(brMatrix,np.array(genVals),axes=1)
+                sigErr2s = np.tensordot(brMatrix**2,np.array(genErr2s),axes=1)
+                del genScans, genVals, genErr2s
+                # background summed over the reco channels of each mode
+                bgScans = {}
+                zeros = np.zeros(gridScan.shape())
+                for m, mode in enumerate(groupModes):
+                    recoKey = tuple(sorted(modeRecoChans[mode]))
+                    if recoKey not in bgScans:
+                        bgScans[recoKey] = getBackgroundScan(counters,['{0}/{1}'.format(directory,reco) for reco in recoKey])
+                    bgTot, bgTotErr2 = bgScans[recoKey] if bgScans[recoKey] is not None else (0.,0.)
+                    bgTotErr = zeros + np.sqrt(bgTotErr2)
+                    bgTot = np.maximum(zeros + bgTot, bgTotErr)
+                    sigTot = zeros + sigVals[m]
+                    sigTotErr = zeros + np.sqrt(sigErr2s[m])
+                    asimovValues = asimovGrid(sigTot,bgTot,bgTotErr)
+                    best = np.unravel_index(np.argmax(asimovValues),asimovValues.shape)
+                    cuts = gridScan.thresholds(best)
+                    sig = (float(sigTot[best]), float(sigTotErr[best]))
+                    bg = (float(bgTot[best]), float(bgTotErr[best]))
+                    values[mode][mass] = {
+                        'joint': {
+                            'cuts': cuts,
+                            'sig': sig,
+                            'bg': bg,
+                            'sOverB': sOverB(sig,bg),
+                            'pois': poissonSignificance(sig,bg),
+                            'poisErr': poissonSignificanceWithError(sig,bg),
+                            'asimov': asimovSignificance(sig,bg),
+                            'asimovErr': asimovSignificanceWithError(sig,bg),
+                        },
+                    }
+                    print mode, mass, 'joint', ' '.join(['{0} {1}'.format(var,cuts[var]) for var in sorted(cuts)]), sig[0], bg[0], values[mode][mass]['joint']['asimovErr']
+                logging.info('{0} {1}: {2} working points for {3} modes in {4:.2f} s'.format(name,mass,zeros.size,len(groupModes),time.time()-start))
+
+        # write values to file
+        dumpResults(values,args.analysis,'optimization_joint')
+        return 0
+
     values = {}
     for mode in modes:
         values[mode] = {}
@@ -199,19 +331,9 @@ def main(argv=None):
                         bgTotErr2 += bgErr**2
                         # signal
                         proc = signalsAP[0] if args.analysis=='Hpp3l' else signalsPP[0]
-                        sig = 0.
-                        sigErr2 = 0.
-                        nl = 3 if args.analysis=='Hpp3l' else 4
-                        for gen in genRecoMap:
-                            if len(gen)!=nl: continue # 3 for AP, 4 for PP
-                            if reco not in genRecoMap[gen]: continue
-                            value,err = getCount(counters,proc,'optimize/{0}/{1}/{2}/{3}/{4}/gen_{5}'.format(optVar,optVal,mass,hpphm if args.analysis=='Hpp3l' else hpphmm ,reco,gen))
-                            scale = scales[mode].scale_Hpp3l(gen[:2],gen[2:]) if args.analysis=='Hpp3l' else scales[mode].scale_Hpp4l(gen[:2],gen[2:])
-                            sig += scale*value
-                            sigErr2 += (scale*err)**2
-                        sigErr = sigErr2**0.5
+                        sig, sigErr = getSignalCount(counters,proc,'optimize/{0}/{1}/{2}/{3}/{4}'.format(optVar,optVal,mass,hpphm if args.analysis=='Hpp3l' else hpphmm ,reco),reco,mode)
                         sigTot += sig
-                        sigTotErr2 += sigErr2
+                        sigTotErr2 += sigErr**2
                     bgTotErr = bgTotErr2**0.5
                     if bgTot < bgTotErr: bgTot = bgTotErr
                     sigTotErr = sigTotErr2**0.5
@@ -0,0 +1,151 @@
+'''
+Fill many TTree::Draw style histograms in a single pass over a tree.
+'''
+import logging
+
+import ROOT
+
+
+def declareBatchDraw():
+    '''Compile the event loop filling the booked histograms'''
+    if hasattr(ROOT,'fillBatchDraw'): return
+    ROOT.gInterpreter.Declare('''
+#include <vector>
+#include <algorithm>
+#include "TTree.h"
+#include "TTreeFormula.h"
+#include "TH1.h"
+#include "TH2.h"
+#include "TH3.h"
+Long64_t fillBatchDraw(TTree* tree, std::vector<TTreeFormula*>& formulas, std::vector<TH1*>& hists, std::vector<std::vector<int> >& inputs) {
+  // inputs of each histogram: weight, x, y, z formula indices
+  std::vector<int> ndata(formulas.size());
+  std::vector<double> values(formulas.size());
+  int treeNumber = -1;
+  Long64_t entry = 0;
+  for (;; ++entry) {
+    if (tree->LoadTree(entry)<0) break;
+    if (tree->GetTreeNumber()!=treeNumber) {
+      treeNumber = tree->GetTreeNumber();
+      for (size_t f=0; f<formulas.size(); ++f) formulas[f]->UpdateFormulaLeaves();
+    }
+    for (size_t f=0; f<formulas.size(); ++f) {
+      ndata[f] = formulas[f]->GetNdata();
+      values[f] = ndata[f]>0 ? formulas[f]->EvalInstance(0) : 0.;
+    }
+    for (size_t h=0; h<hists.size(); ++h) {
+      const std::vector<int>& in = inputs[h];
+      // array expressions are looped over the smallest number of instances
+      int n = 1;
+      bool multiple = false;
+      bool empty = false;
+      for (size_t k=0; k<in.size(); ++k) {
+        if (formulas[in[k]]->GetMultiplicity()) {
+          n = multiple ? std::min(n,ndata[in[k]]) : ndata[in[k]];
+          multiple = true;
+        }
+        else if (ndata[in[k]]<1) {
+          empty = true;
+        }
+      }
+      if (empty) continue;
+      for (int i=0; i<n; ++i) {
+        double v[4];
+        for (size_t k=0; k<in.size(); ++k) {
+          v[k] = (i && formulas[in[k]]->GetMultiplicity()) ? formulas[in[k]]->EvalInstance(i) : values[in[k]];
+        }
+        if (!v[0]) continue;
+        if (in.size()==2) hists[h]->Fill(v[1],v[0]);
+        else if (in.size()==3) ((TH2*)hists[h])->Fill(v[1],v[2],v[0]);
+        else ((TH3*)hists[h])->Fill(v[1],v[2],v[3],v[0]);
+      }
+    }
+  }
+  return entry;
+}
+''')
+
+
+class BatchDraw(object):
+    '''
+    Book histograms as TTree::Draw would and fill them in one event loop.
+
+    Each histogram is booked with the draw variables (x, y, z), the binning,
+    and the weight expression (scalefactor*(selection)). Every distinct
+    expression is compiled once as a TTreeFormula, so only the branches they
+    use are read and the tree is decompressed a single time for all
+    histograms. Histograms are filled as in TTree::Draw: the TH1F, TH2F or
+    TH3F created for "var>>name(binning)", entries with zero weight skipped,
+    and array expressions looped over their instances.
+    '''
+
+    def __init__(self,tree):
+        self.tree = tree
+        self.booked = []
+        self.expressions = []
+        self.index = {}
+
+    def __len__(self):
+        return len(self.booked)
+
+    def __expression(self,expression):
+        expression = str(expression)
+        if expression not in self.index:
+            self.index[expression] = len(self.expressions)
+            self.expressions += [expression]
+        return self.index[expression]
+
+    def book(self,histName,variables,binning,weight):
+        '''Book a histogram of the variables (x, y, z) filled with a weight expression'''
+        inputs = [self.__expression(weight)]+[self.__expression(v) for v in variables]
+        self.booked += [(histName,len(variables),[x for x in binning],inputs)]
+
+    def __create(self,histName,dimension,binning):
+        hist = getattr(ROOT,'TH{0}F'.format(dimension))(histName,histName,*binning)
+        hist.SetDirectory(0)
+        return hist
+
+    def run(self):
+        '''Fill all booked histograms, returns a dictionary of the histograms by name'''
+        hists = {}
+        for histName, dimension, binning, inputs in self.booked:
+            hists[histName] = self.__create(histName,dimension,binning)
+        if not self.booked or not self.tree: return hists
+        if self.tree.LoadTree(0)<0: return hists
+        declareBatchDraw()
+        # compile each expression, histograms with an invalid expression stay empty as with Draw
+        formulas = ROOT.std.vector('TTreeFormula*')()
+        keep = []
+        position = {}
+        for i, expression in enumerate(self.expressions):
+            formula = ROOT.TTreeFormula('batchDraw{0}'.format(i),expression,self.tree)
+            if not formula.GetNdim():
+                logging.error('Failed to compile expression {0}'.format(expression))
+                continue
+            position[i] = len(keep)
+            keep += [formula]
+            formulas.push_back(formula)
+        vhists = ROOT.std.vector('TH1*')()
+        vinputs = ROOT.std.vector('std::vector<int>')()
+        for histName, dimension, binning, inputs in self.booked:
+            if any([i not in position for i in inputs]): continue
+            vhists.push_back(hists[histName])
+            vin = ROOT.std.vector('int')()
+            for i in inputs: vin.push_back(position[i])
+            vinputs.push_back(vin)
+        n = ROOT.fillBatchDraw(self.tree,formulas,vhists,vinputs)
+        logging.debug('Filled {0} histograms from {1} expressions over {2} entries'.format(len(self.booked),len(self.expressions),n))
+        return hists
+
+    def clone(self,tree):
+        '''The same bookings on another tree'''
+        batch = BatchDraw(tree)
+        batch.booked = list(self.booked)
+        batch.expressions = list(self.expressions)
+        batch.index = dict(self.index)
+        return batch
+
+    def clear(self):
+        self.booked = []
+        self.expressions = []
+        self.index = {}
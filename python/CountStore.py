@@ -0,0 +1,241 @@
+'''
+Skim counts in a compact indexed file read through mmap.
+
+Layout (little endian):
+    header   '<8sQQ': magic, number of keys n, size of the key blob
+    offsets  n+1 uint64, start of each key in the blob
+    blob     the sorted keys, concatenated
+    padding  to a multiple of 8 bytes
+    val      n float64
+    count    n float64
+    err2     n float64
+A lookup is a binary search over the offsets and only reads a few pages.
+'''
+import os
+import json
+import math
+import mmap
+import heapq
+import shutil
+import struct
+import tempfile
+import itertools
+
+MAGIC = 'DTCOUNT1'
+HEADER = struct.Struct('<8sQQ')
+UINT64 = struct.Struct('<Q')
+FLOAT64 = struct.Struct('<d')
+
+
+def _encode(key):
+    return key.encode('utf-8') if isinstance(key,unicode) else key
+
+def _padding(size):
+    return (8-size%8)%8
+
+
+class CountStoreWriter(object):
+    '''
+    Write a count store from keys added in increasing order.
+
+    The keys and values are streamed to temporary files next to the output
+    and the store is assembled on close, so memory does not grow with the
+    number of keys.
+    '''
+
+    def __init__(self,filename,bufferSize=10000):
+        self.filename = filename
+        self.bufferSize = bufferSize
+        self.tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(filename)))
+        self.parts = ['offsets','keys','val','count','err2']
+        self.files = dict([(part,open(os.path.join(self.tmpdir,part),'wb')) for part in self.parts])
+        self.buffers = dict([(part,[]) for part in self.parts])
+        self.n = 0
+        self.blobSize = 0
+        self.last = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,type,value,traceback):
+        if type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self,key,val,count,err2):
+        key = _encode(key)
+        if self.last is not None and key<=self.last:
+            raise ValueError('Keys must be added in increasing order: {0} after {1}'.format(key,self.last))
+        self.last = key
+        self.buffers['offsets'].append(self.blobSize)
+        self.buffers['keys'].append(key)
+        self.buffers['val'].append(val)
+        self.buffers['count'].append(count)
+        self.buffers['err2'].append(err2)
+        self.blobSize += len(key)
+        self.n += 1
+        if len(self.buffers['keys'])>=self.bufferSize: self.flush()
+
+    def flush(self):
+        for part in self.parts:
+            buf = self.buffers[part]
+            if not buf: continue
+            if part=='keys':
+                self.files[part].write(''.join(buf))
+            elif part=='offsets':
+                self.files[part].write(struct.pack('<{0}Q'.format(len(buf)),*buf))
+            else:
+                self.files[part].write(struct.pack('<{0}d'.format(len(buf)),*buf))
+            self.buffers[part] = []
+
+    def close(self):
+        '''Assemble the store'''
+        self.buffers['offsets'].append(self.blobSize)
+        self.flush()
+        for part in self.parts:
+            self.files[part].close()
+        tmpname = os.path.join(self.tmpdir,'store')
+        with open(tmpname,'wb') as f:
+            f.write(HEADER.pack(MAGIC,self.n,self.blobSize))
+            for part in self.parts:
+                with open(os.path.join(self.tmpdir,part),'rb') as p:
+                    shutil.copyfileobj(p,f)
+                if part=='keys': f.write('\0'*_padding(HEADER.size+8*(self.n+1)+self.blobSize))
+        os.rename(tmpname,self.filename)
+        shutil.rmtree(self.tmpdir)
+
+    def abort(self):
+        for part in self.parts:
+            self.files[part].close()
+        shutil.rmtree(self.tmpdir)
+
+
+def writeCountStore(filename,counts):
+    '''Write a dictionary of counts ({'val','count','err2'} by key) as a store'''
+    with CountStoreWriter(filename) as writer:
+        for key in sorted(counts,key=_encode):
+            writer.add(key,counts[key]['val'],counts[key]['count'],counts[key]['err2'])
+
+
+class CountStore(object):
+    '''
+    Read access to a count store.
+
+    Supports get, membership, len and iteration in key order. Values are
+    returned as dictionaries with the val, count, and err2 of the skim.
+    '''
+
+    def __init__(self,filename):
+        self.filename = filename
+        self.file = open(filename,'rb')
+        self.mm = mmap.mmap(self.file.fileno(),0,access=mmap.ACCESS_READ)
+        magic, self.n, blobSize = HEADER.unpack_from(self.mm,0)
+        if magic!=MAGIC: raise ValueError('{0} is not a count store'.format(filename))
+        self.offsetStart = HEADER.size
+        self.blobStart = self.offsetStart+8*(self.n+1)
+        self.valStart = self.blobStart+blobSize+_padding(self.blobStart+blobSize)
+
+    def __len__(self):
+        return self.n
+
+    def __contains__(self,key):
+        return self.find(key)>=0
+
+    def __getitem__(self,key):
+        i = self.find(key)
+        if i<0: raise KeyError(key)
+        return self.entry(i)
+
+    def __iter__(self):
+        for i in xrange(self.n):
+            yield self.key(i)
+
+    def get(self,key,default=None):
+        i = self.find(key)
+        return self.entry(i) if i>=0 else default
+
+    def key(self,i):
+        start = UINT64.unpack_from(self.mm,self.offsetStart+8*i)[0]
+        end = UINT64.unpack_from(self.mm,self.offsetStart+8*(i+1))[0]
+        return self.mm[self.blobStart+start:self.blobStart+end]
+
+    def entry(self,i):
+        return {
+            'val'  : FLOAT64.unpack_from(self.mm,self.valStart+8*i)[0],
+            'count': int(FLOAT64.unpack_from(self.mm,self.valStart+8*(self.n+i))[0]),
+            'err2' : FLOAT64.unpack_from(self.mm,self.valStart+8*(2*self.n+i))[0],
+        }
+
+    def find(self,key):
+        '''Index of a key, -1 if it is not in the store'''
+        key = _encode(key)
+        lo, hi = 0, self.n
+        while lo<hi:
+            mid = (lo+hi)//2
+            if self.key(mid)<key:
+                lo = mid+1
+            else:
+                hi = mid
+        if lo<self.n and self.key(lo)==key: return lo
+        return -1
+
+    def iteritems(self):
+        '''Iterate over (key, entry) in key order'''
+        for i in xrange(self.n):
+            yield self.key(i), self.entry(i)
+
+    def close(self):
+        self.mm.close()
+        self.file.close()
+
+
+def mergeCountStores(filenames,outputFile,maxOpen=64):
+    '''
+    Sum the counts of several stores into a new store.
+
+    The stores are read in key order and merged as a stream, so only one
+    entry per store is in memory. At most maxOpen stores are open at once,
+    larger sets are merged in batches through temporary stores.
+    The val and err2 of each key are summed with math.fsum.
+    '''
+    filenames = list(filenames)
+    if len(filenames)>maxOpen:
+        tmpdir = tempfile.mkdtemp(dir=os.path.dirname(os.path.abspath(outputFile)))
+        try:
+            batches = []
+            for i in range(0,len(filenames),maxOpen):
+                batch = os.path.join(tmpdir,'batch{0}.cnt'.format(len(batches)))
+                mergeCountStores(filenames[i:i+maxOpen],batch,maxOpen)
+                batches += [batch]
+            mergeCountStores(batches,outputFile,maxOpen)
+        finally:
+            shutil.rmtree(tmpdir)
+        return
+    stores = []
+    try:
+        for filename in filenames:
+            stores += [CountStore(filename)]
+        streams = [((key,entry['val'],entry['count'],entry['err2']) for key,entry in store.iteritems()) for store in stores]
+        with CountStoreWriter(outputFile) as writer:
+            for key, group in itertools.groupby(heapq.merge(*streams),key=lambda x: x[0]):
+                entries = list(group)
+                writer.add(key,math.fsum([e[1] for e in entries]),sum([e[2] for e in entries]),math.fsum([e[3] for e in entries]))
+    finally:
+        for store in stores:
+            store.close()
+
+def exportCountStore(filename,jsonName):
+    '''Write a store as the json of the counts dictionary, one key at a time'''
+    store = CountStore(filename)
+    try:
+        with open(jsonName,'w') as f:
+            f.write('{')
+            first = True
+            for key, entry in store.iteritems():
+                f.write('\n' if first else ',\n')
+                f.write('    {0}: {1}'.format(json.dumps(key),json.dumps(entry,sort_keys=True)))
+                first = False
+            f.write('\n}')
+    finally:
+        store.close()
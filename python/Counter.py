@@ -6,9 +6,12 @@ import prettytable
 from array import array
 from collections import OrderedDict
 
+import numpy as np
+
 import ROOT
 
-from DevTools.Plotter.NtupleWrapper import NtupleWrapper
+from DevTools.Plotter.NtupleWrapper import LazyNtupleWrapper
+from DevTools.Plotter.JointScan import JointScan
 from DevTools.Plotter.utilities import getLumi, isData
 from DevTools.Utilities.utilities import sumWithError, prodWithError, divWithError, python_mkdir
 
@@ -40,8 +43,7 @@ class Counter(object):
         analysis = kwargs.pop('analysis',self.analysis)
         if analysis not in self.sampleFiles: self.sampleFiles[analysis] = {}
         if sampleName not in self.sampleFiles[analysis]:
-            self.sampleFiles[analysis][sampleName] = NtupleWrapper(analysis,sampleName,new=self.new,**kwargs)
-            ROOT.gROOT.cd()
+            self.sampleFiles[analysis][sampleName] = LazyNtupleWrapper(analysis,sampleName,new=self.new,**kwargs)
 
     def addProcess(self,processName,processSamples,signal=False,**kwargs):
         '''
@@ -192,6 +194,36 @@ class Counter(object):
         '''Get a single count'''
         return self._getCount(processName,directory,**kwargs)
 
+    def getGenChannelCounts(self,processName,directory,genChannels,**kwargs):
+        '''Get the val and err2 of a process for each gen channel (directory/gen_{genChannel})'''
+        vals = []
+        err2s = []
+        for gen in genChannels:
+            count = self.getCount(processName,'{0}/gen_{1}'.format(directory,gen),**kwargs)
+            vals += [count[0]]
+            err2s += [count[1]**2]
+        return np.array(vals,dtype=float), np.array(err2s,dtype=float)
+
+    def getBenchmarkCounts(self,processName,directory,genChannels,brMatrix,**kwargs):
+        '''
+        Get the val and err of a process for each benchmark at once.
+        brMatrix has the scale of each gen channel (columns) for each benchmark (rows),
+        see higgsUtilities.getBRMatrix.
+        '''
+        vals, err2s = self.getGenChannelCounts(processName,directory,genChannels,**kwargs)
+        return np.dot(brMatrix,vals), np.sqrt(np.dot(brMatrix**2,err2s))
+
+    def getJointScan(self,processName,scanName,directory):
+        '''Get the joint scan of a process summed over its samples'''
+        analysis = self.analysisDict[processName]
+        total = None
+        for sampleName in self.processDict[processName]:
+            scan = self.sampleFiles[analysis][sampleName].getJointScan(scanName,directory)
+            if scan is None: continue
+            if total is None: total = JointScan(scan.axes)
+            total.merge(scan.bins)
+        return total
+
     def getCounts(self,directory,**kwargs):
         '''Get a map for the counts'''
         counts = {}
@@ -3,7 +3,7 @@ from prettytable import PrettyTable
 
 import ROOT
 
-from DevTools.Plotter.NtupleWrapper import NtupleWrapper
+from DevTools.Plotter.NtupleWrapper import LazyNtupleWrapper
 from DevTools.Utilities.utilities import sumWithError, prodWithError, divWithError, python_mkdir
 
 
@@ -24,8 +24,7 @@ class Efficiency(object):
         analysis = kwargs.pop('analysis',self.analysis)
         if analysis not in self.sampleFiles: self.sampleFiles[analysis] = {}
         if sampleName not in self.sampleFiles[analysis]:
-            self.sampleFiles[analysis][sampleName] = NtupleWrapper(analysis,sampleName,**kwargs)
-            ROOT.gROOT.cd()
+            self.sampleFiles[analysis][sampleName] = LazyNtupleWrapper(analysis,sampleName,**kwargs)
 
     def addProcess(self,processName,processSamples,**kwargs):
         '''
@@ -0,0 +1,171 @@
+'''
+Stream the fields of selected events to compressed columnar chunks.
+'''
+import os
+import zipfile
+from array import array
+from cStringIO import StringIO
+
+try:
+    import numpy as np
+    hasNumpy = True
+except:
+    hasNumpy = False
+
+
+class Column(object):
+    '''
+    A buffer of the values of a field.
+    Numbers are kept in typed arrays, anything else is kept formatted.
+    '''
+    __slots__ = ['values']
+
+    def __init__(self):
+        self.values = None
+
+    def __len__(self):
+        return len(self.values) if self.values is not None else 0
+
+    def append(self,val):
+        if self.values is None:
+            if isinstance(val,bool): self.values = []
+            elif isinstance(val,(int,long)): self.values = array('l')
+            elif isinstance(val,float): self.values = array('d')
+            else: self.values = []
+        if not isinstance(self.values,list):
+            kind = float if self.values.typecode=='d' else (int,long)
+            if isinstance(val,kind) and not isinstance(val,bool):
+                try:
+                    self.values.append(val)
+                    return
+                except OverflowError:
+                    pass
+            # mixed types, keep the field formatted from here on
+            self.values = ['{}'.format(v) for v in self.values]
+        self.values.append('{}'.format(val))
+
+    def toArray(self):
+        if isinstance(self.values,list): return np.array(self.values,dtype=str)
+        return np.array(self.values,dtype=np.int64 if self.values.typecode=='l' else np.float64)
+
+    def clear(self):
+        if self.values is None: return
+        if isinstance(self.values,list): self.values = []
+        else: self.values = array(self.values.typecode)
+
+
+class EventDump(object):
+    '''
+    Write the fields of events passing a selection.
+
+    Events are buffered and written in chunks to events{suffix}.npz in the
+    output directory. Each chunk is stored as chunkNNNNNN/<field>.npy and
+    can be read back with readEventDump. The file stays open until close,
+    which also exports events.csv if requested.
+    Without numpy the events are written directly to events.csv{suffix}.
+    '''
+
+    def __init__(self,outdir,fields,chunkSize=10000,suffix=''):
+        self.fields = list(fields)+['weight']
+        self.chunkSize = chunkSize
+        self.npzName = os.path.join(outdir,'events{0}.npz'.format(suffix))
+        self.csvName = os.path.join(outdir,'events.csv{0}'.format(suffix))
+        self.filename = getEventDumpName(outdir,suffix)
+        self.columns = [Column() for f in self.fields]
+        self.size = 0
+        self.nChunks = 0
+        if hasNumpy:
+            self.zfile = zipfile.ZipFile(self.npzName,'w',zipfile.ZIP_DEFLATED,allowZip64=True)
+        else:
+            self.csvfile = open(self.csvName,'w')
+            if not suffix: self.csvfile.write(','.join(self.fields)+'\n')
+
+    def fill(self,values):
+        '''Add an event, values are in the order of the fields (with the weight last)'''
+        if not hasNumpy:
+            self.csvfile.write(','.join(['{}'.format(v) for v in values])+'\n')
+            return
+        for col,val in zip(self.columns,values):
+            col.append(val)
+        self.size += 1
+        if self.size>=self.chunkSize: self.flush()
+
+    def flush(self):
+        '''Write the buffered events as a chunk'''
+        if not hasNumpy or not self.size: return
+        for field,col in zip(self.fields,self.columns):
+            buf = StringIO()
+            np.save(buf,col.toArray())
+            self.zfile.writestr('chunk{0:06d}/{1}.npy'.format(self.nChunks,field),buf.getvalue())
+            col.clear()
+        self.nChunks += 1
+        self.size = 0
+
+    def merge(self,other):
+        '''Append the events written to the file of another dump'''
+        if not hasNumpy:
+            with open(other,'r') as f:
+                for line in f:
+                    self.csvfile.write(line)
+            return
+        self.flush()
+        with zipfile.ZipFile(other,'r') as zother:
+            names = sorted(zother.namelist())
+            chunks = sorted(set([name.split('/')[0] for name in names]))
+            for chunk in chunks:
+                for field in self.fields:
+                    self.zfile.writestr('chunk{0:06d}/{1}.npy'.format(self.nChunks,field),zother.read('{0}/{1}.npy'.format(chunk,field)))
+                self.nChunks += 1
+
+    def close(self,csv=True):
+        '''Write the remaining events and optionally export the csv'''
+        if not hasNumpy:
+            self.csvfile.close()
+            return
+        self.flush()
+        self.zfile.close()
+        if csv: exportEventDump(self.npzName,self.csvName,self.fields)
+
+
+def getEventDumpName(outdir,suffix=''):
+    '''The file an EventDump writes to'''
+    if hasNumpy: return os.path.join(outdir,'events{0}.npz'.format(suffix))
+    return os.path.join(outdir,'events.csv{0}'.format(suffix))
+
+def iterateEventDump(filename):
+    '''Iterate over the chunks of a dump as (fields, columns)'''
+    with zipfile.ZipFile(filename,'r') as zfile:
+        names = zfile.namelist()
+    chunks = sorted(set([name.split('/')[0] for name in names]))
+    if not chunks: return
+    fields = []
+    for name in names:
+        chunk, field = name.split('/')
+        if chunk==chunks[0]: fields += [field[:-4]]
+    dump = np.load(filename)
+    try:
+        for chunk in chunks:
+            yield fields, [dump['{0}/{1}'.format(chunk,field)] for field in fields]
+    finally:
+        dump.close()
+
+def readEventDump(filename):
+    '''Read a dump into a dictionary of arrays'''
+    result = {}
+    for fields, columns in iterateEventDump(filename):
+        for field, col in zip(fields,columns):
+            result.setdefault(field,[]).append(col)
+    return dict([(field,np.concatenate(cols)) for field,cols in result.iteritems()])
+
+def exportEventDump(filename,csvName,fields=[]):
+    '''Write a dump as csv'''
+    with open(csvName,'w') as f:
+        header = False
+        for dumpFields, columns in iterateEventDump(filename):
+            if not header:
+                f.write(','.join(dumpFields)+'\n')
+                header = True
+            for vals in zip(*[col.tolist() for col in columns]):
+                f.write(','.join(['{}'.format(v) for v in vals])+'\n')
+        if not header and fields:
+            f.write(','.join(fields)+'\n')
@@ -0,0 +1,92 @@
+'''
+Named derived variables and cuts evaluated at most once per event.
+'''
+from collections import OrderedDict
+
+
+class Node(object):
+    '''A named quantity of an EventGraph, called like a row function'''
+    __slots__ = ['graph','name']
+
+    def __init__(self,graph,name):
+        self.graph = graph
+        self.name = name
+
+    def __call__(self,row):
+        return self.graph.get(self.name,row)
+
+    def __repr__(self):
+        return 'Node({0})'.format(self.name)
+
+
+class EventGraph(object):
+    '''
+    Named derived variables and cuts shared between selections and histograms.
+
+    Each quantity is a function of the row and is evaluated at most once per
+    event, the first time it is requested. Functions may request other
+    quantities through their nodes. The cache is cleared by reset, which
+    should be called before each event, and whenever a different row object
+    is passed. Quantities must only depend on the row (not on weight shifts).
+    '''
+
+    def __init__(self):
+        self.funcs = OrderedDict()
+        self.kinds = {}
+        self.nodes = {}
+        self.values = {}
+        self.row = None
+        self.events = 0
+        self.evaluations = {}
+        self.requests = {}
+
+    def __contains__(self,name):
+        return name in self.funcs
+
+    def __getitem__(self,name):
+        return self.nodes[name]
+
+    def define(self,name,func,kind='variable'):
+        '''Add a derived variable, returns its node'''
+        if name in self.funcs: raise ValueError('{0} is already defined'.format(name))
+        self.funcs[name] = func
+        self.kinds[name] = kind
+        self.nodes[name] = Node(self,name)
+        self.evaluations[name] = 0
+        self.requests[name] = 0
+        return self.nodes[name]
+
+    def cut(self,name,func):
+        '''Add a named cut, returns its node'''
+        return self.define(name,func,kind='cut')
+
+    def allOf(self,names):
+        '''A function passing if all of the named cuts pass'''
+        names = list(names)
+        return lambda row: all(self.get(name,row) for name in names)
+
+    def reset(self):
+        '''Clear the values of the previous event'''
+        self.row = None
+
+    def get(self,name,row):
+        if row is not self.row:
+            self.events += 1
+            self.values = {}
+            self.row = row
+        self.requests[name] += 1
+        if name not in self.values:
+            self.evaluations[name] += 1
+            self.values[name] = self.funcs[name](row)
+        return self.values[name]
+
+    def report(self):
+        '''Lines summarizing how often each quantity was requested and evaluated'''
+        lines = ['{0:40} {1:8} {2:>12} {3:>12} {4:>8}'.format('Name','Kind','Requested','Evaluated','Saved')]
+        for name in self.funcs:
+            requested = self.requests[name]
+            evaluated = self.evaluations[name]
+            saved = 1.-float(evaluated)/requested if requested else 0.
+            lines += ['{0:40} {1:8} {2:12d} {3:12d} {4:7.1f}%'.format(name,self.kinds[name],requested,evaluated,100*saved)]
+        lines += ['{0} events'.format(self.events)]
+        return lines
@@ -0,0 +1,88 @@
+'''
+A shared pool of open TFiles for reading.
+'''
+import os
+import logging
+from collections import OrderedDict
+
+import ROOT
+
+
+class FilePool(object):
+    '''
+    Least recently used pool of TFiles opened for reading, keyed by path.
+
+    At most maxSize files are open at once, the least recently used file is
+    closed to open a new one. A file is reopened if it was modified on disk
+    since it was opened. Release a file before it is opened for update.
+    '''
+
+    def __init__(self,maxSize=64):
+        self.maxSize = maxSize
+        self.files = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.files)
+
+    def __contains__(self,filename):
+        return filename in self.files
+
+    def get(self,filename):
+        '''Get an open TFile, None if it can not be opened'''
+        mtime = os.path.getmtime(filename) if os.path.isfile(filename) else None
+        if filename in self.files:
+            tfile, openTime = self.files.pop(filename)
+            if openTime==mtime:
+                self.hits += 1
+                self.files[filename] = (tfile, openTime)
+                return tfile
+            tfile.Close()
+        self.misses += 1
+        # keep the current directory, objects created later must not belong to a pooled file
+        context = ROOT.TDirectory.TContext()
+        tfile = ROOT.TFile.Open(filename,'read')
+        del context
+        if not tfile or tfile.IsZombie():
+            logging.warning('Failed to open {0}'.format(filename))
+            return None
+        self.files[filename] = (tfile, mtime)
+        self.shrink()
+        return tfile
+
+    def release(self,filename):
+        '''Close a file if it is in the pool'''
+        if filename in self.files:
+            tfile, openTime = self.files.pop(filename)
+            tfile.Close()
+
+    def resize(self,maxSize):
+        self.maxSize = maxSize
+        self.shrink()
+
+    def shrink(self):
+        while len(self.files)>max(self.maxSize,1):
+            filename, (tfile, openTime) = self.files.popitem(last=False)
+            tfile.Close()
+            self.evictions += 1
+
+    def clear(self):
+        while self.files:
+            filename, (tfile, openTime) = self.files.popitem(last=False)
+            tfile.Close()
+
+    def stats(self):
+        '''Hits, misses and evictions since the pool was created'''
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'open': len(self.files), 'maxSize': self.maxSize}
+
+
+_filePool = None
+
+def getFilePool(maxSize=None):
+    '''The pool shared by all readers, maxSize changes its size'''
+    global _filePool
+    if _filePool is None: _filePool = FilePool() if maxSize is None else FilePool(maxSize)
+    elif maxSize is not None: _filePool.resize(maxSize)
+    return _filePool
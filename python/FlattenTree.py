@@ -61,6 +61,7 @@ class FlattenTree(object):
         njobs = int(kwargs.pop('njobs',1))
         job = int(kwargs.pop('job',0))
         multi = kwargs.pop('multi',False)
+        batch = kwargs.pop('batch',False)
         if hasProgress and multi:
             pbar = kwargs.pop('progressbar',ProgressBar(widgets=['{0}: '.format(self.sample),' ',SimpleProgress(),' histograms ',Percentage(),' ',Bar(),' ',ETA()]))
         else:
@@ -78,11 +79,16 @@ class FlattenTree(object):
         endjob = int((job+1)*nperjob)
         allJobs = sorted(allJobs)[startjob:endjob]
         # flatten
-        if hasProgress and multi:
+        if batch:
+            logging.info('Processing {0} {1}: {2} plots in one pass.'.format(self.analysis,self.sample,len(allJobs)))
+            self.ntuple.flattenAll(allJobs)
+        elif hasProgress and multi:
             for args in pbar(allJobs):
-                self.ntuple.flatten(*args)
+                self.ntuple.flatten(*args,commit=False)
+            self.ntuple.commit()
         else:
             n = len(allJobs)
             for i,args in enumerate(allJobs):
                 logging.info('Processing {3} {4} plot {0} of {1}: {2}.'.format(i+1,n,' '.join(args),self.analysis,self.sample))
-                self.ntuple.flatten(*args)
+                self.ntuple.flatten(*args,commit=False)
+            self.ntuple.commit()
@@ -0,0 +1,105 @@
+'''
+An on-disk cache of histograms addressed by a hash of what produced them.
+'''
+import os
+import glob
+import logging
+
+import ROOT
+
+from DevTools.Utilities.utilities import python_mkdir
+
+
+class HistCache(object):
+    '''
+    Histograms stored one per file as <directory>/<key[:2]>/<key>.root.
+
+    A histogram is written to a temporary file and renamed, so concurrent
+    readers only see complete entries. Reading an entry touches its file.
+    When the cache grows beyond maxSize bytes the least recently used
+    entries are removed.
+    '''
+
+    def __init__(self,directory,maxSize=1024**3):
+        self.directory = directory
+        self.maxSize = maxSize
+        self.size = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def path(self,key):
+        return os.path.join(self.directory,key[:2],'{0}.root'.format(key))
+
+    def entries(self):
+        '''The (mtime, size, path) of every entry'''
+        result = []
+        for path in glob.glob(os.path.join(self.directory,'*','*.root')):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            result += [(stat.st_mtime,stat.st_size,path)]
+        return result
+
+    def get(self,key,name):
+        '''Get a histogram from the cache, named name, None if it is not cached'''
+        path = self.path(key)
+        if not os.path.isfile(path):
+            self.misses += 1
+            return None
+        context = ROOT.TDirectory.TContext()
+        tfile = ROOT.TFile.Open(path)
+        hist = tfile.Get('hist') if tfile and not tfile.IsZombie() else None
+        if hist:
+            hist.SetDirectory(0)
+            ROOT.SetOwnership(hist,True)
+        if tfile: tfile.Close()
+        del context
+        if not hist:
+            logging.warning('Removing unreadable cache entry {0}'.format(path))
+            os.remove(path)
+            self.misses += 1
+            return None
+        hist.SetName(name)
+        os.utime(path,None)
+        self.hits += 1
+        return hist
+
+    def put(self,key,hist):
+        '''Store a histogram'''
+        path = self.path(key)
+        python_mkdir(os.path.dirname(path))
+        tmpname = '{0}.tmp{1}'.format(path,os.getpid())
+        context = ROOT.TDirectory.TContext()
+        tfile = ROOT.TFile(tmpname,'recreate')
+        hist.Write('hist')
+        tfile.Close()
+        del context
+        os.rename(tmpname,path)
+        if self.size is None:
+            self.size = sum([size for mtime,size,p in self.entries()])
+        else:
+            self.size += os.path.getsize(path)
+        if self.size>self.maxSize: self.evict()
+
+    def evict(self):
+        '''Remove the least recently used entries until the cache fits in maxSize'''
+        entries = sorted(self.entries())
+        self.size = sum([size for mtime,size,path in entries])
+        for mtime, size, path in entries:
+            if self.size<=self.maxSize: break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+            self.evictions += 1
+
+    def clear(self):
+        for mtime, size, path in self.entries():
+            os.remove(path)
+        self.size = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': self.size, 'maxSize': self.maxSize}
@@ -0,0 +1,91 @@
+'''
+Histograms booked by name and created when first used.
+'''
+import numbers
+from array import array
+
+import ROOT
+
+
+def bookHistogram(histName,params):
+    '''Create a histogram from the binning of a histParams entry'''
+    xbins = params.get('xBinning',[])
+    if 'yBinning' in params:
+        ybins = params['yBinning']
+        if isinstance(xbins,array) and isinstance(ybins,array): # variable width array
+            hist = ROOT.TH2D(histName,histName,len(xbins)-1,xbins,len(ybins)-1,ybins)
+        elif len(xbins)==3 and len(ybins)==3 and all([isinstance(x,numbers.Number) for x in xbins]) and all([isinstance(x,numbers.Number) for x in ybins]): # n, low, high
+            hist = ROOT.TH2D(histName,histName,xbins[0],xbins[1],xbins[2],ybins[0],ybins[1],ybins[2])
+        elif len(xbins)>0 and len(ybins)>0:
+            hist = ROOT.TH2D(histName,histName,len(xbins),0,len(xbins),len(ybins),0,len(ybins))
+            for i,label in enumerate(xbins):
+                hist.GetXaxis().SetBinLabel(i+1,str(label))
+            for i,label in enumerate(ybins):
+                hist.GetYaxis().SetBinLabel(i+1,str(label))
+        else:
+            hist = ROOT.TH2D()
+            hist.SetName(histName)
+            hist.SetTitle(histName)
+    else:
+        if isinstance(xbins,array): # variable width array
+            hist = ROOT.TH1D(histName,histName,len(xbins)-1,xbins)
+        elif len(xbins)==3 and all([isinstance(x,numbers.Number) for x in xbins]): # n, low, high
+            hist = ROOT.TH1D(histName,histName,xbins[0],xbins[1],xbins[2])
+        elif len(xbins)>0:
+            hist = ROOT.TH1D(histName,histName,len(xbins),0,len(xbins))
+            for i,label in enumerate(xbins):
+                hist.GetXaxis().SetBinLabel(i+1,label)
+        else:
+            hist = ROOT.TH1D()
+            hist.SetName(histName)
+            hist.SetTitle(histName)
+    hist.Sumw2()
+    # histograms may be created while an input file is the current directory
+    hist.SetDirectory(0)
+    return hist
+
+
+class HistogramRegistry(object):
+    '''
+    A dictionary of histograms by name.
+
+    Histograms are booked with their histParams entry and only created when
+    first accessed. Iteration, len, and membership cover all booked
+    histograms, created or not. Use placeholder to get an empty copy of a
+    histogram that was never used without keeping it in the registry.
+    With lazy=False every histogram is created when booked.
+    '''
+
+    def __init__(self,lazy=True):
+        self.lazy = lazy
+        self.params = {}
+        self.hists = {}
+
+    def book(self,histName,params):
+        self.params[histName] = params
+        if not self.lazy: self.hists[histName] = bookHistogram(histName,params)
+
+    def __getitem__(self,histName):
+        if histName not in self.hists:
+            self.hists[histName] = bookHistogram(histName,self.params[histName])
+        return self.hists[histName]
+
+    def __contains__(self,histName):
+        return histName in self.params
+
+    def __iter__(self):
+        return iter(self.params)
+
+    def __len__(self):
+        return len(self.params)
+
+    def isCreated(self,histName):
+        return histName in self.hists
+
+    def nCreated(self):
+        return len(self.hists)
+
+    def placeholder(self,histName):
+        '''The histogram if it was created, otherwise a new empty one'''
+        if histName in self.hists: return self.hists[histName]
+        return bookHistogram(histName,self.params[histName])
@@ -14,6 +14,7 @@ from NtupleFlattener import NtupleFlattener
 from DevTools.Utilities.utilities import prod, ZMASS
 from DevTools.Plotter.higgsUtilities import *
 from DevTools.Analyzer.BTagScales import BTagScales
+from DevTools.Plotter.EventGraph import EventGraph
 
 logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
 
@@ -90,13 +91,18 @@ class Hpp3lFlattener(NtupleFlattener):
         #if self.zveto: self.selectionMap['zveto'] = lambda row: all([self.zvetoCutMap[cut](row) for cut in self.zvetoCutMap])
 
         # sample signal plot
-        self.cutRegions = {}
         masses = [200,300,400,500,600,700,800,900,1000,1100,1200,1300,1400,1500] if self.limitOnly else [self.mass]
+        # the cuts of all masses are placed at once per event, each mass tests its index
+        self.graph = EventGraph()
+        self.massSelection = MassSelection('Hpp3l',masses)
+        passing = self.graph.define('massSelection',self.massSelection.evaluate)
+        nMinusOne = {}
+        for nTaus in range(3):
+            nMinusOne[nTaus] = self.graph.define('massSelection/hpp{0}/nMinusOne'.format(nTaus),lambda row, nTaus=nTaus: intersectRanges(*[passing(row)[nTaus][v] for v in ['st','zveto','met','dr']]))
         for mass in masses:
-            self.cutRegions[mass] = getSelectionMap('Hpp3l',mass)
-            self.selectionMap['nMinusOne/massWindow/{0}/hpp0'.format(mass)] = lambda row: all([self.cutRegions[mass][0][v](row) for v in ['st','zveto','met','dr']])
-            self.selectionMap['nMinusOne/massWindow/{0}/hpp1'.format(mass)] = lambda row: all([self.cutRegions[mass][1][v](row) for v in ['st','zveto','met','dr']])
-            self.selectionMap['nMinusOne/massWindow/{0}/hpp2'.format(mass)] = lambda row: all([self.cutRegions[mass][2][v](row) for v in ['st','zveto','met','dr']])
+            i = self.massSelection.index[mass]
+            for nTaus in range(3):
+                self.selectionMap['nMinusOne/massWindow/{0}/hpp{1}'.format(mass,nTaus)] = lambda row, i=i, nTaus=nTaus: nMinusOne[nTaus](row)[0]<=i<nMinusOne[nTaus](row)[1]
         
         # tight loose ids to test fakerates
         #loose = '{}loose'.format('new' if self.new else 'old')
@@ -41,6 +41,14 @@ class Hpp3lSkimmer(NtupleSkimmer):
         self.masses = [200,300,400,500,600,700,800,900,1000,1100,1200,1300,1400,1500]
         if self.isSignal:
             self.masses = [mass for mass in self.masses if 'M-{0}'.format(mass) in self.sample]
+        self.massSelection = MassSelection('Hpp3l',self.masses)
+
+        # optimization ranges
+        self.addScan('st',[x*20 for x in range(100)])
+        self.addScan('zveto',[x*5 for x in range(25)])
+        self.addScan('dr',[1.5+x*0.1 for x in range(50)],above=False)
+        self.addScan('met',[x*5 for x in range(40)])
+        self.addJointScan('joint',['st','zveto','dr','met'])
 
         # alternative fakerates
         self.fakekey = '{num}_{denom}'
@@ -300,15 +308,9 @@ class Hpp3lSkimmer(NtupleSkimmer):
             'hpp': row.hpp_mass,
             'met': row.met_pt,
         }
-        cutRegions = {}
-        for mass in self.masses:
-            cutRegions[mass] = getSelectionMap('Hpp3l',mass)
-
-        # optimization ranges
-        stRange = [x*20 for x in range(100)]
-        zvetoRange = [x*5 for x in range(25)]
-        drRange = [1.5+x*0.1 for x in range(50)]
-        metRange = [x*5 for x in range(40)]
+        # place the event in the st thresholds and mass windows of all masses at once
+        passing = self.massSelection.evaluate(row)
+        masses = self.massSelection.masses
 
         # increment counts
         if default:
@@ -317,21 +319,20 @@ class Hpp3lSkimmer(NtupleSkimmer):
             self.increment(fakeChan+'_regular',w,recoChan,genChan)
 
             for nTaus in range(3):
-                for mass in self.masses:
-                    name = '{0}/hpp{1}'.format(mass,nTaus)
-                    sides = []
-                    windows = []
-                    sides += [cutRegions[mass][nTaus]['st'](row)]
-                    #sides += [cutRegions[mass][nTaus]['zveto'](row)]
-                    sides += [cutRegions[mass][nTaus]['met'](row)]
-                    sides += [cutRegions[mass][nTaus]['dr'](row)]
-                    windows += [cutRegions[mass][nTaus]['mass'](row)]
-                    massWindowOnly = all(windows)
-                    sideband = not all(sides) and not all(windows)
-                    massWindow = not all(sides) and all(windows)
-                    allSideband = all(sides) and not all(windows)
-                    allMassWindow = all(sides) and all(windows)
-                    if not self.optimize:
+                cuts = passing[nTaus]
+                # the range of the masses passing the side cuts and the mass window
+                #sides = intersectRanges(cuts['st'],cuts['zveto'],cuts['met'],cuts['dr'])
+                sides = intersectRanges(cuts['st'],cuts['met'],cuts['dr'])
+                windows = cuts['mass']
+                if not self.optimize:
+                    for i, mass in enumerate(masses):
+                        name = '{0}/hpp{1}'.format(mass,nTaus)
+                        allSides = sides[0]<=i<sides[1]
+                        allWindows = windows[0]<=i<windows[1]
+                        sideband = not allSides and not allWindows
+                        massWindow = not allSides and allWindows
+                        allSideband = allSides and not allWindows
+                        allMassWindow = allSides and allWindows
                         if sideband:
                             if all(passID): self.increment('new/sideband/'+name,w,recoChan,genChan)
                             if isData or genCut: self.increment(fakeChan+'/new/sideband/'+name,wf,recoChan,genChan)
@@ -344,45 +345,32 @@ class Hpp3lSkimmer(NtupleSkimmer):
                         if allMassWindow:
                             if all(passID): self.increment('new/allMassWindow/'+name,w,recoChan,genChan)
                             if isData or genCut: self.increment(fakeChan+'/new/allMassWindow/'+name,wf,recoChan,genChan)
-                    # run the grid of values
-                    if self.optimize:
-                        if not massWindowOnly: continue
-                        nMinusOneSt = all([cutRegions[mass][nTaus]['zveto'](row), cutRegions[mass][nTaus]['dr'](row), cutRegions[mass][nTaus]['met'](row), cutRegions[mass][nTaus]['mass'](row)])
-                        nMinusOneZveto = all([cutRegions[mass][nTaus]['st'](row), cutRegions[mass][nTaus]['dr'](row), cutRegions[mass][nTaus]['met'](row), cutRegions[mass][nTaus]['mass'](row)])
-                        nMinusOneDR = all([cutRegions[mass][nTaus]['zveto'](row), cutRegions[mass][nTaus]['st'](row), cutRegions[mass][nTaus]['met'](row), cutRegions[mass][nTaus]['mass'](row)])
-                        nMinusOneMet = all([cutRegions[mass][nTaus]['zveto'](row), cutRegions[mass][nTaus]['dr'](row), cutRegions[mass][nTaus]['st'](row), cutRegions[mass][nTaus]['mass'](row)])
+                # run the grid of values
+                if self.optimize:
+                    nMinusOneSt = intersectRanges(cuts['zveto'],cuts['dr'],cuts['met'],windows)
+                    nMinusOneZveto = intersectRanges(cuts['st'],cuts['dr'],cuts['met'],windows)
+                    nMinusOneDR = intersectRanges(cuts['zveto'],cuts['st'],cuts['met'],windows)
+                    nMinusOneMet = intersectRanges(cuts['zveto'],cuts['dr'],cuts['st'],windows)
+                    # only the masses passing the mass window
+                    for i in xrange(*windows):
+                        name = '{0}/hpp{1}'.format(masses[i],nTaus)
                         # 1D no cuts
-                        if self.var=='st':
-                            for stCutVal in stRange:
-                                if v['st']>stCutVal and nMinusOneSt:
-                                    if all(passID): self.increment('optimize/st/{0}/{1}'.format(stCutVal,name),w,recoChan,genChan)
-                                    if isData or genCut: self.increment(fakeChan+'/optimize/st/{0}/{1}'.format(stCutVal,name),wf,recoChan,genChan)
-                        if self.var=='zveto':
-                            for zvetoCutVal in zvetoRange:
-                                if v['zdiff']>zvetoCutVal and nMinusOneZveto:
-                                    if all(passID): self.increment('optimize/zveto/{0}/{1}'.format(zvetoCutVal,name),w,recoChan,genChan)
-                                    if isData or genCut: self.increment(fakeChan+'/optimize/zveto/{0}/{1}'.format(zvetoCutVal,name),wf,recoChan,genChan)
-                        if self.var=='dr':
-                            for drCutVal in drRange:
-                                if v['dr']<drCutVal and nMinusOneDR:
-                                    if all(passID): self.increment('optimize/dr/{0}/{1}'.format(drCutVal,name),w,recoChan,genChan)
-                                    if isData or genCut: self.increment(fakeChan+'/optimize/dr/{0}/{1}'.format(drCutVal,name),wf,recoChan,genChan)
-                        if self.var=='met':
-                            for metCutVal in metRange:
-                                if v['met']>metCutVal and nMinusOneMet:
-                                    if all(passID): self.increment('optimize/met/{0}/{1}'.format(metCutVal,name),w,recoChan,genChan)
-                                    if isData or genCut: self.increment(fakeChan+'/optimize/met/{0}/{1}'.format(metCutVal,name),wf,recoChan,genChan)
+                        if self.var=='st' and nMinusOneSt[0]<=i<nMinusOneSt[1]:
+                            if all(passID): self.incrementScan('st','optimize/st/{cut}/'+name,v['st'],w,recoChan,genChan)
+                            if isData or genCut: self.incrementScan('st',fakeChan+'/optimize/st/{cut}/'+name,v['st'],wf,recoChan,genChan)
+                        if self.var=='zveto' and nMinusOneZveto[0]<=i<nMinusOneZveto[1]:
+                            if all(passID): self.incrementScan('zveto','optimize/zveto/{cut}/'+name,v['zdiff'],w,recoChan,genChan)
+                            if isData or genCut: self.incrementScan('zveto',fakeChan+'/optimize/zveto/{cut}/'+name,v['zdiff'],wf,recoChan,genChan)
+                        if self.var=='dr' and nMinusOneDR[0]<=i<nMinusOneDR[1]:
+                            if all(passID): self.incrementScan('dr','optimize/dr/{cut}/'+name,v['dr'],w,recoChan,genChan)
+                            if isData or genCut: self.incrementScan('dr',fakeChan+'/optimize/dr/{cut}/'+name,v['dr'],wf,recoChan,genChan)
+                        if self.var=='met' and nMinusOneMet[0]<=i<nMinusOneMet[1]:
+                            if all(passID): self.incrementScan('met','optimize/met/{cut}/'+name,v['met'],w,recoChan,genChan)
+                            if isData or genCut: self.incrementScan('met',fakeChan+'/optimize/met/{cut}/'+name,v['met'],wf,recoChan,genChan)
                         # nD
-                        #for stCutVal in stRange:
-                        #    if v['st']<stCutVal: continue
-                        #    for zvetoCutVal in zvetoRange:
-                        #        if v['zdiff']<zvetoCutVal: continue
-                        #        for drCutVal in drRange:
-                        #            if v['dr']>drCutVal: continue
-                        #            for metCutVal in metRange:
-                        #                if v['met']<metCutVal: continue
-                        #                if all(passID): self.increment('optimize/st{0}/zveto{1}/dr{2}/met{3}/{4}'.format(stCutVal,zvetoCutVal,drCutVal,metCutVal,name),w,recoChan,genChan)
-                        #                if isData or genCut: self.increment(fakeChan+'optimize/st{0}/zveto{1}/dr{2}/met{3}/{4}'.format(stCutVal,zvetoCutVal,drCutVal,metCutVal,name),wf,recoChan,genChan)
+                        if self.var=='joint':
+                            if all(passID): self.incrementJointScan('joint','optimize/joint/'+name,[v['st'],v['zdiff'],v['dr'],v['met']],w,recoChan,genChan)
+                            if isData or genCut: self.incrementJointScan('joint',fakeChan+'/optimize/joint/'+name,[v['st'],v['zdiff'],v['dr'],v['met']],wf,recoChan,genChan)
 
 
         if lowmass:
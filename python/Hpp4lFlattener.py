@@ -13,6 +13,7 @@ ROOT.PyConfig.IgnoreCommandLineOptions = True
 from NtupleFlattener import NtupleFlattener
 from DevTools.Utilities.utilities import prod, ZMASS
 from DevTools.Plotter.higgsUtilities import *
+from DevTools.Plotter.EventGraph import EventGraph
 from DevTools.Analyzer.BTagScales import BTagScales
 
 logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
@@ -59,19 +60,25 @@ class Hpp4lFlattener(NtupleFlattener):
                 self.genChannels = gen['PP']
             elif 'HPlusPlusHMinus' in sample:
                 self.genChannels = gen['AP']
+        # derived variables and cuts shared by the selections and histograms
+        self.graph = EventGraph()
+        st = self.graph.define('st', lambda row: row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt)
+        looseId = self.graph.cut('looseId', lambda row: all([getattr(row,'{0}_passLoose{1}'.format(l,'New' if self.new else ''))>0.5 for l in self.leps]))
+        zVeto = self.graph.cut('zVeto', lambda row: abs(getattr(row,'z_mass')-ZMASS)>10)
+        hppVeto = self.graph.cut('hppVeto', lambda row: (row.hpp_mass<100 or row.hmm_mass<100))
         self.baseCutMap = {
-            'looseId'  : lambda row: all([getattr(row,'{0}_passLoose{1}'.format(l,'New' if self.new else ''))>0.5 for l in self.leps]),
+            'looseId'  : looseId,
             #'bjetveto' : lambda row: row.numBjetsTight30==0,
             #'bjetveto' : lambda row: all([getattr(row,'{0}jet_passCSVv2M'.format(l))<0.5 for l in self.leps]),
         }
-        if self.zveto: self.baseCutMap['zVeto'] = lambda row: abs(getattr(row,'z_mass')-ZMASS)>10
+        if self.zveto: self.baseCutMap['zVeto'] = zVeto
         self.lowmassCutMap = {
-            'hppVeto'  : lambda row: (row.hpp_mass<100 or row.hmm_mass<100),
-            'looseId'  : lambda row: all([getattr(row,'{0}_passLoose{1}'.format(l,'New' if self.new else ''))>0.5 for l in self.leps]),
+            'hppVeto'  : hppVeto,
+            'looseId'  : looseId,
             #'bjetveto' : lambda row: row.numBjetsTight30==0,
             #'bjetveto' : lambda row: all([getattr(row,'{0}jet_passCSVv2M'.format(l))<0.5 for l in self.leps]),
         }
-        if self.zveto: self.lowmassCutMap['zVeto'] = lambda row: abs(getattr(row,'z_mass')-ZMASS)>10
+        if self.zveto: self.lowmassCutMap['zVeto'] = zVeto
         #self.zvetoCutMap = {
         #    'looseId'  : lambda row: all([getattr(row,'{0}_passLoose{1}'.format(l,'New' if self.new else ''))>0.5 for l in self.leps]),
         #    'zVeto'    : lambda row: abs(getattr(row,'z_mass')-ZMASS)>10,
@@ -86,17 +93,23 @@ class Hpp4lFlattener(NtupleFlattener):
         # sample signal plot
         self.cutRegions = {}
         masses = [200,300,400,500,600,700,800,900,1000,1100,1200,1300,1400,1500] if self.limitOnly else [self.mass]
+        # the cuts of all masses are placed at once per event
+        self.massSelection = MassSelection('Hpp4l',masses,st=st)
+        passing = self.graph.define('massSelection',self.massSelection.evaluate)
         for mass in masses:
-            self.cutRegions[mass] = getSelectionMap('Hpp4l',mass)
-            self.selectionMap['nMinusOne/massWindow/{0}/hpp0hmm0'.format(mass)] = lambda row: all([self.cutRegions[mass][0][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][0][v](row) for v in ['st','zveto','drmm']])
+            self.cutRegions[mass] = self.graph.define('{0}/massSelection'.format(mass),lambda row, mass=mass: self.massSelection.select(passing(row),mass))
+            for region in self.massSelection.params:
+                for v in self.massSelection.cuts:
+                    self.graph.cut('{0}/{1}/{2}'.format(mass,region,v),lambda row, mass=mass, region=region, v=v: self.cutRegions[mass](row)[region][v])
+            self.selectionMap['nMinusOne/massWindow/{0}/hpp0hmm0'.format(mass)] = self.graph.allOf(['{0}/0/{1}'.format(mass,v) for v in ['st','zveto','drpp','drmm']])
             #self.selectionMap['nMinusOne/massWindow/{0}/hpp0hmm1'.format(mass)] = lambda row: all([self.cutRegions[mass][0][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][1][v](row) for v in ['st','zveto','drmm']])
             #self.selectionMap['nMinusOne/massWindow/{0}/hpp0hmm2'.format(mass)] = lambda row: all([self.cutRegions[mass][0][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][2][v](row) for v in ['st','zveto','drmm']])
             #self.selectionMap['nMinusOne/massWindow/{0}/hpp1hmm0'.format(mass)] = lambda row: all([self.cutRegions[mass][1][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][0][v](row) for v in ['st','zveto','drmm']])
-            self.selectionMap['nMinusOne/massWindow/{0}/hpp1hmm1'.format(mass)] = lambda row: all([self.cutRegions[mass][1][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][1][v](row) for v in ['st','zveto','drmm']])
+            self.selectionMap['nMinusOne/massWindow/{0}/hpp1hmm1'.format(mass)] = self.graph.allOf(['{0}/1/{1}'.format(mass,v) for v in ['st','zveto','drpp','drmm']])
             #self.selectionMap['nMinusOne/massWindow/{0}/hpp1hmm2'.format(mass)] = lambda row: all([self.cutRegions[mass][1][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][2][v](row) for v in ['st','zveto','drmm']])
             #self.selectionMap['nMinusOne/massWindow/{0}/hpp2hmm0'.format(mass)] = lambda row: all([self.cutRegions[mass][2][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][0][v](row) for v in ['st','zveto','drmm']])
             #self.selectionMap['nMinusOne/massWindow/{0}/hpp2hmm1'.format(mass)] = lambda row: all([self.cutRegions[mass][2][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][1][v](row) for v in ['st','zveto','drmm']])
-            self.selectionMap['nMinusOne/massWindow/{0}/hpp2hmm2'.format(mass)] = lambda row: all([self.cutRegions[mass][2][v](row) for v in ['st','zveto','drpp']]+[self.cutRegions[mass][2][v](row) for v in ['st','zveto','drmm']])
+            self.selectionMap['nMinusOne/massWindow/{0}/hpp2hmm2'.format(mass)] = self.graph.allOf(['{0}/2/{1}'.format(mass,v) for v in ['st','zveto','drpp','drmm']])
 
 
 
@@ -145,7 +158,7 @@ class Hpp4lFlattener(NtupleFlattener):
             # event
             'mass'                        : {'x': lambda row: getattr(row,'4l_mass'),             'xBinning': [200, 0, 2000],          },
             #'hppMassMinusHmmMass'         : {'x': lambda row: row.hpp_mass-row.hmm_mass,          'xBinning': [1600, -800, 800],       },
-            'st'                          : {'x': lambda row: row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt, 'xBinning': [2000, 0, 2000],},
+            'st'                          : {'x': st,                                             'xBinning': [2000, 0, 2000],         },
             'nJets'                       : {'x': lambda row: row.numJetsTight30,                 'xBinning': [11, -0.5, 10.5],        },
             'nBJets'                      : {'x': lambda row: row.numBjetsTight30,                'xBinning': [11, -0.5, 10.5],        },
             # for validating datadriven
@@ -159,7 +172,7 @@ class Hpp4lFlattener(NtupleFlattener):
             #'hmm2Eta'                     : {'x': lambda row: row.hmm2_eta,                       'xBinning': array('d', [-2.5,-1.479,0,1.479,2.5]), },
             # 2D
             'hppMass_hmmMass'             : {'x': lambda row: row.hpp_mass, 'y': lambda row: row.hmm_mass,                                    'xBinning': [100, 0, 2000], 'yBinning': [50, 0, 2000],},
-            'hppMass_st'                  : {'x': lambda row: row.hpp_mass, 'y': lambda row: row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt, 'xBinning': [100, 0, 2000], 'yBinning': [50, 0, 2000],},
+            'hppMass_st'                  : {'x': lambda row: row.hpp_mass, 'y': st,                                                          'xBinning': [100, 0, 2000], 'yBinning': [50, 0, 2000],},
             # for limits
             'hppMassForLimits'            : {'x': lambda row: row.hpp_mass,                       'xBinning': [160, 0, 1600],         'doGen': True,},
         }
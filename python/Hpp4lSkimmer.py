@@ -43,6 +43,13 @@ class Hpp4lSkimmer(NtupleSkimmer):
         self.masses = [200,300,400,500,600,700,800,900,1000,1100,1200,1300,1400,1500]
         if self.isSignal:
             self.masses = [mass for mass in self.masses if 'M-{0}'.format(mass) in self.sample]
+        self.massSelection = MassSelection('Hpp4l',self.masses)
+
+        # optimization ranges
+        self.addScan('st',[x*20 for x in range(100)])
+        self.addScan('zveto',[x*5 for x in range(20)])
+        self.addScan('dr',[1.5+x*0.1 for x in range(50)],above=False)
+        self.addJointScan('joint',['st','zveto','dr'])
 
         # alternative fakerates
         self.fakekey = '{num}_{denom}'
@@ -295,14 +302,9 @@ class Hpp4lSkimmer(NtupleSkimmer):
             'hpp': row.hpp_mass,
             'hmm': row.hmm_mass,
         }
-        cutRegions = {}
-        for mass in self.masses:
-            cutRegions[mass] = getSelectionMap('Hpp4l',mass)
-
-        # optimization ranges
-        stRange = [x*20 for x in range(100)]
-        zvetoRange = [x*5 for x in range(20)]
-        drRange = [1.5+x*0.1 for x in range(50)]
+        # place the event in the st thresholds and mass windows of all masses at once
+        passing = self.massSelection.evaluate(row)
+        masses = self.massSelection.masses
 
         # increment counts
         if default:
@@ -313,22 +315,19 @@ class Hpp4lSkimmer(NtupleSkimmer):
             for pTaus in range(3):
                 for mTaus in range(3):
                     nTaus = max(pTaus,mTaus)
-                    for mass in self.masses:
-                        name = '{0}/hpp{1}hmm{2}'.format(mass,pTaus,mTaus)
-                        sides = []
-                        windows = []
-                        sides += [cutRegions[mass][nTaus]['st'](row)]
-                        #if nTaus>0: sides += [cutRegions[mass][nTaus]['zveto'](row)]
-                        sides += [cutRegions[mass][pTaus]['drpp'](row)]
-                        sides += [cutRegions[mass][mTaus]['drmm'](row)]
-                        windows += [cutRegions[mass][pTaus]['hpp'](row)]
-                        windows += [cutRegions[mass][mTaus]['hmm'](row)]
-                        massWindowOnly = all(windows)
-                        sideband = not all(sides) and not all(windows)
-                        massWindow = not all(sides) and all(windows)
-                        allSideband = all(sides) and not all(windows)
-                        allMassWindow = all(sides) and all(windows)
-                        if not self.optimize:
+                    # the range of the masses passing the side cuts and the mass windows
+                    #sides = intersectRanges(passing[nTaus]['st'],passing[nTaus]['zveto'],passing[pTaus]['drpp'],passing[mTaus]['drmm'])
+                    sides = intersectRanges(passing[nTaus]['st'],passing[pTaus]['drpp'],passing[mTaus]['drmm'])
+                    windows = intersectRanges(passing[pTaus]['hpp'],passing[mTaus]['hmm'])
+                    if not self.optimize:
+                        for i, mass in enumerate(masses):
+                            name = '{0}/hpp{1}hmm{2}'.format(mass,pTaus,mTaus)
+                            allSides = sides[0]<=i<sides[1]
+                            allWindows = windows[0]<=i<windows[1]
+                            sideband = not allSides and not allWindows
+                            massWindow = not allSides and allWindows
+                            allSideband = allSides and not allWindows
+                            allMassWindow = allSides and allWindows
                             if sideband:
                                 if all(passID): self.increment('new/sideband/'+name,w,recoChan,genChan)
                                 if isData or genCut: self.increment(fakeChan+'/new/sideband/'+name,wf,recoChan,genChan)
@@ -341,39 +340,31 @@ class Hpp4lSkimmer(NtupleSkimmer):
                             if allMassWindow:
                                 if all(passID): self.increment('new/allMassWindow/'+name,w,recoChan,genChan)
                                 if isData or genCut: self.increment(fakeChan+'/new/allMassWindow/'+name,wf,recoChan,genChan)
-                        # run the grid of values
-                        if self.optimize:
-                            # optimize only 0,0 1,1 or 2,2 taus
-                            if pTaus!=mTaus: continue
-                            if not massWindowOnly: continue
-                            # 1D no cuts
-                            nMinusOneSt = all([cutRegions[mass][nTaus]['zveto'](row), cutRegions[mass][pTaus]['drpp'](row), cutRegions[mass][mTaus]['drmm'](row), cutRegions[mass][pTaus]['hpp'](row), cutRegions[mass][mTaus]['hmm'](row)])
-                            nMinusOneZveto = all([cutRegions[mass][nTaus]['st'](row), cutRegions[mass][pTaus]['drpp'](row), cutRegions[mass][mTaus]['drmm'](row), cutRegions[mass][pTaus]['hpp'](row), cutRegions[mass][mTaus]['hmm'](row)])
-                            nMinusOneDR = all([cutRegions[mass][nTaus]['st'](row), cutRegions[mass][nTaus]['zveto'](row), cutRegions[mass][pTaus]['hpp'](row), cutRegions[mass][mTaus]['hmm'](row)])
-                            if self.var=='st':
-                                for stCutVal in stRange:
-                                    if v['st']>stCutVal and nMinusOneSt:
-                                        if all(passID): self.increment('optimize/st/{0}/{1}'.format(stCutVal,name),w,recoChan,genChan)
-                                        if isData or genCut: self.increment(fakeChan+'/optimize/st/{0}/{1}'.format(stCutVal,name),wf,recoChan,genChan)
-                            if self.var=='zveto':
-                                for zvetoCutVal in zvetoRange:
-                                    if v['zdiff']>zvetoCutVal and nMinusOneZveto:
-                                        if all(passID): self.increment('optimize/zveto/{0}/{1}'.format(zvetoCutVal,name),w,recoChan,genChan)
-                                        if isData or genCut: self.increment(fakeChan+'/optimize/zveto/{0}/{1}'.format(zvetoCutVal,name),wf,recoChan,genChan)
-                            if self.var=='dr':
-                                for drCutVal in drRange:
-                                    if v['drpp']<drCutVal and v['drmm']<drCutVal and nMinusOneDR:
-                                        if all(passID): self.increment('optimize/dr/{0}/{1}'.format(drCutVal,name),w,recoChan,genChan)
-                                        if isData or genCut: self.increment(fakeChan+'/optimize/dr/{0}/{1}'.format(drCutVal,name),wf,recoChan,genChan)
+                    # run the grid of values
+                    if self.optimize:
+                        # optimize only 0,0 1,1 or 2,2 taus
+                        if pTaus!=mTaus: continue
+                        # 1D no cuts
+                        nMinusOneSt = intersectRanges(passing[nTaus]['zveto'],passing[pTaus]['drpp'],passing[mTaus]['drmm'],windows)
+                        nMinusOneZveto = intersectRanges(passing[nTaus]['st'],passing[pTaus]['drpp'],passing[mTaus]['drmm'],windows)
+                        nMinusOneDR = intersectRanges(passing[nTaus]['st'],passing[nTaus]['zveto'],windows)
+                        drMax = max(v['drpp'],v['drmm'])
+                        # only the masses passing the mass windows
+                        for i in xrange(*windows):
+                            name = '{0}/hpp{1}hmm{2}'.format(masses[i],pTaus,mTaus)
+                            if self.var=='st' and nMinusOneSt[0]<=i<nMinusOneSt[1]:
+                                if all(passID): self.incrementScan('st','optimize/st/{cut}/'+name,v['st'],w,recoChan,genChan)
+                                if isData or genCut: self.incrementScan('st',fakeChan+'/optimize/st/{cut}/'+name,v['st'],wf,recoChan,genChan)
+                            if self.var=='zveto' and nMinusOneZveto[0]<=i<nMinusOneZveto[1]:
+                                if all(passID): self.incrementScan('zveto','optimize/zveto/{cut}/'+name,v['zdiff'],w,recoChan,genChan)
+                                if isData or genCut: self.incrementScan('zveto',fakeChan+'/optimize/zveto/{cut}/'+name,v['zdiff'],wf,recoChan,genChan)
+                            if self.var=='dr' and nMinusOneDR[0]<=i<nMinusOneDR[1]:
+                                if all(passID): self.incrementScan('dr','optimize/dr/{cut}/'+name,drMax,w,recoChan,genChan)
+                                if isData or genCut: self.incrementScan('dr',fakeChan+'/optimize/dr/{cut}/'+name,drMax,wf,recoChan,genChan)
                             # nD
-                            #for stCutVal in stRange:
-                            #    if v['st']<stCutVal: continue
-                            #    for zvetoCutVal in zvetoRange:
-                            #        if v['zdiff']<zvetoCutVal: continue
-                            #        for drCutVal in drRange:
-                            #            if v['drpp']>drCutVal or v['drmm']>drCutVal: continue
-                            #            if all(passID): self.increment('optimize/st{0}/zveto{1}/dr{2}/{3}'.format(stCutVal,zvetoCutVal,drCutVal,name),w,recoChan,genChan)
-                            #            if isData or genCut: self.increment(fakeChan+'optimize/st{0}/zveto{1}/dr{2}/{3}'.format(stCutVal,zvetoCutVal,drCutVal,name),wf,recoChan,genChan)
+                            if self.var=='joint':
+                                if all(passID): self.incrementJointScan('joint','optimize/joint/'+name,[v['st'],v['zdiff'],drMax],w,recoChan,genChan)
+                                if isData or genCut: self.incrementJointScan('joint',fakeChan+'/optimize/joint/'+name,[v['st'],v['zdiff'],drMax],wf,recoChan,genChan)
 
                     
 
@@ -0,0 +1,110 @@
+'''
+Joint cut scans over several variables, kept as sparse weighted histograms.
+'''
+import pickle
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+    hasNumpy = True
+except:
+    hasNumpy = False
+
+
+def getScanIndex(thresholds,above,value):
+    '''
+    The bin of a value between the thresholds of a scan.
+    Bin i+1 passes threshold i if above, bin i passes it if not.
+    '''
+    return bisect_left(thresholds,value) if above else bisect_right(thresholds,value)
+
+def cumulate(arr,axis,above):
+    '''Sum the bins passing each threshold along an axis'''
+    sl = [slice(None)]*arr.ndim
+    if above:
+        sl[axis] = slice(None,None,-1)
+        arr = np.cumsum(arr[tuple(sl)],axis=axis)[tuple(sl)]
+        sl[axis] = slice(1,None)
+    else:
+        arr = np.cumsum(arr,axis=axis)
+        sl[axis] = slice(None,-1)
+    return arr[tuple(sl)]
+
+
+class JointScan(object):
+    '''
+    A weighted histogram of the values of several scan variables.
+
+    The axes are (name, thresholds, above) and follow the binning of
+    NtupleSkimmer.addScan: a value passes a threshold if it is above it
+    (or below it if above is False). Only filled bins are stored, as
+    bin index tuple: [val, count, err2]. The counts passing every
+    combination of thresholds are given by passing.
+    '''
+
+    def __init__(self,axes):
+        self.axes = [(name,list(thresholds),above) for name,thresholds,above in axes]
+        self.bins = {}
+
+    def fill(self,values,val):
+        index = tuple([getScanIndex(thresholds,above,value) for (name,thresholds,above),value in zip(self.axes,values)])
+        if index not in self.bins:
+            self.bins[index] = [0.,0,0.]
+        b = self.bins[index]
+        b[0] += val
+        b[1] += 1
+        b[2] += val**2
+
+    def merge(self,bins):
+        '''Add the bins of another scan with the same axes'''
+        for index, (val,count,err2) in bins.iteritems():
+            if index not in self.bins:
+                self.bins[index] = [0.,0,0.]
+            b = self.bins[index]
+            b[0] += val
+            b[1] += count
+            b[2] += err2
+
+    def shape(self):
+        return tuple([len(thresholds) for name,thresholds,above in self.axes])
+
+    def passing(self):
+        '''
+        Arrays of the val and err2 passing each combination of thresholds,
+        indexed by the threshold index of each axis. Requires numpy.
+        '''
+        shape = tuple([len(thresholds)+1 for name,thresholds,above in self.axes])
+        vals = np.zeros(shape)
+        err2s = np.zeros(shape)
+        if self.bins:
+            indices = self.bins.keys()
+            content = np.array([self.bins[index] for index in indices],dtype=np.float64)
+            index = tuple(np.array(indices,dtype=np.int64).T)
+            vals[index] = content[:,0]
+            err2s[index] = content[:,2]
+        for axis, (name,thresholds,above) in enumerate(self.axes):
+            vals = cumulate(vals,axis,above)
+            err2s = cumulate(err2s,axis,above)
+        return vals, err2s
+
+    def thresholds(self,index):
+        '''The thresholds of a grid point as a dictionary'''
+        return dict([(name,thresholds[i]) for (name,thresholds,above),i in zip(self.axes,index)])
+
+
+def mergeJointScanFiles(filenames,outputFile):
+    '''Sum the joint scans written by several skims, reading one file at a time'''
+    merged = {}
+    for filename in filenames:
+        with open(filename,'rb') as f:
+            scans = pickle.load(f)
+        for scanName, scan in scans.iteritems():
+            if scanName not in merged: merged[scanName] = {'axes': scan['axes'], 'bins': {}}
+            bins = merged[scanName]['bins']
+            for name, b in scan['bins'].iteritems():
+                if name not in bins: bins[name] = JointScan(scan['axes'])
+                bins[name].merge(b)
+    for scanName in merged:
+        merged[scanName]['bins'] = dict([(name,scan.bins) for name,scan in merged[scanName]['bins'].iteritems()])
+    with open(outputFile,'wb') as f:
+        pickle.dump(merged,f,pickle.HIGHEST_PROTOCOL)
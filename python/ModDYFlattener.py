@@ -16,6 +16,7 @@ import ROOT
 ROOT.PyConfig.IgnoreCommandLineOptions = True
 
 from NtupleFlattener import NtupleFlattener
+from DevTools.Plotter.columnarUtilities import evaluate, allOf
 from DevTools.Utilities.utilities import prod, ZMASS
 from DevTools.Plotter.higgsUtilities import *
 from DevTools.Analyzer.utilities import deltaR, deltaPhi
@@ -38,7 +39,7 @@ class ModDYFlattener(NtupleFlattener):
         # setup properties
         self.leps = ['z1','z2']
         self.baseCutMap = {
-            'zWindow'    : lambda row: row.z_mass>60 and row.z_mass<120,
+            'zWindow'    : lambda row: (row.z_mass>60) & (row.z_mass<120),
             #'trigger'    : lambda row: row.z1_matches_IsoMu24 or row.z1_matches_IsoTkMu24,
             'turnon'     : lambda row: row.z1_pt>26,
             'z1iso'      : lambda row: row.z1_isolation<0.25,
@@ -48,7 +49,7 @@ class ModDYFlattener(NtupleFlattener):
 
         self.regionMap = {
             'high' : lambda row: row.z2_pt>20.,
-            'low'  : lambda row: row.z2_pt>3. and row.z2_pt<20.,
+            'low'  : lambda row: (row.z2_pt>3.) & (row.z2_pt<20.),
         }
 
         self.selectionMap = {}
@@ -231,6 +232,21 @@ class ModDYFlattener(NtupleFlattener):
                 for r in passRegion:
                     if passRegion[r]: self.fill(row,sel.replace('default',r),w)
 
+    def perChunkAction(self,chunk):
+        # weights are evaluated per entry, cuts on whole arrays
+        w = evaluate(self.getWeight,chunk)
+
+        passRegion = {}
+        for r in self.regionMap:
+            passRegion[r] = evaluate(self.regionMap[r],chunk)
+
+        cutMaps = {'default': self.baseCutMap, 'default/noiso': self.noisoMap}
+        for sel in self.selectionMap:
+            result = allOf([evaluate(cutMaps[sel][cut],chunk,key=cut) for cut in cutMaps[sel]])
+            self.fillChunk(chunk,sel,result,w)
+            for r in passRegion:
+                self.fillChunk(chunk,sel.replace('default',r),result & passRegion[r],w)
+
 
 def parse_command_line(argv):
     parser = argparse.ArgumentParser(description='Run Flattener')
@@ -238,6 +254,7 @@ def parse_command_line(argv):
     parser.add_argument('sample', type=str, default='DYJetsToLL_M-50_TuneCUETP8M1_13TeV-amcatnloFXFX-pythia8', nargs='?', help='Sample to flatten')
     parser.add_argument('shift', type=str, default='', nargs='?', help='Shift to apply to scale factors')
     parser.add_argument('--skipHists', action='store_true',help='Skip histograms, only do datasets')
+    parser.add_argument('--columnar', action='store_true',help='Process the tree in chunks of numpy arrays')
 
     return parser.parse_args(argv)
 
@@ -251,6 +268,7 @@ def main(argv=None):
         args.sample,
         shift=args.shift,
         skipHists=args.skipHists,
+        columnar=args.columnar,
     )
 
     flattener.flatten()
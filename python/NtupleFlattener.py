@@ -6,8 +6,10 @@ import glob
 import json
 import pickle
 import time
+import resource
+import shutil
+import tempfile
 from array import array
-import numbers
 from collections import OrderedDict
 
 sys.argv.append('-b')
@@ -18,7 +20,16 @@ ROOT.gROOT.SetBatch(ROOT.kTRUE)
 ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 
 from DevTools.Plotter.xsec import getXsec
-from DevTools.Plotter.utilities import getLumi, isData, hashFile, hashString, python_mkdir, getTreeName, getNtupleDirectory, getNewFlatHistograms
+from DevTools.Plotter.utilities import getLumi, isData, hashFile, hashString, python_mkdir, getTreeName, getNtupleDirectory, getNewFlatHistograms, getEntryRanges, runForked, getWeightShifts, getFlatShiftDirectory
+from DevTools.Plotter.columnarUtilities import hasColumnar, iterateChunks, evaluate
+from DevTools.Plotter.bufferUtilities import FillBufferPool, DatasetCollector
+from DevTools.Plotter.EventDump import EventDump, getEventDumpName
+from DevTools.Plotter.EventGraph import EventGraph
+from DevTools.Plotter.HistogramRegistry import HistogramRegistry
+from DevTools.Plotter.branchUtilities import getCodeHash, getStaticBranches, getTreeBranches, readBranchCache, writeBranchCache, probeBranches, pruneBranches, getDisabledBranches, PrunedRow
+if hasColumnar:
+    import numpy as np
+    from DevTools.Plotter.columnarUtilities import fillArrays
 
 try:
     from progressbar import ProgressBar, ETA, Percentage, Bar, SimpleProgress
@@ -46,6 +57,42 @@ class NtupleFlattener(object):
         self.outputFile = kwargs.pop('outputFile',getNewFlatHistograms(self.analysis,self.sample,shift=self.shift))
         if os.path.dirname(self.outputFile): python_mkdir(os.path.dirname(self.outputFile))
         self.treeName = kwargs.pop('treeName',getTreeName(self.analysis))
+        self.columnar = kwargs.pop('columnar',False)
+        self.chunkSize = kwargs.pop('chunkSize',100000)
+        self.branches = kwargs.pop('branches',None)
+        self.pruneBranches = kwargs.pop('pruneBranches',False)
+        # fail on reading a disabled branch, every branch read goes through python
+        self.validateBranches = kwargs.pop('validateBranches',False)
+        self.probeEntries = kwargs.pop('probeEntries',1000)
+        self.cacheSize = kwargs.pop('cacheSize',30*1024*1024)
+        self.probing = False
+        self.disabledBranches = frozenset()
+        self.prunedBranches = []
+        self.shards = kwargs.pop('shards',1)
+        self.bufferSize = kwargs.pop('bufferSize',1000)
+        self.maxBufferMemory = kwargs.pop('maxBufferMemory',100*1024*1024)
+        self.datasetBufferSize = kwargs.pop('datasetBufferSize',1000000)
+        self.textSuffix = ''
+        self.dumpChunkSize = kwargs.pop('dumpChunkSize',10000)
+        self.dumpCSV = kwargs.pop('dumpCSV',True)
+        self.eventDumps = {}
+        # derived variables and cuts shared within an event
+        if not hasattr(self,'graph'): self.graph = EventGraph()
+        # weight shifts filled in the same pass go to <shift>/ directories
+        self.doWeightShifts = kwargs.pop('weightShifts',False)
+        if not hasattr(self,'weightShifts'): self.weightShifts = getWeightShifts(self.analysis)
+        if self.isData:
+            # data only changes with the fake and prompt rates of the fake regions
+            dataShifts = getWeightShifts(self.analysis,data=True)
+            self.weightShifts = [shift for shift in self.weightShifts if shift in dataShifts]
+        if self.doWeightShifts and self.shift:
+            logging.warning('Weight shifts can only be filled with the nominal ntuple')
+            self.doWeightShifts = False
+        self.shiftDirectory = getFlatShiftDirectory(self.analysis,self.shift,sample=self.sample)
+        self.histPrefix = '{0}/'.format(self.shiftDirectory) if self.shiftDirectory else ''
+        if self.columnar and not hasColumnar:
+            logging.warning('root_numpy not available, columnar mode disabled')
+            self.columnar = False
         if hasProgress:
             self.pbar = kwargs.pop('progressbar',ProgressBar(widgets=['{0}: '.format(sample),' ',SimpleProgress(),' ',Percentage(),' ',Bar(),' ',ETA()]))
         else:
@@ -54,7 +101,8 @@ class NtupleFlattener(object):
         self.infile = 0
         self.tchain = 0
         self.initialized = False
-        self.hists = {}
+        self.lazyHists = kwargs.pop('lazyHists',True)
+        self.hists = HistogramRegistry(lazy=self.lazyHists)
         self.datasets = {}
 
     def __initializeNtuple(self):
@@ -86,6 +134,42 @@ class NtupleFlattener(object):
         self.initialized = True
         logging.debug('Initialized {0}: summedWeights = {1}; xsec = {2}; sampleLumi = {3}; intLumi = {4}'.format(self.sample,summedWeights,self.xsec,self.sampleLumi,self.intLumi))
 
+    def __pruneBranches(self):
+        '''
+        Only read the branches used by perRowAction and the histogram parameters.
+        The branches are found by tracing a probe sample and cached per analysis and code version.
+        '''
+        codeHash = getCodeHash(self)
+        key = '{0}:{1}'.format(self.sample,self.shift)
+        if self.doWeightShifts: key += ':weightShifts'
+        allBranches = getTreeBranches(self.sampleTree)
+        cached = readBranchCache(self.analysis,codeHash,key)
+        if cached:
+            branches = cached['branches']
+            bytesPerEntry = cached['bytesPerEntry']
+        else:
+            logging.info('{0}: Probing branches with {1} events'.format(self.sample,self.probeEntries))
+            funcs = []
+            for params in self.histParams.values()+self.datasetParams.values():
+                funcs += [params[v] for v in ['x','y','mcscale'] if v in params]
+            funcs += self.textFields.values()
+            self.probing = True
+            used, bytesPerEntry = probeBranches(self.sampleTree,self.processRow,self.probeEntries,funcs)
+            self.probing = False
+            branches = sorted((used | getStaticBranches(self)) & allBranches)
+            writeBranchCache(self.analysis,codeHash,key,{'branches':branches,'bytesPerEntry':bytesPerEntry})
+        branches = [b for b in branches if b in allBranches]
+        logging.info('{0}: Reading {1} of {2} branches'.format(self.sample,len(branches),len(allBranches)))
+        pruneBranches(self.sampleTree,branches,self.cacheSize)
+        if self.validateBranches: self.disabledBranches = getDisabledBranches(self.sampleTree)
+        if self.branches is None: self.branches = branches
+        self.prunedBranches = branches
+        self.unprunedBytesPerEntry = bytesPerEntry
+
+    def __reportBytesRead(self,bytesRead):
+        if not self.totalEntries: return
+        logging.info('{0}: Read {1:.2f} MB, {2:.2f} kB/event (all branches: {3:.2f} kB/event)'.format(self.sample,bytesRead/1024./1024.,bytesRead/1024./self.totalEntries,self.unprunedBytesPerEntry/1024.))
+
     def __initializeHistograms(self):
         if self.skipHists: self.histParams = {}
         chans = ['all']
@@ -97,6 +181,14 @@ class NtupleFlattener(object):
         if not hasattr(self,'datasetParams'): self.datasetParams = {}
         if not hasattr(self,'textSelections'): self.textSelections = []
         if not hasattr(self,'textFields'): self.textFields = OrderedDict()
+        # per (prefix, selection, chan, genChan) lists of histograms and accessors to fill,
+        # compiled the first time a combination is filled
+        self.histPlans = {}
+        self.datasetPlans = {}
+        self.fillBuffers = FillBufferPool(self.bufferSize,self.maxBufferMemory)
+        self.datasetBuffers = DatasetCollector(self.datasetBufferSize)
+        prefixes = [self.histPrefix]
+        if self.doWeightShifts: prefixes += ['{0}/'.format(shift) for shift in self.weightShifts]
         for selection in self.selections:
             for hist in self.histParams:
                 if selection in self.selectionHists:
@@ -110,37 +202,8 @@ class NtupleFlattener(object):
                         histName = '{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
                         if genChan=='all': histName = '{0}/{1}/{2}'.format(selection,chan,hist)
                         if chan=='all': histName = '{0}/{1}'.format(selection,hist)
-                        xbins = self.histParams[hist].get('xBinning',[])
-                        if 'yBinning' in self.histParams[hist]:
-                            ybins = self.histParams[hist]['yBinning']
-                            if isinstance(xbins,array) and isinstance(ybins,array): # variable width array
-                                self.hists[histName] = ROOT.TH2D(histName,histName,len(xbins)-1,xbins,len(ybins)-1,ybins)
-                            elif len(xbins)==3 and len(ybins)==3 and all([isinstance(x,numbers.Number) for x in xbins]) and all([isinstance(x,numbers.Number) for x in ybins]): # n, low, high
-                                self.hists[histName] = ROOT.TH2D(histName,histName,xbins[0],xbins[1],xbins[2],ybins[0],ybins[1],ybins[2])
-                            elif len(xbins)>0 and len(ybins)>0:
-                                self.hists[histName] = ROOT.TH2D(histName,histName,len(xbins),0,len(xbins),len(ybins),0,len(ybins))
-                                for i,label in enumerate(xbins):
-                                    self.hists[histName].GetXaxis().SetBinLabel(i+1,str(label))
-                                for i,label in enumerate(ybins):
-                                    self.hists[histName].GetYaxis().SetBinLabel(i+1,str(label))
-                            else:
-                                self.hists[histName] = ROOT.TH2D()
-                                self.hists[histName].SetName(histName)
-                                self.hists[histName].SetTitle(histName)
-                        else:
-                            if isinstance(xbins,array): # variable width array
-                                self.hists[histName] = ROOT.TH1D(histName,histName,len(xbins)-1,xbins)
-                            elif len(xbins)==3 and all([isinstance(x,numbers.Number) for x in xbins]): # n, low, high
-                                self.hists[histName] = ROOT.TH1D(histName,histName,xbins[0],xbins[1],xbins[2])
-                            elif len(xbins)>0:
-                                self.hists[histName] = ROOT.TH1D(histName,histName,len(xbins),0,len(xbins))
-                                for i,label in enumerate(xbins):
-                                    self.hists[histName].GetXaxis().SetBinLabel(i+1,label)
-                            else:
-                                self.hists[histName] = ROOT.TH1D()
-                                self.hists[histName].SetName(histName)
-                                self.hists[histName].SetTitle(histName)
-                        self.hists[histName].Sumw2()
+                        for histName in [prefix+histName for prefix in prefixes]:
+                            self.hists.book(histName,self.histParams[hist])
             for hist in self.datasetParams:
                 if 'doGen' in self.datasetParams[hist] and self.datasetParams[hist]['doGen']:
                     thisGenChans = genChans
@@ -151,19 +214,18 @@ class NtupleFlattener(object):
                         histName = '{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
                         if genChan=='all': histName = '{0}/{1}/{2}'.format(selection,chan,hist)
                         if chan=='all': histName = '{0}/{1}'.format(selection,hist)
-                        x = self.datasetParams[hist].get('xVar',None)
-                        w = self.datasetParams[hist].get('wVar',None)
-                        if 'yVar' in self.datasetParams[hist]:
-                            y = self.datasetParams[hist].get('yVar',None)
-                            self.datasets[histName] = ROOT.RooDataSet(histName,histName,ROOT.RooArgSet(x,y,w))#,w.GetName())
-                        else:
-                            self.datasets[histName] = ROOT.RooDataSet(histName,histName,ROOT.RooArgSet(x,w))#,w.GetName())
+                        for histName in [prefix+histName for prefix in prefixes]:
+                            x = self.datasetParams[hist].get('xVar',None)
+                            w = self.datasetParams[hist].get('wVar',None)
+                            if 'yVar' in self.datasetParams[hist]:
+                                y = self.datasetParams[hist].get('yVar',None)
+                                self.datasets[histName] = ROOT.RooDataSet(histName,histName,ROOT.RooArgSet(x,y,w))#,w.GetName())
+                            else:
+                                self.datasets[histName] = ROOT.RooDataSet(histName,histName,ROOT.RooArgSet(x,w))#,w.GetName())
+        if self.histPrefix: self.textSelections = []
         for selection in self.textSelections:
             outdir = 'text/{}/{}/{}'.format(self.analysis,self.sample,selection)
             python_mkdir(outdir)
-            outfile = '{}/events.csv'.format(outdir)
-            with open(outfile,'w') as f:
-                f.write(','.join(self.textFields.keys())+',weight\n')
 
 
     def getTree(self):
@@ -189,6 +251,29 @@ class NtupleFlattener(object):
         self.__initializeNtuple()
         self.totalEntries = self.sampleTree.GetEntries()
         self.__initializeHistograms()
+        if self.pruneBranches: self.__pruneBranches()
+        bytesStart = ROOT.TFile.GetFileBytesRead()
+        if self.shards>1:
+            self.__flattenSharded()
+        elif self.columnar:
+            self.__flattenColumnar()
+        else:
+            self.__flattenRows()
+        if self.pruneBranches and self.shards<=1: self.__reportBytesRead(ROOT.TFile.GetFileBytesRead()-bytesStart)
+        self.write()
+        self.__closeEventDumps(csv=self.dumpCSV)
+        if self.graph.funcs and self.shards<=1:
+            for line in self.graph.report(): logging.info(line)
+        self.__reportMemory()
+
+    def __reportMemory(self):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.
+        logging.info('{0}: Created {1}/{2} histograms, peak RSS {3:.1f} MB'.format(self.sample,self.hists.nCreated(),len(self.hists),peak))
+
+    def __flattenRows(self):
+        '''
+        Loop over the tree one row at a time.
+        '''
         total = 0
         start = time.time()
         new = start
@@ -199,7 +284,7 @@ class NtupleFlattener(object):
             for row in self.sampleTree:
                 total += 1
                 self.pbar.update(total)
-                self.perRowAction(row)
+                self.processRow(row)
             self.pbar.finish()
         else:
             logging.info('Flattening {0} {1}'.format(self.analysis,self.sample))
@@ -214,41 +299,129 @@ class NtupleFlattener(object):
                     hours, mins = divmod(mins,60)
                     logging.info('{0}: Processing {1} event {2}/{3} - {4}:{5:02d}:{6:02d} remaining'.format(self.analysis,self.sample,total,self.totalEntries,hours,mins,secs))
                     self.flush()
-                self.perRowAction(row)
-        self.write()
+                self.processRow(row)
 
-    def write(self):
+    def __reopenNtuple(self):
+        '''Open a new chain, file handles can not be shared between processes'''
+        tchain = ROOT.TChain(self.treeName)
+        for f in self.files:
+            tchain.Add(f)
+        if self.prunedBranches: pruneBranches(tchain,self.prunedBranches,self.cacheSize)
+        self.sampleTree = tchain
+
+    def __flattenShard(self,shard,first,last,tmpdir):
+        '''
+        Process a range of entries and write the partial output.
+        '''
+        self.__reopenNtuple()
+        self.textSuffix = '.shard{0}'.format(shard)
+        logging.info('{0}: Flattening {1} shard {2}: events {3}-{4}'.format(self.analysis,self.sample,shard,first,last))
+        if self.columnar:
+            for chunk in iterateChunks(self.sampleTree,self.chunkSize,branches=self.branches,start=first,stop=last):
+                self.processChunk(chunk)
+        else:
+            for i in xrange(first,last):
+                self.sampleTree.GetEntry(i)
+                self.processRow(self.sampleTree)
+        self.write(outputFile=os.path.join(tmpdir,'shard{0}.root'.format(shard)),verbose=False,placeholders=False)
+        self.__closeEventDumps(csv=False)
+
+    def __flattenSharded(self):
+        '''
+        Split the tree into ranges of entries processed in separate processes.
+        The partial outputs are merged in the order of the entries.
+        '''
+        ranges = getEntryRanges(self.totalEntries,self.shards)
+        logging.info('Flattening {0} {1} in {2} shards'.format(self.analysis,self.sample,len(ranges)))
+        tmpdir = tempfile.mkdtemp()
+        try:
+            runForked(self.__flattenShard,[(i,first,last,tmpdir) for i,(first,last) in enumerate(ranges)])
+            for i in range(len(ranges)):
+                self.__mergeShard(os.path.join(tmpdir,'shard{0}.root'.format(i)))
+                for selection in self.textSelections:
+                    self.__mergeEventDump(selection,'.shard{0}'.format(i))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def __mergeShard(self,filename):
+        tfile = ROOT.TFile.Open(filename)
+        for h in self.hists:
+            hist = tfile.Get(h)
+            if hist: self.hists[h].Add(hist)
+        for h in self.datasets:
+            self.datasets[h].append(tfile.Get(h))
+        tfile.Close()
+
+    def __mergeEventDump(self,selection,suffix):
+        outdir = 'text/{}/{}/{}'.format(self.analysis,self.sample,selection)
+        shardName = getEventDumpName(outdir,suffix)
+        if not os.path.exists(shardName): return
+        self.__getEventDump(selection).merge(shardName)
+        os.remove(shardName)
+
+    def __flattenColumnar(self):
         '''
-        Write histograms to files
+        Loop over the tree in chunks of numpy arrays.
         '''
         total = 0
-        totalHists = len(self.hists)+len(self.datasets)
+        start = time.time()
         if hasProgress and self.pbar:
-            self.pbar.maxval = totalHists
+            self.pbar.maxval = self.totalEntries
             self.pbar.start()
         else:
+            logging.info('Flattening {0} {1} in chunks of {2}'.format(self.analysis,self.sample,self.chunkSize))
+        for chunk in iterateChunks(self.sampleTree,self.chunkSize,branches=self.branches):
+            self.processChunk(chunk)
+            total += len(chunk)
+            if hasProgress and self.pbar:
+                self.pbar.update(total)
+            else:
+                elapsed = time.time()-start
+                remaining = float(elapsed)/total * float(self.totalEntries) - float(elapsed)
+                mins, secs = divmod(int(remaining),60)
+                hours, mins = divmod(mins,60)
+                logging.info('{0}: Processing {1} event {2}/{3} - {4}:{5:02d}:{6:02d} remaining'.format(self.analysis,self.sample,total,self.totalEntries,hours,mins,secs))
+                self.flush()
+        if hasProgress and self.pbar:
+            self.pbar.finish()
+
+    def write(self,outputFile=None,verbose=True,placeholders=True):
+        '''
+        Write histograms to files.
+        Histograms that were never filled are written empty unless placeholders is False.
+        '''
+        if outputFile is None: outputFile = self.outputFile
+        self.fillBuffers.flush()
+        self.datasetBuffers.flush()
+        total = 0
+        totalHists = len(self.hists)+len(self.datasets)
+        if hasProgress and self.pbar and verbose:
+            self.pbar.maxval = totalHists
+            self.pbar.start()
+        elif verbose:
             logging.info('Writing histograms')
-        self.outfile = ROOT.TFile(self.outputFile,'update')
+        self.outfile = ROOT.TFile(outputFile,'update')
         for h in sorted(self.hists):
             total += 1
-            if hasProgress and self.pbar:
+            if hasProgress and self.pbar and verbose:
                 self.pbar.update(total)
-            else:
+            elif verbose:
                 logging.info('{0}: Writing {1} histogram {2}/{3} {4}'.format(self.analysis,self.sample,total,totalHists,h))
+            if not self.hists.isCreated(h) and not placeholders: continue
             components = h.split('/')
             directory = '/'.join(components[:-1])
             histName = components[-1]
-            hist = self.hists[h]
+            hist = self.hists.placeholder(h)
             hist.SetName(histName)
             hist.SetTitle(histName)
             if not self.outfile.GetDirectory(directory): self.outfile.mkdir(directory)
-            self.outfile.cd('{0}:/{1}'.format(self.outputFile,directory))
+            self.outfile.cd('{0}:/{1}'.format(outputFile,directory))
             hist.Write('',ROOT.TObject.kOverwrite)
         for h in sorted(self.datasets):
             total += 1
-            if hasProgress and self.pbar:
+            if hasProgress and self.pbar and verbose:
                 self.pbar.update(total)
-            else:
+            elif verbose:
                 logging.info('{0}: Writing {1} dataset {2}/{3} {4}'.format(self.analysis,self.sample,total,totalHists,h))
             components = h.split('/')
             directory = '/'.join(components[:-1])
@@ -257,83 +430,201 @@ class NtupleFlattener(object):
             hist.SetName(histName)
             hist.SetTitle(histName)
             if not self.outfile.GetDirectory(directory): self.outfile.mkdir(directory)
-            self.outfile.cd('{0}:/{1}'.format(self.outputFile,directory))
+            self.outfile.cd('{0}:/{1}'.format(outputFile,directory))
             hist.Write('',ROOT.TObject.kOverwrite)
-        if hasProgress and self.pbar:
+        if hasProgress and self.pbar and verbose:
             self.pbar.finish()
         self.outfile.Close()
 
 
+    def processRow(self,row):
+        '''
+        Run perRowAction for the nominal weight and each weight shift.
+        '''
+        if self.disabledBranches: row = PrunedRow(row,self.disabledBranches)
+        self.graph.reset()
+        self.perRowAction(row)
+        if not self.doWeightShifts: return
+        try:
+            for shift in self.weightShifts:
+                self.shift = shift
+                self.histPrefix = '{0}/'.format(shift)
+                self.perRowAction(row)
+        finally:
+            self.shift = ''
+            self.histPrefix = ''
+
+    def processChunk(self,chunk):
+        '''
+        Run perChunkAction for the nominal weight and each weight shift.
+        '''
+        self.perChunkAction(chunk)
+        if not self.doWeightShifts: return
+        try:
+            for shift in self.weightShifts:
+                self.shift = shift
+                self.histPrefix = '{0}/'.format(shift)
+                self.perChunkAction(chunk)
+        finally:
+            self.shift = ''
+            self.histPrefix = ''
+
     def perRowAction(self,row):
         '''
         Action to be performed on each row. Override.
         '''
         return
 
+    def perChunkAction(self,chunk):
+        '''
+        Action to be performed on each chunk in columnar mode.
+        Override with a vectorized version, defaults to perRowAction on each entry.
+        '''
+        for row in chunk.rows():
+            self.graph.reset()
+            self.perRowAction(row)
+
     def fill(self,row,selection,weight,chan='all',genChan='all'):
         '''Fill a histogram'''
+        if self.probing: return
         if weight!=weight:
-            logging.warning('{0} {1} {2} attempted to add NaN weight'.format(histName,chan,genChan))
+            logging.warning('{0} {1} {2} attempted to add NaN weight'.format(selection,chan,genChan))
+        self.fillHists(row,selection,weight,chan,genChan)
+        self.fillDatasets(row,selection,weight,chan,genChan)
+        self.fillText(row,selection,weight)
+
+    def fillChunk(self,chunk,selection,mask,weights,chans=None,genChans=None):
+        '''
+        Fill the histograms for all entries of a chunk passing a selection.
+        The weights, chans, and genChans are arrays matching the chunk (or a single value).
+        '''
+        mask = np.asarray(mask,dtype=bool)
+        if mask.shape!=(len(chunk),): mask = np.full(len(chunk),bool(mask.item() if hasattr(mask,'item') else mask))
+        if not mask.any(): return
+        weights = np.broadcast_to(np.asarray(weights,dtype=np.float64),(len(chunk),))
+        if chans is None: chans = 'all'
+        if genChans is None: genChans = 'all'
+        chans = np.broadcast_to(np.asarray(chans),(len(chunk),))
+        genChans = np.broadcast_to(np.asarray(genChans),(len(chunk),))
+        if np.isnan(weights[mask]).any():
+            logging.warning('{0} attempted to add NaN weight'.format(selection))
+        # the groups of entries to fill: (histogram directory, entry mask)
+        groups = [(self.histPrefix+'{0}'.format(selection),mask,False)]
+        for chan in np.unique(chans[mask]):
+            if chan=='all': continue
+            chanMask = mask & (chans==chan)
+            groups += [(self.histPrefix+'{0}/{1}'.format(selection,chan),chanMask,False)]
+            for genChan in np.unique(genChans[chanMask]):
+                if genChan=='all': continue
+                groups += [(self.histPrefix+'{0}/{1}/gen_{2}'.format(selection,chan,genChan),chanMask & (genChans==genChan),True)]
         for hist in self.histParams:
             if selection in self.selectionHists:
                 if hist not in self.selectionHists[selection]: continue
-            if 'selection' in self.histParams:
-                if not self.histParams[hist]['selection'](row): continue
-            w = weight*self.histParams[hist]['mcscale'](row) if 'mcscale' in self.histParams[hist] and self.isData else weight
-            histName = '{0}/{1}'.format(selection,hist)
-            xval = self.histParams[hist]['x'](row)
-            if 'y' in self.histParams[hist]:
-                yval = self.histParams[hist]['y'](row)
-                self.hists[histName].Fill(xval,yval,w)
-                if chan!='all':
-                    histName = '{0}/{1}/{2}'.format(selection,chan,hist)
-                    self.hists[histName].Fill(xval,yval,w)
-                if genChan!='all':
-                    histName = '{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
-                    if histName in self.hists: self.hists[histName].Fill(xval,yval,w)
-            else:
-                self.hists[histName].Fill(xval,w)
-                if chan!='all':
-                    histName = '{0}/{1}/{2}'.format(selection,chan,hist)
-                    self.hists[histName].Fill(xval,w)
-                if genChan!='all':
-                    histName = '{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
-                    if histName in self.hists: self.hists[histName].Fill(xval,w)
+            params = self.histParams[hist]
+            xvals = evaluate(params['x'],chunk,key=(hist,'x'))
+            yvals = evaluate(params['y'],chunk,key=(hist,'y')) if 'y' in params else None
+            w = weights*evaluate(params['mcscale'],chunk,key=(hist,'mcscale')) if 'mcscale' in params and self.isData else weights
+            for directory, groupMask, optional in groups:
+                histName = '{0}/{1}'.format(directory,hist)
+                if optional and histName not in self.hists: continue
+                fillArrays(self.hists[histName],xvals[groupMask],w[groupMask],yvals[groupMask] if yvals is not None else None)
+        # datasets and text output are filled entry by entry
+        if self.datasetParams or selection in self.textSelections:
+            for i in np.flatnonzero(mask):
+                row = chunk.row(i)
+                chan = chans[i]
+                genChan = genChans[i]
+                self.fillDatasets(row,selection,weights[i],chan,genChan)
+                self.fillText(row,selection,weights[i])
 
+    def __compileHistPlan(self,prefix,selection,chan,genChan):
+        '''Resolve the histograms and accessors filled for a selection, channel, and gen channel'''
+        plan = []
+        for hist in self.histParams:
+            if selection in self.selectionHists:
+                if hist not in self.selectionHists[selection]: continue
+            params = self.histParams[hist]
+            histNames = [prefix+'{0}/{1}'.format(selection,hist)]
+            if chan!='all':
+                histNames += [prefix+'{0}/{1}/{2}'.format(selection,chan,hist)]
+            if genChan!='all':
+                histName = prefix+'{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
+                if histName in self.hists: histNames += [histName]
+            hists = [self.fillBuffers.get(histName,self.hists[histName]) for histName in histNames]
+            plan += [(
+                params.get('selection',None) if 'selection' in self.histParams else None,
+                params['mcscale'] if 'mcscale' in params and self.isData else None,
+                params['x'],
+                params.get('y',None),
+                hists,
+            )]
+        return plan
+
+    def __compileDatasetPlan(self,prefix,selection,chan,genChan):
+        '''Resolve the datasets and accessors filled for a selection, channel, and gen channel'''
+        plan = []
         for hist in self.datasetParams:
-            wval = weight*self.datasetParams[hist]['mcscale'](row) if 'mcscale' in self.datasetParams[hist] and self.isData else weight
+            params = self.datasetParams[hist]
+            histNames = [prefix+'{0}/{1}'.format(selection,hist)]
+            if chan!='all':
+                histNames += [prefix+'{0}/{1}/{2}'.format(selection,chan,hist)]
+            if genChan!='all':
+                histName = prefix+'{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
+                if histName in self.datasets: histNames += [histName]
+            datasets = [self.datasetBuffers.get(histName,self.datasets[histName],params['xVar'],params['wVar'],params['yVar'] if 'y' in params else None) for histName in histNames]
+            plan += [(
+                params['mcscale'] if 'mcscale' in params and self.isData else None,
+                params['x'],
+                params.get('y',None),
+                datasets,
+            )]
+        return plan
+
+    def fillHists(self,row,selection,weight,chan='all',genChan='all'):
+        '''Fill the histograms for a row'''
+        key = (self.histPrefix,selection,chan,genChan)
+        if key not in self.histPlans: self.histPlans[key] = self.__compileHistPlan(*key)
+        for sel, mcscale, xfunc, yfunc, hists in self.histPlans[key]:
+            if sel is not None and not sel(row): continue
+            w = weight*mcscale(row) if mcscale is not None else weight
+            xval = xfunc(row)
+            if yfunc is None:
+                for hist in hists: hist.Fill(xval,w)
+            else:
+                yval = yfunc(row)
+                for hist in hists: hist.Fill(xval,yval,w)
+
+    def fillDatasets(self,row,selection,weight,chan='all',genChan='all'):
+        '''Fill the datasets for a row'''
+        key = (self.histPrefix,selection,chan,genChan)
+        if key not in self.datasetPlans: self.datasetPlans[key] = self.__compileDatasetPlan(*key)
+        for mcscale, xfunc, yfunc, datasets in self.datasetPlans[key]:
+            wval = weight*mcscale(row) if mcscale is not None else weight
             if not wval:
                 continue
-            w = self.datasetParams[hist]['wVar']
-            w.setVal(wval)
-            histName = '{0}/{1}'.format(selection,hist)
-            xval = self.datasetParams[hist]['x'](row)
-            x = self.datasetParams[hist]['xVar']
-            x.setVal(xval)
-            if 'y' in self.datasetParams[hist]:
-                yval = self.datasetParams[hist]['y'](row)
-                y = self.datasetParams[hist]['yVar']
-                y.setVal(yval)
-                self.datasets[histName].add(ROOT.RooArgSet(x,y,w))
-                if chan!='all':
-                    histName = '{0}/{1}/{2}'.format(selection,chan,hist)
-                    self.datasets[histName].add(ROOT.RooArgSet(x,y,w))
-                if genChan!='all':
-                    histName = '{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
-                    if histName in self.datasets: self.datasets[histName].add(ROOT.RooArgSet(x,y,w))
+            xval = xfunc(row)
+            if yfunc is None:
+                for dataset in datasets: dataset.Fill(xval,wval)
             else:
-                self.datasets[histName].add(ROOT.RooArgSet(x,w))
-                if chan!='all':
-                    histName = '{0}/{1}/{2}'.format(selection,chan,hist)
-                    self.datasets[histName].add(ROOT.RooArgSet(x,w))
-                if genChan!='all':
-                    histName = '{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
-                    if histName in self.datasets: self.datasets[histName].add(ROOT.RooArgSet(x,w))
+                yval = yfunc(row)
+                for dataset in datasets: dataset.Fill(xval,yval,wval)
 
-        if selection in self.textSelections:
+    def __getEventDump(self,selection):
+        if selection not in self.eventDumps:
             outdir = 'text/{}/{}/{}'.format(self.analysis,self.sample,selection)
-            outfile = '{}/events.csv'.format(outdir)
-            with open(outfile,'a') as f:
-                f.write(','.join(['{}'.format(self.textFields[k](row)) for k in self.textFields.keys()])+',{}\n'.format(weight))
+            self.eventDumps[selection] = EventDump(outdir,self.textFields.keys(),chunkSize=self.dumpChunkSize,suffix=self.textSuffix)
+        return self.eventDumps[selection]
+
+    def __closeEventDumps(self,csv=True):
+        '''Write the remaining events of each text selection'''
+        for selection in self.textSelections:
+            self.__getEventDump(selection).close(csv=csv)
+        self.eventDumps = {}
+
+    def fillText(self,row,selection,weight):
+        '''Write a row to the text output'''
+        if self.histPrefix: return
+        if selection in self.textSelections:
+            self.__getEventDump(selection).fill([self.textFields[k](row) for k in self.textFields]+[weight])
 
 
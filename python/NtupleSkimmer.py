@@ -5,6 +5,9 @@ import glob
 import json
 import pickle
 import time
+import shutil
+import tempfile
+from bisect import bisect_left, bisect_right
 
 sys.argv.append('-b')
 import ROOT
@@ -14,8 +17,11 @@ ROOT.gROOT.SetBatch(ROOT.kTRUE)
 ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 
 from DevTools.Plotter.xsec import getXsec
-from DevTools.Plotter.utilities import getLumi, isData, hashFile, hashString, python_mkdir, getTreeName, getNtupleDirectory, getSkimJson, getSkimPickle
+from DevTools.Plotter.utilities import getLumi, isData, hashFile, hashString, python_mkdir, getTreeName, getNtupleDirectory, getSkimJson, getSkimCounts, getSkimScan, getEntryRanges, runForked
 from DevTools.Plotter.histParams import getHistParams, getHistSelections, getProjectionParams
+from DevTools.Plotter.branchUtilities import getCodeHash, getStaticBranches, getTreeBranches, readBranchCache, writeBranchCache, probeBranches, pruneBranches, getDisabledBranches, PrunedRow
+from DevTools.Plotter.JointScan import JointScan
+from DevTools.Plotter.CountStore import writeCountStore, mergeCountStores, exportCountStore
 
 try:
     from progressbar import ProgressBar, ETA, Percentage, Bar, SimpleProgress
@@ -40,8 +46,20 @@ class NtupleSkimmer(object):
         self.inputFileList = kwargs.pop('inputFileList','')
         self.outputFile = kwargs.pop('outputFile','')
         self.json = kwargs.pop('json',getSkimJson(self.analysis,self.sample))
-        self.pickle = kwargs.pop('pickle',getSkimPickle(self.analysis,self.sample))
+        self.countStore = kwargs.pop('countStore',getSkimCounts(self.analysis,self.sample))
+        self.scanFile = kwargs.pop('scanFile',getSkimScan(self.analysis,self.sample))
         self.treeName = kwargs.pop('treeName',getTreeName(self.analysis))
+        self.pruneBranches = kwargs.pop('pruneBranches',False)
+        # fail on reading a disabled branch, every branch read goes through python
+        self.validateBranches = kwargs.pop('validateBranches',False)
+        self.probeEntries = kwargs.pop('probeEntries',1000)
+        self.cacheSize = kwargs.pop('cacheSize',30*1024*1024)
+        self.probing = False
+        self.disabledBranches = frozenset()
+        self.prunedBranches = []
+        self.shards = kwargs.pop('shards',1)
+        self.shardBy = kwargs.pop('shardBy','events') # events, files
+        self.normalizationFiles = kwargs.pop('normalizationFiles',[])
         if hasProgress:
             self.pbar = kwargs.pop('progressbar',ProgressBar(widgets=['{0}: '.format(sample),' ',SimpleProgress(),' events ',Percentage(),' ',Bar(),' ',ETA()]))
         else:
@@ -51,6 +69,10 @@ class NtupleSkimmer(object):
         self.tchain = 0
         self.initialized = False
         self.counts = {}
+        self.scans = {}
+        self.scanCounts = {}
+        self.jointScans = {}
+        self.jointCounts = {}
 
     def __initializeNtuple(self):
         tchain = ROOT.TChain(self.treeName)
@@ -63,10 +85,12 @@ class NtupleSkimmer(object):
             allFiles = glob.glob('{0}/*.root'.format(self.ntupleDirectory))
         if len(allFiles)==0: logging.error('No files found for sample {0}'.format(self.sample))
         summedWeights = 0.
-        for f in allFiles:
+        # a job over part of a sample is normalized with all the files of the sample
+        for f in (self.normalizationFiles or allFiles):
             tfile = ROOT.TFile.Open(f)
             summedWeights += tfile.Get("summedWeights").GetBinContent(1)
             tfile.Close()
+        for f in allFiles:
             tchain.Add(f)
         if not summedWeights and not isData(self.sample): logging.warning('No events for sample {0}'.format(self.sample))
         self.xsec = getXsec(self.sample)
@@ -77,6 +101,36 @@ class NtupleSkimmer(object):
         self.initialized = True
         logging.debug('Initialized {0}: summedWeights = {1}; xsec = {2}; sampleLumi = {3}; intLumi = {4}'.format(self.sample,summedWeights,self.xsec,self.sampleLumi,self.intLumi))
 
+    def __pruneBranches(self):
+        '''
+        Only read the branches used by perRowAction.
+        The branches are found by tracing a probe sample and cached per analysis and code version.
+        '''
+        codeHash = getCodeHash(self)
+        key = '{0}:{1}'.format(self.sample,self.shift)
+        allBranches = getTreeBranches(self.sampleTree)
+        cached = readBranchCache(self.analysis,codeHash,key)
+        if cached:
+            branches = cached['branches']
+            bytesPerEntry = cached['bytesPerEntry']
+        else:
+            logging.info('{0}: Probing branches with {1} events'.format(self.sample,self.probeEntries))
+            self.probing = True
+            used, bytesPerEntry = probeBranches(self.sampleTree,self.perRowAction,self.probeEntries)
+            self.probing = False
+            branches = sorted((used | getStaticBranches(self)) & allBranches)
+            writeBranchCache(self.analysis,codeHash,key,{'branches':branches,'bytesPerEntry':bytesPerEntry})
+        branches = [b for b in branches if b in allBranches]
+        logging.info('{0}: Reading {1} of {2} branches'.format(self.sample,len(branches),len(allBranches)))
+        pruneBranches(self.sampleTree,branches,self.cacheSize)
+        if self.validateBranches: self.disabledBranches = getDisabledBranches(self.sampleTree)
+        self.prunedBranches = branches
+        self.unprunedBytesPerEntry = bytesPerEntry
+
+    def __reportBytesRead(self,bytesRead):
+        if not self.totalEntries: return
+        logging.info('{0}: Read {1:.2f} MB, {2:.2f} kB/event (all branches: {3:.2f} kB/event)'.format(self.sample,bytesRead/1024./1024.,bytesRead/1024./self.totalEntries,self.unprunedBytesPerEntry/1024.))
+
     def getTree(self):
         if not self.initialized: self.__initializeNtuple()
         return self.sampleTree
@@ -93,24 +147,37 @@ class NtupleSkimmer(object):
         sys.stdout.flush()
         sys.stderr.flush()
 
-    def dump(self):
+    def dump(self,shardStores=[]):
+        '''
+        Write the counts. If the counts were written by shards, their count
+        stores are merged instead.
+        '''
         if self.outputFile:
             # hack to copy them to hdfs
             os.system('touch {0}'.format(self.outputFile))
             tfile = ROOT.TFile.Open(self.outputFile,'RECREATE')
             tfile.Close()
             jfile = self.outputFile.replace('.root','.json.root')
-            pfile = self.outputFile.replace('.root','.pkl.root')
+            cfile = self.outputFile.replace('.root','.cnt.root')
+            sfile = self.outputFile.replace('.root','.scan.root')
         else:
             # local running
             jfile = self.json
-            pfile = self.pickle
+            cfile = self.countStore
+            sfile = self.scanFile
             python_mkdir(os.path.dirname(jfile))
-            python_mkdir(os.path.dirname(pfile))
-        with open(jfile,'w') as f:
-            f.write(json.dumps(self.counts, indent=4, sort_keys=True))
-        with open(pfile,'wb') as f:
-            pickle.dump(self.counts,f)
+            python_mkdir(os.path.dirname(cfile))
+            if self.jointCounts: python_mkdir(os.path.dirname(sfile))
+        if shardStores:
+            mergeCountStores(shardStores,cfile)
+            exportCountStore(cfile,jfile)
+        else:
+            with open(jfile,'w') as f:
+                f.write(json.dumps(self.counts, indent=4, sort_keys=True))
+            writeCountStore(cfile,self.counts)
+        if self.jointCounts:
+            with open(sfile,'wb') as f:
+                pickle.dump(self.getJointScans(),f,pickle.HIGHEST_PROTOCOL)
 
 
     def skim(self):
@@ -119,6 +186,25 @@ class NtupleSkimmer(object):
         '''
         self.__initializeNtuple()
         self.totalEntries = self.sampleTree.GetEntries()
+        if self.pruneBranches: self.__pruneBranches()
+        bytesStart = ROOT.TFile.GetFileBytesRead()
+        tmpdir = tempfile.mkdtemp() if self.shards>1 else ''
+        try:
+            shardStores = []
+            if self.shards>1:
+                shardStores = self.__skimSharded(tmpdir)
+            else:
+                self.__skimRows()
+            if self.pruneBranches and self.shards<=1: self.__reportBytesRead(ROOT.TFile.GetFileBytesRead()-bytesStart)
+            self.expandScans()
+            self.dump(shardStores)
+        finally:
+            if tmpdir: shutil.rmtree(tmpdir)
+
+    def __skimRows(self):
+        '''
+        Loop over the tree one row at a time.
+        '''
         total = 0
         start = time.time()
         new = start
@@ -129,7 +215,7 @@ class NtupleSkimmer(object):
             for row in self.sampleTree:
                 total += 1
                 self.pbar.update(total)
-                self.perRowAction(row)
+                self.processRow(row)
             self.pbar.finish()
         else:
             logging.info('Skimming {0} {1}'.format(self.analysis,self.sample))
@@ -144,8 +230,84 @@ class NtupleSkimmer(object):
                     hours, mins = divmod(mins,60)
                     logging.info('{0}: Processing event {1}/{2} - {3}:{4:02d}:{5:02d} remaining'.format(self.analysis,total,self.totalEntries,hours,mins,secs))
                     self.flush()
-                self.perRowAction(row)
-        self.dump()
+                self.processRow(row)
+
+    def __reopenNtuple(self,files=None):
+        '''Open a new chain, file handles can not be shared between processes'''
+        tchain = ROOT.TChain(self.treeName)
+        for f in (self.files if files is None else files):
+            tchain.Add(f)
+        if self.prunedBranches: pruneBranches(tchain,self.prunedBranches,self.cacheSize)
+        self.sampleTree = tchain
+
+    def __writeShard(self,shard,tmpdir):
+        '''Write the partial counts of a shard'''
+        self.expandScans()
+        writeCountStore(os.path.join(tmpdir,'shard{0}.cnt'.format(shard)),self.counts)
+        with open(os.path.join(tmpdir,'shard{0}.scan.pkl'.format(shard)),'wb') as f:
+            pickle.dump(self.jointCounts,f,pickle.HIGHEST_PROTOCOL)
+
+    def __skimShard(self,shard,first,last,tmpdir):
+        '''
+        Process a range of entries and write the partial counts.
+        '''
+        self.__reopenNtuple()
+        logging.info('{0}: Skimming {1} shard {2}: events {3}-{4}'.format(self.analysis,self.sample,shard,first,last))
+        for i in xrange(first,last):
+            self.sampleTree.GetEntry(i)
+            self.processRow(self.sampleTree)
+        self.__writeShard(shard,tmpdir)
+
+    def __skimFileShard(self,shard,files,tmpdir):
+        '''
+        Process a group of files and write the partial counts.
+        '''
+        self.__reopenNtuple(files)
+        logging.info('{0}: Skimming {1} shard {2}: {3} files'.format(self.analysis,self.sample,shard,len(files)))
+        for row in self.sampleTree:
+            self.processRow(row)
+        self.__writeShard(shard,tmpdir)
+
+    def __skimSharded(self,tmpdir):
+        '''
+        Split the tree into ranges of entries (or groups of files) processed in separate processes.
+        Returns the count stores of the shards, the joint scans are merged here.
+        '''
+        if self.shardBy=='files':
+            ranges = getEntryRanges(len(self.files),self.shards)
+            logging.info('Skimming {0} {1} in {2} file shards'.format(self.analysis,self.sample,len(ranges)))
+            runForked(self.__skimFileShard,[(i,self.files[first:last],tmpdir) for i,(first,last) in enumerate(ranges)])
+        else:
+            ranges = getEntryRanges(self.totalEntries,self.shards)
+            logging.info('Skimming {0} {1} in {2} shards'.format(self.analysis,self.sample,len(ranges)))
+            runForked(self.__skimShard,[(i,first,last,tmpdir) for i,(first,last) in enumerate(ranges)])
+        for i in range(len(ranges)):
+            with open(os.path.join(tmpdir,'shard{0}.scan.pkl'.format(i)),'rb') as f:
+                self.mergeJointCounts(pickle.load(f))
+        return [os.path.join(tmpdir,'shard{0}.cnt'.format(i)) for i in range(len(ranges))]
+
+    def mergeCounts(self,counts):
+        '''Add counts from another skim'''
+        for key,val in counts.iteritems():
+            if key not in self.counts:
+                self.counts[key] = {'val':0.,'count':0,'err2':0.,}
+            self.counts[key]['val'] += val['val']
+            self.counts[key]['count'] += val['count']
+            self.counts[key]['err2'] += val['err2']
+
+    def mergeJointCounts(self,jointCounts):
+        '''Add joint scans from another skim'''
+        for key,scan in jointCounts.iteritems():
+            if key not in self.jointCounts:
+                self.jointCounts[key] = JointScan(scan.axes)
+            self.jointCounts[key].merge(scan.bins)
+
+    def processRow(self,row):
+        '''
+        Run perRowAction, failing if a disabled branch is read.
+        '''
+        if self.disabledBranches: row = PrunedRow(row,self.disabledBranches)
+        self.perRowAction(row)
 
     def perRowAction(self,row):
         '''
@@ -153,8 +315,102 @@ class NtupleSkimmer(object):
         '''
         return
 
+    def addScan(self,scanName,thresholds,above=True):
+        '''
+        Register the thresholds of a cut scan.
+        A value passes a threshold if it is above it (or below it if above is False).
+        '''
+        self.scans[scanName] = (list(thresholds),above)
+
+    def incrementScan(self,scanName,cutName,value,val,chan,genChan='all'):
+        '''
+        Increment the counts of every threshold of a scan passed by value.
+        The cutName is formatted with the threshold as {cut}.
+        Only the bin between neighbouring thresholds is filled here,
+        the counts for each threshold are summed in expandScans.
+        '''
+        if self.probing: return
+        if val!=val:
+            logging.warning('{0} {1} {2} attempted to add NaN'.format(cutName,chan,genChan))
+        thresholds, above = self.scans[scanName]
+        index = bisect_left(thresholds,value) if above else bisect_right(thresholds,value)
+        key = (scanName,cutName,chan,genChan)
+        if key not in self.scanCounts:
+            n = len(thresholds)+1
+            self.scanCounts[key] = ([0.]*n,[0]*n,[0.]*n)
+        vals, counts, err2s = self.scanCounts[key]
+        vals[index] += val
+        counts[index] += 1
+        err2s[index] += val**2
+
+    def expandScans(self):
+        '''
+        Add the cumulative counts of each scan threshold to the counts,
+        with the same keys increment would have used.
+        '''
+        for (scanName,cutName,chan,genChan), (vals,counts,err2s) in self.scanCounts.iteritems():
+            thresholds, above = self.scans[scanName]
+            n = len(thresholds)
+            # above: threshold i is passed by the bins above i, below: by the bins up to i
+            order = [(i,i+1) for i in reversed(range(n))] if above else [(i,i) for i in range(n)]
+            val, count, err2 = 0., 0, 0.
+            for i, b in order:
+                val += vals[b]
+                count += counts[b]
+                err2 += err2s[b]
+                if not count: continue
+                name = cutName.format(cut=thresholds[i])
+                names = [name,'/'.join([name,chan])]
+                if genChan!='all': names += ['/'.join([name,chan,'gen_'+genChan])]
+                for key in names:
+                    if key not in self.counts:
+                        self.counts[key] = {'val':0.,'count':0,'err2':0.,}
+                    self.counts[key]['val'] += val
+                    self.counts[key]['count'] += count
+                    self.counts[key]['err2'] += err2
+        self.scanCounts = {}
+
+    def addJointScan(self,scanName,axes):
+        '''
+        Register a joint scan over the thresholds of scans added with addScan.
+        '''
+        self.jointScans[scanName] = [(axis,)+self.scans[axis] for axis in axes]
+
+    def incrementJointScan(self,scanName,cutName,values,val,chan,genChan='all'):
+        '''
+        Fill a joint scan with the values of each of its axes.
+        Only the bin of the values is filled, the counts passing each
+        combination of thresholds are summed when the scan is read.
+        '''
+        if self.probing: return
+        if val!=val:
+            logging.warning('{0} {1} {2} attempted to add NaN'.format(cutName,chan,genChan))
+        key = (scanName,cutName,chan,genChan)
+        if key not in self.jointCounts:
+            self.jointCounts[key] = JointScan(self.jointScans[scanName])
+        self.jointCounts[key].fill(values,val)
+
+    def getJointScans(self):
+        '''
+        The joint scans by scan name, with the bins of each directory
+        named as increment would (cutName, cutName/chan, cutName/chan/gen_genChan).
+        '''
+        scans = {}
+        for (scanName,cutName,chan,genChan), scan in self.jointCounts.iteritems():
+            if scanName not in scans: scans[scanName] = {'axes': scan.axes, 'bins': {}}
+            bins = scans[scanName]['bins']
+            names = [cutName,'/'.join([cutName,chan])]
+            if genChan!='all': names += ['/'.join([cutName,chan,'gen_'+genChan])]
+            for name in names:
+                if name not in bins: bins[name] = JointScan(scan.axes)
+                bins[name].merge(scan.bins)
+        for scanName in scans:
+            scans[scanName]['bins'] = dict([(name,scan.bins) for name,scan in scans[scanName]['bins'].iteritems()])
+        return scans
+
     def increment(self,cutName,val,chan,genChan='all'):
         '''Increment all counts'''
+        if self.probing: return
         if val!=val:
             logging.warning('{0} {1} {2} attempted to add NaN'.format(cutName,chan,genChan))
         if cutName not in self.counts:
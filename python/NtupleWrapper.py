@@ -4,6 +4,9 @@ import sys
 import glob
 import json
 import pickle
+import shutil
+import tempfile
+import multiprocessing
 
 sys.argv.append('-b')
 import ROOT
@@ -15,6 +18,12 @@ ROOT.gROOT.ProcessLine("gErrorIgnoreLevel = 2001;")
 from DevTools.Plotter.xsec import getXsec
 from DevTools.Plotter.utilities import *
 from DevTools.Plotter.histParams import getHistParams, getHistSelections, getProjectionParams
+from DevTools.Plotter.JointScan import JointScan
+from DevTools.Plotter.CountStore import CountStore
+from DevTools.Plotter.BatchDraw import BatchDraw
+from DevTools.Plotter.FilePool import getFilePool
+from DevTools.Plotter.projectionUtilities import Projector
+from DevTools.Plotter.HistCache import HistCache
 
 CMSSW_BASE = os.environ['CMSSW_BASE']
 
@@ -28,7 +37,9 @@ class NtupleWrapper(object):
         self.analysis = analysis
         self.sample = sample
         self.shift = kwargs.pop('shift','')
+        # draw with a local pool of processes, one per group of files (replaces PROOF)
         self.useProof = kwargs.pop('useProof',False)
+        self.nWorkers = kwargs.pop('nWorkers',multiprocessing.cpu_count())
         self.intLumi = kwargs.pop('intLumi',float(getLumi()))
         self.baseDirFlat = kwargs.pop('baseDirFlat','newflat' if self.new else 'flat')
         self.baseDirProj = kwargs.pop('baseDirProj','newflat' if self.new else 'projections')
@@ -36,7 +47,6 @@ class NtupleWrapper(object):
         # backup passing custom parameters
         #self.ntuple = kwargs.pop('ntuple','{0}/src/ntuples/{1}/{2}.root'.format(CMSSW_BASE,self.analysis,self.sample))
         self.ntupleDirectory = kwargs.pop('ntupleDirectory','{0}/{1}'.format(getNtupleDirectory(self.analysis,shift=self.shift,version=self.version),self.sample))
-        if self.useProof: self.ntupleDirectory.replace('-merge','')
         self.inputFileList = kwargs.pop('inputFileList','')
         self.treeName = kwargs.pop('treeName',getTreeName(self.analysis))
         #self.flat = kwargs.pop('flat','flat/{0}/{1}.root'.format(self.analysis,self.sample))
@@ -44,24 +54,45 @@ class NtupleWrapper(object):
         proj = getNewProjectionHistograms if self.new else getProjectionHistograms
         self.flat = kwargs.pop('flat',flat(self.analysis,self.sample,shift=self.shift,version=self.version,base=self.baseDirFlat))
         self.proj = kwargs.pop('proj',proj(self.analysis,self.sample,shift=self.shift,version=self.version,base=self.baseDirProj))
+        # weight shifts filled with the nominal are stored in a subdirectory
+        self.shiftDirectory = kwargs.pop('shiftDirectory',getFlatShiftDirectory(self.analysis,self.shift,version=self.version,sample=self.sample))
         self.json = kwargs.pop('json',getSkimJson(self.analysis,self.sample,shift=self.shift,version=self.version))
         self.pickle = kwargs.pop('pickle',getSkimPickle(self.analysis,self.sample,shift=self.shift,version=self.version))
+        self.countStore = kwargs.pop('countStore',getSkimCounts(self.analysis,self.sample,shift=self.shift,version=self.version))
+        self.scanFile = kwargs.pop('scanFile',getSkimScan(self.analysis,self.sample,shift=self.shift,version=self.version))
+        self.entryListFile = kwargs.pop('entryListFile',getEntryListFile(self.analysis,self.sample,shift=self.shift,version=self.version))
+        # experimental, not measured on a real sized sample yet (scripts/benchmarkEntryLists.py)
+        self.useEntryLists = kwargs.pop('useEntryLists',False)
+        if self.useEntryLists: logging.info('{0}: using experimental entry lists'.format(self.sample))
+        self.filePool = getFilePool(kwargs.pop('filePoolSize',None))
+        self.maxPending = kwargs.pop('maxPending',500) # histograms held before a commit
+        self.genProjections = kwargs.pop('genProjections',True)
+        # blocks of each ntuple file hashed in the fingerprint, 0 for metadata only
+        self.fingerprintBlocks = kwargs.pop('fingerprintBlocks',0)
+        # cache of the temporary histograms, None to disable
+        tempCacheDirectory = kwargs.pop('tempCacheDirectory','cache/{0}/tempHists'.format(self.analysis))
+        self.tempCache = HistCache(tempCacheDirectory,maxSize=kwargs.pop('tempCacheSize',1024**3)) if tempCacheDirectory else None
         self.skimInitialized = False
+        self.scansInitialized = False
         # get stuff needed to flatten
         self.histParams = getHistParams(self.analysis,self.sample,shift=self.shift,version=self.version,**kwargs)
         self.selections = getHistSelections(self.analysis,self.sample,shift=self.shift,version=self.version,**kwargs)
         self.projections = getProjectionParams(self.analysis,self.sample,shift=self.shift,version=self.version,**kwargs)
         self.infile = 0
         self.outfile = 0
+        self.hashes = None
+        self.hashesChanged = False
+        self.pending = {}
         self.j = 0
         self.initialized = False
         self.temp = True
-        if self.useProof:
-            self.proof = ROOT.TProof.Open('')
         # verify output file directory exists
         if os.path.dirname(self.flat) and not self.flat.startswith('/hdfs'): os.system('mkdir -p {0}'.format(os.path.dirname(self.flat)))
         if os.path.dirname(self.proj) and not self.proj.startswith('/hdfs'): os.system('mkdir -p {0}'.format(os.path.dirname(self.proj)))
         self.entryListMap = {}
+        self.fileHash = ''
+        self.batch = None
+        self.batchHists = []
         #logging.debug('Initialized with')
         #logging.debug('  flat: {}'.format(self.flat))
         #logging.debug('  proj: {}'.format(self.proj))
@@ -102,16 +133,63 @@ class NtupleWrapper(object):
         self.sampleLumi = float(summedWeights)/self.xsec if self.xsec else 0.
         self.sampleTree = tchain
         self.j += 1
-        #listname = 'selList{0}'.format(self.j)
-        #self.sampleTree.Draw('>>{0}'.format(listname),'1','entrylist')
-        #skim = ROOT.gDirectory.Get(listname)
-        #self.entryListMap['1'] = skim
         self.files = allFiles
         self.initialized = True
-        if not self.temp: self.fileHash = hashFile(*self.files)
-        if self.useProof: self.sampleTree.SetProof()
+        if not self.temp: self.__getFileHash()
         logging.debug('Initialized {0}: summedWeights = {1}; xsec = {2}; sampleLumi = {3}; intLumi = {4}'.format(self.sample,summedWeights,self.xsec,self.sampleLumi,self.intLumi))
 
+    def __getFileHash(self):
+        '''Fingerprint of the ntuple files, computed once'''
+        if not self.initialized: self.__initializeNtuple()
+        if not self.fileHash: self.fileHash = fingerprintFiles(*self.files,treeName=self.treeName,sampleBlocks=self.fingerprintBlocks)
+        return self.fileHash
+
+    def __getEntryList(self,selection):
+        '''
+        Get the entry list of the events passing a selection.
+
+        Entry lists are kept for the lifetime of the wrapper and stored in
+        the entryListFile, keyed by the selection, so later runs over the
+        same ntuple files read them back instead of evaluating the selection.
+        The file is recreated when the ntuple files change.
+        Returns None if entry lists are not used.
+        Experimental: whether this is faster than TTree::Draw with the
+        selection is still to be measured with benchmarkEntryLists.py.
+        '''
+        if not self.useEntryLists or (self.useProof and len(self.files)>1): return None
+        if selection in self.entryListMap: return self.entryListMap[selection]
+        tree = self.getTree()
+        fingerprint = hashString(self.__getFileHash(),*self.files)
+        name = 'elist_{0}'.format(hashString(selection))
+        entryList = None
+        stored = ''
+        if os.path.isfile(self.entryListFile):
+            elfile = ROOT.TFile.Open(self.entryListFile)
+            storedObj = elfile.Get('fingerprint')
+            if storedObj: stored = storedObj.GetTitle()
+            if stored==fingerprint:
+                obj = elfile.Get(name)
+                if obj and obj.GetTitle()==selection:
+                    entryList = obj.Clone(name)
+                    entryList.SetDirectory(0)
+            elfile.Close()
+        if entryList is None:
+            self.j += 1
+            listname = 'selList{0}'.format(self.j)
+            tree.SetEntryList(0)
+            tree.Draw('>>{0}'.format(listname),selection,'entrylist goff')
+            entryList = ROOT.gDirectory.Get(listname)
+            entryList.SetDirectory(0)
+            entryList.SetName(name)
+            entryList.SetTitle(selection)
+            if os.path.dirname(self.entryListFile): python_mkdir(os.path.dirname(self.entryListFile))
+            elfile = ROOT.TFile(self.entryListFile,'update' if stored==fingerprint else 'recreate')
+            if stored!=fingerprint: ROOT.TNamed('fingerprint',fingerprint).Write()
+            entryList.Write('',ROOT.TObject.kOverwrite)
+            elfile.Close()
+        self.entryListMap[selection] = entryList
+        return entryList
+
     def getXsec(self):
         if not self.initialized: self.__initializeNtuple()
         return self.xsec
@@ -128,75 +206,140 @@ class NtupleWrapper(object):
         if not self.initialized: self.__initializeNtuple()
         return self.intLumi
 
+    def __queue(self,filename,hist,directory):
+        '''Hold a histogram to be written to a file on commit'''
+        if hist.InheritsFrom('TH1'): hist.SetDirectory(0)
+        if filename not in self.pending: self.pending[filename] = {}
+        self.pending[filename]['/'.join([x for x in [directory,hist.GetName()] if x])] = hist
+
     def __write(self,hist,directory=''):
         if self.temp: return
-        self.outfile = ROOT.TFile(self.flat,'update')
-        if not self.outfile.GetDirectory(directory): self.outfile.mkdir(directory)
-        self.outfile.cd('{0}:/{1}'.format(self.flat,directory))
-        hist.Write('',ROOT.TObject.kOverwrite)
-        self.outfile.Close()
+        if self.shiftDirectory: directory = '/'.join([x for x in [self.shiftDirectory,directory] if x])
+        self.__queue(self.flat,hist,directory)
 
     def __writeProjection(self,hist,directory=''):
         if self.temp: return
-        self.outfile = ROOT.TFile(self.proj,'update')
-        if not self.outfile.GetDirectory(directory): self.outfile.mkdir(directory)
-        self.outfile.cd('{0}:/{1}'.format(self.proj,directory))
-        hist.Write('',ROOT.TObject.kOverwrite)
-        self.outfile.Close()
+        self.__queue(self.proj,hist,directory)
+
+    def commit(self):
+        '''Write the pending histograms and the hash manifest, opening each output file once'''
+        filenames = sorted(self.pending)
+        if self.hashesChanged and self.flat not in filenames: filenames += [self.flat]
+        for filename in filenames:
+            self.filePool.release(filename)
+            self.outfile = ROOT.TFile(filename,'update')
+            hists = self.pending.get(filename,{})
+            for path in sorted(hists):
+                directory = os.path.dirname(path)
+                if not self.outfile.GetDirectory(directory): self.outfile.mkdir(directory)
+                self.outfile.cd('{0}:/{1}'.format(filename,directory))
+                hists[path].Write('',ROOT.TObject.kOverwrite)
+            if filename==self.flat and self.hashesChanged:
+                self.outfile.cd()
+                ROOT.TNamed('hashManifest',json.dumps(self.hashes,sort_keys=True)).Write('',ROOT.TObject.kOverwrite)
+                self.hashesChanged = False
+            self.outfile.Close()
+        self.pending = {}
+
+    def __nPending(self):
+        return sum([len(hists) for hists in self.pending.values()])
+
+    def __readPending(self,variable):
+        '''A histogram waiting to be written, proj first as in __read'''
+        for filename in [self.proj,self.flat]:
+            hist = self.pending.get(filename,{}).get(variable,None)
+            if hist:
+                self.j += 1
+                hist = hist.Clone('h_{0}_{1}_{2}'.format(self.sample,variable.replace('/','_'),self.j))
+                if hist.InheritsFrom('TH1'): hist.SetDirectory(0)
+                return hist
+        return 0
+
+    def __readFile(self,filename,variable):
+        '''Read an object from a pooled file, histograms are detached from the file'''
+        infile = self.filePool.get(filename)
+        if not infile: return 0
+        hist = infile.Get(variable)
+        if not hist: return 0
+        self.j += 1
+        name = 'h_{0}_{1}_{2}'.format(self.sample,variable.replace('/','_'),self.j)
+        if hist.InheritsFrom('RooDataSet'): return hist.Clone(name)
+        hist.SetDirectory(0)
+        ROOT.SetOwnership(hist,True)
+        hist.SetName(name)
+        return hist
 
     def __read(self,variable):
         '''Read the histogram from file'''
+        if self.shiftDirectory: variable = '{0}/{1}'.format(self.shiftDirectory,variable)
+        if self.pending:
+            hist = self.__readPending(variable)
+            if hist: return hist
         # attempt to read
         if os.path.isfile(self.proj):
             logging.debug('Reading {} from proj {}'.format(variable,self.proj))
-            infile = ROOT.TFile(self.proj,'read')
-            hist = infile.Get(variable)
-            if hist:
-                self.j += 1
-                hist = hist.Clone('h_{0}_{1}_{2}'.format(self.sample,variable.replace('/','_'),self.j))
-                if hist.InheritsFrom('RooDataSet'): return hist
-                hist.SetDirectory(0)
-                return hist
+            hist = self.__readFile(self.proj,variable)
+            if hist: return hist
         if os.path.isfile(self.flat):
             logging.debug('Reading {} from flat {}'.format(variable,self.flat))
-            infile = ROOT.TFile(self.flat,'read')
-            hist = infile.Get(variable)
-            if hist:
-                self.j += 1
-                hist = hist.Clone('h_{0}_{1}_{2}'.format(self.sample,variable.replace('/','_'),self.j))
-                if hist.InheritsFrom('RooDataSet'): return hist
-                hist.SetDirectory(0)
-                return hist
+            hist = self.__readFile(self.flat,variable)
+            if hist: return hist
             # attempt to project
             #hist = self.__projectChannel(variable,temp=True)
             #if hist:
             #    hist = hist.Clone('h_{0}_{1}'.format(self.sample,variable.replace('/','_')))
             #    hist.SetDirectory(0)
             #    return hist
-        logging.debug('Histogram {0} not found for {1}'.format(variable,self.sample))
+        if self.shiftDirectory:
+            logging.warning('Histogram {0} not found for {1}, the nominal is not flattened with weight shifts'.format(variable,self.sample))
+        else:
+            logging.debug('Histogram {0} not found for {1}'.format(variable,self.sample))
         return 0
 
+    def __readHashDirectory(self,directory,path=''):
+        '''Collect the hashes stored as TNamed under hash/ by earlier versions'''
+        hashes = {}
+        for key in directory.GetListOfKeys():
+            name = '/'.join([x for x in [path,key.GetName()] if x])
+            obj = key.ReadObj()
+            if obj.InheritsFrom('TDirectory'):
+                hashes.update(self.__readHashDirectory(obj,name))
+            else:
+                hashes[name] = obj.GetTitle()
+        return hashes
+
+    def __loadHashes(self):
+        '''Read the hash manifest of the flat file once'''
+        self.hashes = {}
+        self.hashesChanged = False
+        if not os.path.isfile(self.flat): return
+        infile = self.filePool.get(self.flat)
+        if not infile: return
+        manifest = infile.Get('hashManifest')
+        if manifest:
+            self.hashes = json.loads(manifest.GetTitle())
+        elif infile.GetDirectory('hash'):
+            self.hashes = self.__readHashDirectory(infile.GetDirectory('hash'))
+            self.hashesChanged = True
+
     def __checkHash(self,name,directory,strings=[]):
-        'Check the hash for a sample'''
-        if self.temp: return False
+        '''
+        Check the hash for a sample, returns whether it is current and the
+        (key, hash) to store once the histogram is produced.
+        '''
+        if self.temp: return False, None
         if not self.initialized: self.__initializeNtuple()
-        self.outfile = ROOT.TFile(self.flat,'update')
-        hashDirectory = 'hash/{0}'.format(directory)
-        hashObj = self.outfile.Get('{0}/{1}'.format(hashDirectory,name))
-        if not hashObj:
-            hashObj = ROOT.TNamed(name,'')
-        oldHash = hashObj.GetTitle()
-        newHash = self.fileHash + hashString(*strings)
-        if oldHash==newHash:
-            self.outfile.Close()
-            return True
-        else:
-            hashObj.SetTitle(newHash)
-            if not self.outfile.GetDirectory(hashDirectory): self.outfile.mkdir(hashDirectory)
-            self.outfile.cd('{0}:/{1}'.format(self.flat,hashDirectory))
-            hashObj.Write('',ROOT.TObject.kOverwrite)
-            self.outfile.Close()
-            return False
+        if self.hashes is None: self.__loadHashes()
+        key = '/'.join([x for x in [self.shiftDirectory,directory,name] if x])
+        newHash = self.__getFileHash() + hashString(*strings)
+        return self.hashes.get(key,'')==newHash, (key,newHash)
+
+    def __storeHash(self,hashEntry):
+        '''Record the hash of a produced histogram, written on commit'''
+        if hashEntry is None: return
+        key, newHash = hashEntry
+        self.hashes[key] = newHash
+        self.hashesChanged = True
 
     def __checkProjectionHash(self,name,directory,channel='',genchannel=''):
         '''Check hash of projection from histogram.'''
@@ -250,11 +393,11 @@ class NtupleWrapper(object):
         if 'datascale' in params and isData(self.sample): scalefactor += '*{0}'.format(params['datascale'])
         # check if we need to draw the hist, or if the one in the ntuple is the latest
         if 'zVariable' in params: # 3D
-             hashExists = self.__checkHash(histName,directory,strings=[params['zVariable'],params['yVariable'],params['xVariable'],', '.join([str(x) for x in params['xBinning']+params['yBinning']+params['zBinning']]),scalefactor,selection])
+             hashExists, hashEntry = self.__checkHash(histName,directory,strings=[params['zVariable'],params['yVariable'],params['xVariable'],', '.join([str(x) for x in params['xBinning']+params['yBinning']+params['zBinning']]),scalefactor,selection])
         elif 'yVariable' in params: # 2D
-             hashExists = self.__checkHash(histName,directory,strings=[params['yVariable'],params['xVariable'],', '.join([str(x) for x in params['xBinning']+params['yBinning']]),scalefactor,selection])
+             hashExists, hashEntry = self.__checkHash(histName,directory,strings=[params['yVariable'],params['xVariable'],', '.join([str(x) for x in params['xBinning']+params['yBinning']]),scalefactor,selection])
         else: # 1D
-             hashExists = self.__checkHash(histName,directory,strings=[params['xVariable'],', '.join([str(x) for x in params['xBinning']]),scalefactor,selection])
+             hashExists, hashEntry = self.__checkHash(histName,directory,strings=[params['xVariable'],', '.join([str(x) for x in params['xBinning']]),scalefactor,selection])
         if hashExists:
             self.__finish()
             return False
@@ -262,6 +405,19 @@ class NtupleWrapper(object):
         name = histName
         self.j += 1
         tempName = 'h_{0}_{1}_{2}'.format(name,self.sample,self.j)
+        if self.batch is not None: # filled later in a single pass
+            if 'zVariable' in params: # 3D
+                variables = [params['xVariable'],params['yVariable'],params['zVariable']]
+                binning = params['xBinning']+params['yBinning']+params['zBinning']
+            elif 'yVariable' in params: # 2D
+                variables = [params['xVariable'],params['yVariable']]
+                binning = params['xBinning']+params['yBinning']
+            else: # 1D
+                variables = [params['xVariable']]
+                binning = params['xBinning']
+            self.batch.book(tempName,variables,binning,'{0}*({1})'.format(self.__lumiScale(scalefactor),selection))
+            self.batchHists += [(tempName,name,directory,hashEntry)]
+            return True
         if 'zVariable' in params: # 3D
             hist = self.__getHist3D(tempName,selection,scalefactor,params['xVariable'],params['yVariable'],params['zVariable'],params['xBinning'],params['yBinning'],params['zBinning'])
         elif 'yVariable' in params: # 2D
@@ -272,274 +428,159 @@ class NtupleWrapper(object):
         hist.SetName(name)
         # save to file
         self.__write(hist,directory=directory)
+        self.__storeHash(hashEntry)
         return True
 
-    def __getHist1D(self,histName,selection,scalefactor,xVariable,xBinning):
+    def __getFileGroups(self):
+        '''Split the files in at most nWorkers groups of similar size'''
+        n = max(min(self.nWorkers,len(self.files)),1)
+        groups = [[] for i in range(n)]
+        sizes = [0]*n
+        for f in sorted(self.files,key=lambda f: -os.path.getsize(f) if os.path.isfile(f) else 0):
+            i = sizes.index(min(sizes))
+            groups[i] += [f]
+            sizes[i] += os.path.getsize(f) if os.path.isfile(f) else 1
+        return [g for g in groups if g]
+
+    def __runParallel(self,func,names):
+        '''
+        Call func on a chain of each group of files in a forked process and
+        sum the histograms it returns, a dictionary by name.
+        '''
+        groups = self.__getFileGroups()
+        tmpdir = tempfile.mkdtemp()
+        def work(i,files):
+            chain = ROOT.TChain(self.treeName)
+            for f in files: chain.Add(f)
+            hists = func(chain)
+            tfile = ROOT.TFile(os.path.join(tmpdir,'group{0}.root'.format(i)),'recreate')
+            for name in hists:
+                if hists[name]: hists[name].Write(name)
+            tfile.Close()
+        try:
+            runForked(work,[(i,files) for i,files in enumerate(groups)])
+            merged = {}
+            for i in range(len(groups)):
+                tfile = ROOT.TFile.Open(os.path.join(tmpdir,'group{0}.root'.format(i)))
+                for name in names:
+                    hist = tfile.Get(name)
+                    if not hist: continue
+                    if name in merged:
+                        merged[name].Add(hist)
+                    else:
+                        merged[name] = hist.Clone(name)
+                        merged[name].SetDirectory(0)
+                        ROOT.SetOwnership(merged[name],True)
+                tfile.Close()
+        finally:
+            shutil.rmtree(tmpdir)
+        return merged
+
+    def __draw(self,tree,histName,drawString,selectionString):
+        '''Draw a histogram from the tree, or from each group of files in parallel'''
+        def draw(chain):
+            chain.Draw(drawString,selectionString,'goff')
+            return {histName: ROOT.gDirectory.Get(histName)}
+        if self.useProof and len(self.files)>1:
+            return self.__runParallel(draw,[histName]).get(histName,None)
+        return draw(tree)[histName]
+
+    def __lumiScale(self,scalefactor):
+        '''Scale simulation to the integrated luminosity'''
         if not self.initialized: self.__initializeNtuple()
         if not isData(self.sample): scalefactor = '{0}*{1}'.format(scalefactor,float(self.intLumi)/self.sampleLumi) if self.sampleLumi else '0'
+        return scalefactor
+
+    def __getHist1D(self,histName,selection,scalefactor,xVariable,xBinning):
+        if not self.initialized: self.__initializeNtuple()
+        scalefactor = self.__lumiScale(scalefactor)
         binning = xBinning
         tree = self.sampleTree
         if not tree: 
             hist = ROOT.TH1D(histName,histName,*binning)
             return hist
-        # TODO, make sure this is worth it
-        #if self.entryListMap['1'].GetN()<1:
-        #    hist = ROOT.TH1D(histName,histName,*binning)
-        #    return hist
-        #tree.SetEntryList(self.entryListMap['1'])
-        #if selection not in self.entryListMap:
-        #    self.j += 1
-        #    listname = 'selList{0}'.format(self.j)
-        #    tree.Draw('>>{0}'.format(listname),selection,'entrylist')
-        #    skim = ROOT.gDirectory.Get(listname)
-        #    self.entryListMap[selection] = skim
-        #skim = self.entryListMap[selection]
-        #if not skim or skim.GetN()==0:
-        #    return ROOT.TH1D(histName,histName,*binning)
-        #tree.SetEntryList(skim)
+        # only read the events passing the selection
+        entryList = self.__getEntryList(selection)
+        if entryList is not None: tree.SetEntryList(entryList)
         drawString = '{0}>>{1}({2})'.format(xVariable,histName,', '.join([str(x) for x in binning]))
         selectionString = '{0}*({1})'.format(scalefactor,selection)
         #selectionString = '{0}*(1)'.format(scalefactor)
         logging.debug('drawString: {0}'.format(drawString))
         logging.debug('selectionString: {0}'.format(selectionString))
-        tree.Draw(drawString,selectionString,'goff')
-        #tree.SetEntryList(self.entryListMap['1'])
-        if ROOT.gDirectory.Get(histName):
-            hist = ROOT.gDirectory.Get(histName)
-        elif self.useProof:
-            out = self.proof.GetOutputList()
-            hist = out.FindObject(histName)
-        else:
+        hist = self.__draw(tree,histName,drawString,selectionString)
+        if entryList is not None: tree.SetEntryList(0)
+        if not hist:
             hist = ROOT.TH1D(histName,histName,*binning)
         return hist
 
     def __getHist2D(self,histName,selection,scalefactor,xVariable,yVariable,xBinning,yBinning):
         if not self.initialized: self.__initializeNtuple()
-        if not isData(self.sample): scalefactor = '{0}*{1}'.format(scalefactor,float(self.intLumi)/self.sampleLumi) if self.sampleLumi else '0'
+        scalefactor = self.__lumiScale(scalefactor)
         binning = xBinning+yBinning
         tree = self.sampleTree
         if not tree:
             hist = ROOT.TH2D(histName,histName,*binning)
             return hist
-        # TODO, make sure this is worth it
-        #if self.entryListMap['1'].GetN()<1:
-        #    hist = ROOT.TH2D(histName,histName,*binning)
-        #    return hist
-        #tree.SetEntryList(self.entryListMap['1'])
-        #if selection not in self.entryListMap:
-        #    self.j += 1
-        #    listname = 'selList{0}'.format(self.j)
-        #    tree.Draw('>>{0}'.format(listname),selection,'entrylist')
-        #    skim = ROOT.gDirectory.Get(listname)
-        #    self.entryListMap[selection] = skim
-        #skim = self.entryListMap[selection]
-        #if not skim or skim.GetN()==0:
-        #    return ROOT.TH2D(histName,histName,*binning)
-        #tree.SetEntryList(skim)
+        # only read the events passing the selection
+        entryList = self.__getEntryList(selection)
+        if entryList is not None: tree.SetEntryList(entryList)
         drawString = '{0}:{1}>>{2}({3})'.format(yVariable,xVariable,histName,', '.join([str(x) for x in binning]))
         selectionString = '{0}*({1})'.format(scalefactor,selection)
         #selectionString = '{0}*(1)'.format(scalefactor)
         logging.debug('drawString: {0}'.format(drawString))
         logging.debug('selectionString: {0}'.format(selectionString))
-        tree.Draw(drawString,selectionString,'goff')
-        #tree.SetEntryList(self.entryListMap['1'])
-        if ROOT.gDirectory.Get(histName):
-            hist = ROOT.gDirectory.Get(histName)
-        elif self.useProof:
-            out = self.proof.GetOutputList()
-            hist = out.FindObject(histName)
-        else:
+        hist = self.__draw(tree,histName,drawString,selectionString)
+        if entryList is not None: tree.SetEntryList(0)
+        if not hist:
             hist = ROOT.TH2D(histName,histName,*binning)
         return hist
 
     def __getHist3D(self,histName,selection,scalefactor,xVariable,yVariable,zVariable,xBinning,yBinning,zBinning):
         if not self.initialized: self.__initializeNtuple()
-        if not isData(self.sample): scalefactor = '{0}*{1}'.format(scalefactor,float(self.intLumi)/self.sampleLumi) if self.sampleLumi else '0'
+        scalefactor = self.__lumiScale(scalefactor)
         binning = xBinning+yBinning+zBinning
         tree = self.sampleTree
         if not tree:
             hist = ROOT.TH3D(histName,histName,*binning)
             return hist
-        # TODO, make sure this is worth it
-        #if self.entryListMap['1'].GetN()<1:
-        #    hist = ROOT.TH3D(histName,histName,*binning)
-        #    return hist
-        #tree.SetEntryList(self.entryListMap['1'])
-        #if selection not in self.entryListMap:
-        #    self.j += 1
-        #    listname = 'selList{0}'.format(self.j)
-        #    tree.Draw('>>{0}'.format(listname),selection,'entrylist')
-        #    skim = ROOT.gDirectory.Get(listname)
-        #    self.entryListMap[selection] = skim
-        #skim = self.entryListMap[selection]
-        #if not skim or skim.GetN()==0:
-        #    return ROOT.TH3D(histName,histName,*binning)
-        #tree.SetEntryList(skim)
+        # only read the events passing the selection
+        entryList = self.__getEntryList(selection)
+        if entryList is not None: tree.SetEntryList(entryList)
         drawString = '{0}:{1}:{2}>>{3}({4})'.format(zVariable,yVariable,xVariable,histName,', '.join([str(x) for x in binning]))
         selectionString = '{0}*({1})'.format(scalefactor,selection)
         #selectionString = '{0}*(1)'.format(scalefactor)
         logging.debug('drawString: {0}'.format(drawString))
         logging.debug('selectionString: {0}'.format(selectionString))
-        tree.Draw(drawString,selectionString,'goff')
-        #tree.SetEntryList(self.entryListMap['1'])
-        if ROOT.gDirectory.Get(histName):
-            hist = ROOT.gDirectory.Get(histName)
-        elif self.useProof:
-            out = self.proof.GetOutputList()
-            hist = out.FindObject(histName)
-        else:
+        hist = self.__draw(tree,histName,drawString,selectionString)
+        if entryList is not None: tree.SetEntryList(0)
+        if not hist:
             hist = ROOT.TH3D(histName,histName,*binning)
         return hist
 
+    def __getProjector(self,histNd):
+        '''The projector of a histogram, kept while projecting a flattened histogram'''
+        if isinstance(histNd,Projector): return histNd
+        return Projector(histNd)
+
     def __project(self,histName,directory,hist2d,direction,binLabels=[],binRange=[0,-1],temp=False):
         '''Project a 2D histogram onto a 1D histogram.'''
-        hists = ROOT.TList()
-        if direction=='x':
-            binning = [
-                hist2d.GetXaxis().GetNbins(),
-                hist2d.GetXaxis().GetXmin(),
-                hist2d.GetXaxis().GetXmax(),
-            ]
-        else:
-            binning = [
-                hist2d.GetYaxis().GetNbins(),
-                hist2d.GetYaxis().GetXmin(),
-                hist2d.GetYaxis().GetXmax(),
-            ]
-        if binLabels:
-            for label in binLabels:
-                self.j += 1
-                name = 'h_{0}_{1}_{2}'.format(histName,label,self.j)
-                if direction=='x':
-                    binNum = hist2d.GetYaxis().FindBin(label)
-                    hist2d.ProjectionX(name,binNum,binNum,'e')
-                else:
-                    binNum = hist2d.GetXaxis().FindBin(label)
-                    hist2d.ProjectionY(name,binNum,binNum,'e')
-                if ROOT.gDirectory.Get(name):
-                    hist = ROOT.gDirectory.Get(name)
-                    if hist: hists.Add(hist)
-        else:
-            self.j += 1
-            name = 'h_{0}_{1}'.format(histName,self.j)
-            if direction=='x':
-                hist2d.ProjectionX(name,binRange[0],binRange[1],'e')
-            else:
-                hist2d.ProjectionY(name,binRange[0],binRange[1],'e')
-            if ROOT.gDirectory.Get(name):
-                hist = ROOT.gDirectory.Get(name)
-                hists.Add(hist)
-        if hists.IsEmpty():
-            hist = ROOT.TH1D(histName,histName,*binning)
-        else:
-            self.j += 1
-            hist = hists[0].Clone('h_temp_{0}_{1}'.format(histName,self.j))
-            hist.Reset()
-            hist.Merge(hists)
-            hist.SetName(histName)
-            hist.SetTitle(histName)
+        projector = self.__getProjector(hist2d)
+        hist = projector.project(histName,direction,binLabels=[binLabels],binRanges=[binRange])
         if not temp: self.__writeProjection(hist,directory=directory)
         return hist
 
     def __projectFrom3D(self,histName,directory,hist3d,direction,binLabels1=[],binLabels2=[],binRange1=[0,-1],binRange2=[0,-1],temp=False):
         '''Project a 3D histogram onto a 1D histogram.'''
-        hists = ROOT.TList()
-        if direction=='x':
-            binning = [
-                hist3d.GetXaxis().GetNbins(),
-                hist3d.GetXaxis().GetXmin(),
-                hist3d.GetXaxis().GetXmax(),
-            ]
-        elif direction=='y':
-            binning = [
-                hist3d.GetYaxis().GetNbins(),
-                hist3d.GetYaxis().GetXmin(),
-                hist3d.GetYaxis().GetXmax(),
-            ]
-        else:
-            binning = [
-                hist3d.GetZaxis().GetNbins(),
-                hist3d.GetZaxis().GetXmin(),
-                hist3d.GetZaxis().GetXmax(),
-            ]
-        if binLabels1 and binLabels2:
-            for label1 in binLabels1:
-                for label2 in binLabels2:
-                    self.j += 1
-                    name = 'h_{0}_{1}_{2}_{3}'.format(histName,label1,label2,self.j)
-                    if direction=='x':
-                        binNum1 = hist3d.GetYaxis().FindBin(label1)
-                        binNum2 = hist3d.GetZaxis().FindBin(label2)
-                        hist3d.ProjectionX(name,binNum1,binNum1,binNum2,binNum2,'e')
-                    elif direction=='y':
-                        binNum1 = hist3d.GetXaxis().FindBin(label1)
-                        binNum2 = hist3d.GetZaxis().FindBin(label2)
-                        hist3d.ProjectionY(name,binNum1,binNum1,binNum2,binNum2,'e')
-                    else:
-                        binNum1 = hist3d.GetXaxis().FindBin(label1)
-                        binNum2 = hist3d.GetYaxis().FindBin(label2)
-                        hist3d.ProjectionZ(name,binNum1,binNum1,binNum2,binNum2,'e')
-                    if ROOT.gDirectory.Get(name):
-                        hist = ROOT.gDirectory.Get(name)
-                        if hist: hists.Add(hist)
-        elif binLabels1 and not binLabels2:
-            for label1 in binLabels1:
-                self.j += 1
-                name = 'h_{0}_{1}_{2}'.format(histName,label1,self.j)
-                if direction=='x':
-                    binNum1 = hist3d.GetYaxis().FindBin(label1)
-                    hist3d.ProjectionX(name,binNum1,binNum1,binRange2[0],binRange2[1],'e')
-                elif direction=='y':
-                    binNum1 = hist3d.GetXaxis().FindBin(label1)
-                    hist3d.ProjectionY(name,binNum1,binNum1,binRange2[0],binRange2[1],'e')
-                else:
-                    binNum1 = hist3d.GetXaxis().FindBin(label1)
-                    hist3d.ProjectionZ(name,binNum1,binNum1,binRange2[0],binRange2[1],'e')
-                if ROOT.gDirectory.Get(name):
-                    hist = ROOT.gDirectory.Get(name)
-                    if hist: hists.Add(hist)
-        elif not binLabels1 and binLabels2:
-            for label2 in binLabels2:
-                self.j += 1
-                name = 'h_{0}_{1}_{2}'.format(histName,label2,self.j)
-                if direction=='x':
-                    binNum2 = hist3d.GetZaxis().FindBin(label2)
-                    hist3d.ProjectionX(name,binRange1[0],bingRange1[1],binNum2,binNum2,'e')
-                elif direction=='y':
-                    binNum2 = hist3d.GetZaxis().FindBin(label2)
-                    hist3d.ProjectionY(name,binRange1[0],bingRange1[1],binNum2,binNum2,'e')
-                else:
-                    binNum2 = hist3d.GetYaxis().FindBin(label2)
-                    hist3d.ProjectionZ(name,binRange1[0],bingRange1[1],binNum2,binNum2,'e')
-                if ROOT.gDirectory.Get(name):
-                    hist = ROOT.gDirectory.Get(name)
-                    if hist: hists.Add(hist)
-        else:
-            self.j += 1
-            name = 'h_{0}_{1}'.format(histName,self.j)
-            if direction=='x':
-                hist3d.ProjectionX(name,binRange1[0],binRange1[1],binRange2[0],binRange2[1],'e')
-            elif direction=='y':
-                hist3d.ProjectionY(name,binRange1[0],binRange1[1],binRange2[0],binRange2[1],'e')
-            else:
-                hist3d.ProjectionZ(name,binRange1[0],binRange1[1],binRange2[0],binRange2[1],'e')
-            if ROOT.gDirectory.Get(name):
-                hist = ROOT.gDirectory.Get(name)
-                hists.Add(hist)
-        if hists.IsEmpty():
-            hist = ROOT.TH1D(histName,histName,*binning)
-        else:
-            self.j += 1
-            hist = hists[0].Clone('h_temp_{0}_{1}'.format(histName,self.j))
-            hist.Reset()
-            hist.Merge(hists)
-            hist.SetName(histName)
-            hist.SetTitle(histName)
+        projector = self.__getProjector(hist3d)
+        hist = projector.project(histName,direction,binLabels=[binLabels1,binLabels2],binRanges=[binRange1,binRange2])
         if not temp: self.__writeProjection(hist,directory=directory)
         return hist
 
-    def __projectChannel(self,variable,temp=False):
-        '''Project down the 2D channels plot to the desired channels.'''
+    def __projectChannel(self,variable,temp=False,projectors=None):
+        '''
+        Project down the 2D channels plot to the desired channels.
+        The projectors of histograms already read can be passed by name.
+        '''
         components = variable.split('/')
         histName = components[-1]
         if len(components)>2 and components[-2] in self.projections and components[-3] in self.projections: # explicit channel/genchannel
@@ -565,17 +606,25 @@ class NtupleWrapper(object):
         #if passHash: return 0
         # not project
         histNameND = '/'.join([selectionName,histName])
-        histNd = self.__read(histNameND)
+        if projectors and histNameND in projectors:
+            projector = projectors[histNameND]
+            histNd = projector.hist
+        else:
+            histNd = self.__read(histNameND)
+            projector = histNd
         if histNd and histNd.InheritsFrom('TH3'):
             if genchannel:
                 directory = '/'.join([selectionName,channel,genchannel])
-                hist = self.__projectFrom3D(histName,directory,histNd,'x',binLabels1=self.projections[channel],binLabels2=self.projections[genchannel],temp=temp)
+                hist = self.__projectFrom3D(histName,directory,projector,'x',binLabels1=self.projections[channel],binLabels2=self.projections[genchannel],temp=temp)
+            elif 'gen' in channel: # all reconstructed channels of a gen channel
+                directory = '/'.join([selectionName,channel])
+                hist = self.__projectFrom3D(histName,directory,projector,'x',binLabels2=self.projections[channel],temp=temp)
             else:
                 directory = '/'.join([selectionName,channel])
-                hist = self.__projectFrom3D(histName,directory,histNd,'x',binLabels1=self.projections[channel],temp=temp)
+                hist = self.__projectFrom3D(histName,directory,projector,'x',binLabels1=self.projections[channel],temp=temp)
         elif histNd and histNd.InheritsFrom('TH2'):
             directory = '/'.join([selectionName,channel])
-            hist = self.__project(histName,directory,histNd,'x',binLabels=self.projections[channel],temp=temp)
+            hist = self.__project(histName,directory,projector,'x',binLabels=self.projections[channel],temp=temp)
         elif histNd and histNd.InheritsFrom('TH1'): # its a 1d histogram
             hist = histNd
         else: # not a hist
@@ -583,27 +632,36 @@ class NtupleWrapper(object):
         return hist
 
     def __readSkim(self,directory,full=False):
-        '''Read a value from the skim file.'''
-        if not os.path.isfile(self.pickle): return
+        '''Read a value from the skim file, the count store if it exists, otherwise the pickle.'''
         if not self.skimInitialized:
-            with open(self.pickle,'rb') as f:
-                self.skim = pickle.load(f)
+            self.skim = None
+            if os.path.isfile(self.countStore):
+                self.skim = CountStore(self.countStore)
+            elif os.path.isfile(self.pickle):
+                with open(self.pickle,'rb') as f:
+                    self.skim = pickle.load(f)
             self.skimInitialized = True
+        if self.skim is None: return
         components = directory.split('/')
         if components[-1] == 'all': components = components[:-1]
         # first try finding
         key = '/'.join(components)
-        if key in self.skim:
+        entry = self.skim.get(key)
+        if entry is not None:
             if full:
-                return self.skim[key]['val'], self.skim[key]['err2']**0.5, self.skim[key]['count']
+                return entry['val'], entry['err2']**0.5, entry['count']
             else:
-                return self.skim[key]['val'], self.skim[key]['err2']**0.5
+                return entry['val'], entry['err2']**0.5
         #logging.warning('Unrecognized selection {0}'.format(directory))
         if full:
             return 0.,0.,0
         else:
             return 0.,0.
 
+    def getFilePoolStats(self):
+        '''Statistics of the file pool shared by all wrappers'''
+        return self.filePool.stats()
+
     def getHist2D(self,variable):
         '''Get a histogram'''
         hist = self.__read(variable)
@@ -638,28 +696,70 @@ class NtupleWrapper(object):
         if count is not None: return count
         return self.__read('{0}/count'.format(directory))
 
+    def getJointScan(self,scanName,directory):
+        '''Get a joint scan from the skim, None if the skim has no such scan'''
+        if not self.scansInitialized:
+            self.scans = {}
+            if os.path.isfile(self.scanFile):
+                with open(self.scanFile,'rb') as f:
+                    self.scans = pickle.load(f)
+            self.scansInitialized = True
+        if scanName not in self.scans: return None
+        components = directory.split('/')
+        if components[-1] == 'all': components = components[:-1]
+        scan = JointScan(self.scans[scanName]['axes'])
+        scan.merge(self.scans[scanName]['bins'].get('/'.join(components),{}))
+        return scan
+
+    def __getTempKey(self,selection,scalefactor,variables,binnings):
+        '''Hash of everything that determines a temporary histogram'''
+        fingerprint = hashString(self.__getFileHash(),*self.files)
+        binning = '; '.join([', '.join([str(x) for x in b]) for b in binnings])
+        return hashString(fingerprint,self.treeName,':'.join(variables),binning,self.__lumiScale(scalefactor),selection)
+
+    def __getTempHist(self,tempname,selection,scalefactor,variables,binnings):
+        '''Get a temporary histogram from the cache, or draw and cache it'''
+        if not self.initialized: self.__initializeNtuple()
+        if self.tempCache is None or not self.sampleTree:
+            key = None
+        else:
+            key = self.__getTempKey(selection,scalefactor,variables,binnings)
+            hist = self.tempCache.get(key,tempname)
+            if hist: return hist
+        if len(variables)==2:
+            hist = self.__getHist2D(tempname,selection,scalefactor,variables[0],variables[1],binnings[0],binnings[1])
+        else:
+            hist = self.__getHist1D(tempname,selection,scalefactor,variables[0],binnings[0])
+        hist.SetDirectory(0)
+        ROOT.SetOwnership(hist,True)
+        if key is not None: self.tempCache.put(key,hist)
+        return hist
+
     def getTempHist(self,histName,selection,scalefactor,variable,binning):
         '''Get a histogram that is not saved in flat ntuple.'''
         self.j += 1
         tempname = '{0}_{1}_{2}_{3}'.format(histName,self.analysis,self.sample,self.j)
-        return self.__getHist1D(tempname,selection,scalefactor,variable,binning)
+        return self.__getTempHist(tempname,selection,scalefactor,[variable],[binning])
 
     def getTempHist2D(self,histName,selection,scalefactor,xVariable,yVariable,xBinning,yBinning):
         '''Get a histogram that is not saved in flat ntuple.'''
         self.j += 1
         tempname = '{0}_{1}_{2}_{3}'.format(histName,self.analysis,self.sample,self.j)
-        return self.__getHist2D(tempname,selection,scalefactor,xVariable,yVariable,xBinning,yBinning)
+        return self.__getTempHist(tempname,selection,scalefactor,[xVariable,yVariable],[xBinning,yBinning])
 
     def getTempCount(self,selection,scalefactor):
         '''Get a histogram that is a single bin of counts with statistical error'''
         self.j += 1
         tempname = 'count_{0}_{1}_{2}'.format(self.analysis,self.sample,self.j)
-        hist = self.__getHist1D(tempname,selection,scalefactor,'1',[1,0,2])
+        hist = self.__getTempHist(tempname,selection,scalefactor,['1'],[[1,0,2]])
         hist.SetTitle('count')
         return hist
 
-    def flatten(self,histName,selectionName):
-        '''Flatten a histogram'''
+    def flatten(self,histName,selectionName,commit=True):
+        '''
+        Flatten a histogram, commit=False leaves it to be written by a later
+        commit unless more than maxPending histograms are waiting.
+        '''
         self.temp = False
         if histName not in self.histParams:
             logging.error('Unrecognized histogram {0}'.format(histName))
@@ -670,21 +770,104 @@ class NtupleWrapper(object):
         selection = self.selections[selectionName]['args'][0]
         kwargs = self.selections[selectionName]['kwargs']
         updated = self.__flatten(selectionName,histName,selection,params,**kwargs)
-        # project stuff
-        if updated and len(self.projections.keys())>1: # if it changed and there are channels to project
+        if updated and self.batch is None:
+            self.__projectAll(histName,selectionName)
+            if commit or self.__nPending()>self.maxPending: self.commit()
+        self.temp = True
+        return updated
+
+    def flattenAll(self,jobs):
+        '''
+        Flatten a list of (histName, selectionName) reading the ntuple once.
+
+        The histograms that need to be updated are booked and filled in a
+        single event loop, then written and projected as in flatten.
+        '''
+        self.batch = BatchDraw(self.getTree())
+        self.batchHists = []
+        updated = []
+        try:
+            for histName, selectionName in jobs:
+                if self.flatten(histName,selectionName): updated += [(histName,selectionName)]
+            logging.info('Filling {0} histograms in one pass over {1}'.format(len(self.batch),self.sample))
+            if self.useProof and len(self.files)>1:
+                batch = self.batch
+                hists = self.__runParallel(lambda chain: batch.clone(chain).run(),[tempName for tempName, name, directory, hashEntry in self.batchHists])
+                for tempName, name, directory, hashEntry in self.batchHists:
+                    if tempName not in hists: hists[tempName] = batch.clone(None).run()[tempName]
+            else:
+                hists = self.batch.run()
+        finally:
+            self.batch = None
+        self.temp = False
+        for tempName, name, directory, hashEntry in self.batchHists:
+            hist = hists[tempName]
+            hist.SetTitle(name)
+            hist.SetName(name)
+            self.__write(hist,directory=directory)
+            self.__storeHash(hashEntry)
+        self.batchHists = []
+        for histName, selectionName in updated:
+            self.__projectAll(histName,selectionName)
+        self.commit()
+        self.temp = True
+
+    def __projectAll(self,histName,selectionName):
+        '''
+        Project a flattened histogram to the channels.
+        The histogram is read once and all projections are slices of its bin arrays.
+        '''
+        if len(self.projections.keys())>1: # if there are channels to project
             variable = '/'.join([selectionName,histName])
-            self.__projectChannel(variable)
+            histNd = self.__read(variable)
+            if not histNd or histNd.GetDimension()<2: return
+            projectors = {variable: Projector(histNd)}
+            self.__projectChannel(variable,projectors=projectors)
             chans = [x for x in self.projections.keys() if 'gen' not in x]
             genchans = [x for x in self.projections.keys() if 'gen' in x]
-            genchans = [] # block genchans unless i really want it
+            if not self.genProjections or not histNd.InheritsFrom('TH3'): genchans = []
             for chan in chans:
                 variable = '/'.join([selectionName,chan,histName])
-                self.__projectChannel(variable)
+                self.__projectChannel(variable,projectors=projectors)
                 for genchan in genchans:
                     variable = '/'.join([selectionName,chan,genchan,histName])
-                    self.__projectChannel(variable)
+                    self.__projectChannel(variable,projectors=projectors)
             for genchan in genchans:
                 variable = '/'.join([selectionName,genchan,histName])
-            self.__projectChannel(variable)
-        self.temp = True
+                self.__projectChannel(variable,projectors=projectors)
+
+
+
+_wrappers = {}
+
+def getNtupleWrapper(analysis,sample,**kwargs):
+    '''The NtupleWrapper shared by everything in the process using the same arguments'''
+    key = (analysis,sample,repr(sorted(kwargs.items())))
+    if key not in _wrappers:
+        _wrappers[key] = NtupleWrapper(analysis,sample,**kwargs)
+        ROOT.gROOT.cd()
+    return _wrappers[key]
+
+class LazyNtupleWrapper(object):
+    '''
+    Stand in for an NtupleWrapper that is only created on first use.
+
+    Attribute access is forwarded to the shared wrapper of getNtupleWrapper,
+    so samples and shifts that are never read cost nothing.
+    '''
+
+    def __init__(self,analysis,sample,**kwargs):
+        self._args = (analysis,sample)
+        self._kwargs = kwargs
+        self._wrapper = None
+
+    def isCreated(self):
+        return self._wrapper is not None
+
+    def wrapper(self):
+        if self._wrapper is None: self._wrapper = getNtupleWrapper(*self._args,**self._kwargs)
+        return self._wrapper
 
+    def __getattr__(self,name):
+        if name.startswith('_'): raise AttributeError(name)
+        return getattr(self.wrapper(),name)
@@ -9,7 +9,7 @@ import ROOT
 ROOT.gROOT.SetBatch(ROOT.kTRUE)
 
 from DevTools.Plotter.PlotterBase import PlotterBase
-from DevTools.Plotter.NtupleWrapper import NtupleWrapper
+from DevTools.Plotter.NtupleWrapper import LazyNtupleWrapper
 from DevTools.Plotter.utilities import getLumi, isData
 from DevTools.Plotter.style import getStyle
 from DevTools.Utilities.utilities import *
@@ -75,14 +75,13 @@ class Plotter(PlotterBase):
         analysis = kwargs.pop('analysis',self.analysis)
         if analysis not in self.sampleFiles: self.sampleFiles[analysis] = {}
         if sampleName not in self.sampleFiles[analysis]:
-            self.sampleFiles[analysis][sampleName] = NtupleWrapper(analysis,sampleName,new=self.new,**kwargs)
-            ROOT.gROOT.cd()
+            self.sampleFiles[analysis][sampleName] = LazyNtupleWrapper(analysis,sampleName,new=self.new,**kwargs)
             for s in self.shifts:
                 for d in ['Up','Down']:
                     if s+d not in self.shiftFiles: self.shiftFiles[s+d] = {}
                     if analysis not in self.shiftFiles[s+d]: self.shiftFiles[s+d][analysis] = {}
                     if sampleName not in self.shiftFiles[s+d][analysis]:
-                        self.shiftFiles[s+d][analysis][sampleName] =  NtupleWrapper(analysis,sampleName,new=self.new,shift=s+d,**kwargs)
+                        self.shiftFiles[s+d][analysis][sampleName] = LazyNtupleWrapper(analysis,sampleName,new=self.new,shift=s+d,**kwargs)
 
     def setSelectionMap(self,selMap):
         '''Set a map of per sample selections.'''
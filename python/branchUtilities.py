@@ -0,0 +1,135 @@
+'''
+Utilities to find and read only the branches an analysis uses.
+'''
+import os
+import re
+import sys
+import json
+import inspect
+import logging
+
+import ROOT
+
+from DevTools.Plotter.utilities import hashFile, python_mkdir, getBranchJson
+
+
+class DisabledBranchError(Exception):
+    '''A branch disabled by pruneBranches was read'''
+    pass
+
+
+class TracingRow(object):
+    '''Wrap a row and record which attributes are read'''
+    __slots__ = ['_row','_used']
+
+    def __init__(self,row,used):
+        self._row = row
+        self._used = used
+
+    def __getattr__(self,name):
+        val = getattr(self._row,name)
+        self._used.add(name)
+        return val
+
+
+class PrunedRow(object):
+    '''
+    Wrap a row of a pruned tree and fail when a disabled branch is read,
+    PyROOT would return the stale value of the last entry read.
+    '''
+    __slots__ = ['_row','_disabled']
+
+    def __init__(self,row,disabled):
+        self._row = row
+        self._disabled = disabled
+
+    def __getattr__(self,name):
+        if name in self._disabled:
+            raise DisabledBranchError('Branch {0} was not found when probing the branches, run without pruneBranches or extend the probe'.format(name))
+        return getattr(self._row,name)
+
+
+def getCodeHash(obj):
+    '''Hash the source of all loaded DevTools modules an object could depend on'''
+    fnames = set()
+    for cls in type(obj).__mro__:
+        if cls is object: continue
+        try:
+            fnames.add(inspect.getsourcefile(cls))
+        except TypeError:
+            pass
+    for name, module in sys.modules.items():
+        if not module or not name.startswith('DevTools'): continue
+        fname = getattr(module,'__file__','')
+        if fname.endswith('.pyc'): fname = fname[:-1]
+        if fname.endswith('.py'): fnames.add(fname)
+    return hashFile(*sorted([f for f in fnames if f and os.path.exists(f)]))
+
+def getStaticBranches(obj):
+    '''Attributes accessed as row.name in the source of an object'''
+    names = set()
+    for cls in type(obj).__mro__:
+        if cls is object: continue
+        try:
+            source = inspect.getsource(cls)
+        except (TypeError,IOError):
+            continue
+        names.update(re.findall(r'\brow\.(\w+)',source))
+    return names
+
+def getTreeBranches(tree):
+    return set([b.GetName() for b in tree.GetListOfBranches()])
+
+def getDisabledBranches(tree):
+    '''The top level branches of a tree that are not read'''
+    return frozenset([b for b in getTreeBranches(tree) if not tree.GetBranchStatus(b)])
+
+def readBranchCache(analysis,codeHash,key):
+    fname = getBranchJson(analysis,codeHash)
+    if not os.path.exists(fname): return None
+    with open(fname,'r') as f:
+        cache = json.load(f)
+    return cache.get(key,None)
+
+def writeBranchCache(analysis,codeHash,key,result):
+    fname = getBranchJson(analysis,codeHash)
+    python_mkdir(os.path.dirname(fname))
+    cache = {}
+    if os.path.exists(fname):
+        with open(fname,'r') as f:
+            cache = json.load(f)
+    cache[key] = result
+    with open(fname,'w') as f:
+        f.write(json.dumps(cache, indent=4, sort_keys=True))
+
+def probeBranches(tree,action,nEntries,funcs=[]):
+    '''
+    Run action on the first nEntries of a tree and return the branches read
+    and the bytes read per entry with all branches enabled.
+    The extra funcs are evaluated on every entry so that branches only used
+    when a selection passes are found.
+    '''
+    used = set()
+    bytesStart = ROOT.TFile.GetFileBytesRead()
+    n = 0
+    for row in tree:
+        if n>=nEntries: break
+        n += 1
+        traced = TracingRow(row,used)
+        action(traced)
+        for func in funcs:
+            try:
+                func(traced)
+            except Exception:
+                pass
+    bytesRead = ROOT.TFile.GetFileBytesRead()-bytesStart
+    return used, float(bytesRead)/n if n else 0.
+
+def pruneBranches(tree,branches,cacheSize=30*1024*1024):
+    '''Only read the given branches, all of them through the TTreeCache'''
+    tree.SetBranchStatus('*',0)
+    tree.SetCacheSize(cacheSize)
+    for b in branches:
+        tree.SetBranchStatus(b,1)
+        tree.AddBranchToCache(b,True)
+    tree.StopCacheLearningPhase()
@@ -0,0 +1,172 @@
+'''
+Utilities to buffer histogram and dataset fills and pass them to ROOT in bulk.
+'''
+import logging
+from array import array
+
+import ROOT
+
+
+class FillBuffer(object):
+    '''
+    Collect the fills of a histogram and pass them to ROOT with FillN.
+
+    Accepts the same Fill(x,w) or Fill(x,y,w) calls as the histogram.
+    Labelled (string) values can not be buffered and are filled directly.
+    '''
+    __slots__ = ['hist','size','n','x','y','w']
+
+    def __init__(self,hist,size):
+        self.hist = hist
+        self.size = size
+        self.n = 0
+        self.x = array('d',[0.])*size
+        self.y = array('d',[0.])*size if hist.GetDimension()==2 else None
+        self.w = array('d',[0.])*size
+
+    def Fill(self,*args):
+        for val in args[:-1]:
+            if isinstance(val,basestring):
+                self.hist.Fill(*args)
+                return
+        n = self.n
+        if self.y is None:
+            self.x[n], self.w[n] = args
+        else:
+            self.x[n], self.y[n], self.w[n] = args
+        self.n = n+1
+        if self.n==self.size: self.flush()
+
+    def flush(self):
+        if not self.n: return
+        if self.y is None:
+            self.hist.FillN(self.n,self.x,self.w)
+        else:
+            self.hist.FillN(self.n,self.x,self.y,self.w)
+        self.n = 0
+
+    def nbytes(self):
+        return self.size*8*(3 if self.y is not None else 2)
+
+
+class FillBufferPool(object):
+    '''
+    The fill buffers of a set of histograms.
+
+    Buffers are allocated when a histogram is first requested. Once the
+    buffers would use more than maxMemory bytes, further histograms are
+    filled directly. A size of 0 disables buffering.
+    '''
+
+    def __init__(self,size=1000,maxMemory=100*1024*1024):
+        self.size = size
+        self.maxMemory = maxMemory
+        self.memory = 0
+        self.buffers = {}
+        self.warned = False
+
+    def get(self,name,hist):
+        '''Return the object to fill for a histogram'''
+        if not self.size: return hist
+        if name not in self.buffers:
+            buf = FillBuffer(hist,self.size)
+            if self.memory+buf.nbytes()>self.maxMemory:
+                if not self.warned:
+                    logging.warning('Fill buffers reached {0:.1f} MB, remaining histograms are filled directly'.format(self.memory/1024./1024.))
+                    self.warned = True
+                return hist
+            self.memory += buf.nbytes()
+            self.buffers[name] = buf
+        return self.buffers[name]
+
+    def flush(self):
+        '''Pass all buffered fills to the histograms'''
+        for name in self.buffers:
+            self.buffers[name].flush()
+
+
+def declareDatasetFill():
+    '''Compile the loop adding buffered entries to a RooDataSet'''
+    if hasattr(ROOT,'fillBufferedDataset'): return
+    ROOT.RooDataSet # load RooFit
+    ROOT.gInterpreter.Declare('''
+#include "RooDataSet.h"
+#include "RooRealVar.h"
+#include "RooArgSet.h"
+void fillBufferedDataset(RooDataSet& ds, const RooArgSet& vars, RooRealVar& x, RooRealVar& w, int n, const double* xs, const double* ws) {
+  for (int i=0; i<n; ++i) {
+    w.setVal(ws[i]);
+    x.setVal(xs[i]);
+    ds.add(vars);
+  }
+}
+void fillBufferedDataset(RooDataSet& ds, const RooArgSet& vars, RooRealVar& x, RooRealVar& y, RooRealVar& w, int n, const double* xs, const double* ys, const double* ws) {
+  for (int i=0; i<n; ++i) {
+    w.setVal(ws[i]);
+    x.setVal(xs[i]);
+    y.setVal(ys[i]);
+    ds.add(vars);
+  }
+}
+''')
+
+
+class DatasetBuffer(object):
+    '''
+    Collect the entries of a RooDataSet and add them in bulk.
+
+    Accepts Fill(x,w) or Fill(x,y,w). The entries are added in the same way
+    as setVal and RooDataSet.add, so values are clipped to the variable ranges.
+    '''
+    __slots__ = ['dataset','xVar','yVar','wVar','vars','maxSize','x','y','w']
+
+    def __init__(self,dataset,xVar,wVar,yVar=None,maxSize=1000000):
+        self.dataset = dataset
+        self.xVar = xVar
+        self.yVar = yVar
+        self.wVar = wVar
+        self.vars = ROOT.RooArgSet(xVar,yVar,wVar) if yVar is not None else ROOT.RooArgSet(xVar,wVar)
+        self.maxSize = maxSize
+        self.x = array('d')
+        self.y = array('d') if yVar is not None else None
+        self.w = array('d')
+
+    def Fill(self,*args):
+        if self.y is None:
+            x, w = args
+        else:
+            x, y, w = args
+            self.y.append(y)
+        self.x.append(x)
+        self.w.append(w)
+        if len(self.x)>=self.maxSize: self.flush()
+
+    def flush(self):
+        if not self.x: return
+        declareDatasetFill()
+        if self.y is None:
+            ROOT.fillBufferedDataset(self.dataset,self.vars,self.xVar,self.wVar,len(self.x),self.x,self.w)
+        else:
+            ROOT.fillBufferedDataset(self.dataset,self.vars,self.xVar,self.yVar,self.wVar,len(self.x),self.x,self.y,self.w)
+            self.y = array('d')
+        self.x = array('d')
+        self.w = array('d')
+
+
+class DatasetCollector(object):
+    '''The dataset buffers of a set of RooDataSets'''
+
+    def __init__(self,maxSize=1000000):
+        self.maxSize = maxSize
+        self.buffers = {}
+
+    def get(self,name,dataset,xVar,wVar,yVar=None):
+        '''Return the object to fill for a dataset'''
+        if name not in self.buffers:
+            self.buffers[name] = DatasetBuffer(dataset,xVar,wVar,yVar,maxSize=self.maxSize)
+        return self.buffers[name]
+
+    def flush(self):
+        '''Add all collected entries to the datasets'''
+        for name in self.buffers:
+            self.buffers[name].flush()
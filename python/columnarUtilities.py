@@ -0,0 +1,114 @@
+'''
+Utilities for processing ntuples in columnar chunks.
+'''
+import logging
+
+try:
+    import numpy as np
+    from root_numpy import tree2array, fill_hist
+    hasColumnar = True
+except:
+    hasColumnar = False
+
+
+class ChunkRow(object):
+    '''A single entry of a chunk, accessed like a PyROOT row'''
+    __slots__ = ['_chunk','_index']
+
+    def __init__(self,chunk,index):
+        self._chunk = chunk
+        self._index = index
+
+    def __getattr__(self,name):
+        return _item(getattr(self._chunk,name)[self._index])
+
+
+class Chunk(object):
+    '''A range of entries of a tree stored as numpy arrays'''
+
+    def __init__(self,tree,start,stop,branches=None):
+        self.start = start
+        self.stop = stop
+        self.data = tree2array(tree,branches=branches,start=start,stop=stop)
+        self.size = len(self.data)
+        self.columns = {}
+        self.cache = {}
+
+    def __len__(self):
+        return self.size
+
+    def __getattr__(self,name):
+        if name in ('data','columns','cache'): raise AttributeError(name)
+        if name not in self.columns:
+            if name not in self.data.dtype.names: raise AttributeError(name)
+            # promote to the precision PyROOT uses for a row
+            col = self.data[name]
+            if col.dtype.kind=='f': col = col.astype(np.float64)
+            elif col.dtype.kind in 'iu': col = col.astype(np.int64)
+            self.columns[name] = col
+        return self.columns[name]
+
+    def row(self,index):
+        return ChunkRow(self,index)
+
+    def rows(self):
+        for i in xrange(self.size):
+            yield ChunkRow(self,i)
+
+
+def _same(a,b):
+    try:
+        return a==b or (a!=a and b!=b)
+    except:
+        return False
+
+def _item(val):
+    return val.item() if hasattr(val,'item') else val
+
+def evaluate(func,chunk,key=None,nCheck=32):
+    '''
+    Evaluate a per row function on a whole chunk.
+
+    The function is first called with the chunk itself. The result is
+    checked against nCheck entries spread over the chunk evaluated as rows,
+    and if any differs the function is evaluated entry by entry instead.
+    If a key is given the result is cached on the chunk.
+    '''
+    if key is not None and key in chunk.cache: return chunk.cache[key]
+    if not chunk.size: return np.array([])
+    checks = sorted(set(np.linspace(0,chunk.size-1,min(nCheck,chunk.size)).astype(int).tolist()))
+    refs = dict([(i,func(chunk.row(i))) for i in checks])
+    try:
+        vals = func(chunk)
+        if np.isscalar(vals): vals = np.full(chunk.size,vals,dtype=type(vals) if not isinstance(vals,basestring) else object)
+        vals = np.asarray(vals)
+        if vals.shape!=(chunk.size,) or not all([_same(_item(vals[i]),refs[i]) for i in checks]):
+            raise ValueError('Result does not vectorize')
+    except Exception:
+        vals = np.array([refs[i] if i in refs else func(row) for i,row in enumerate(chunk.rows())])
+    if key is not None: chunk.cache[key] = vals
+    return vals
+
+def allOf(masks):
+    '''Combine a list of boolean arrays'''
+    return np.logical_and.reduce([np.asarray(m,dtype=bool) for m in masks])
+
+def iterateChunks(tree,chunkSize,branches=None,start=0,stop=None):
+    '''Iterate over a tree in chunks of entries'''
+    if stop is None: stop = tree.GetEntries()
+    for first in xrange(start,stop,chunkSize):
+        yield Chunk(tree,first,min(first+chunkSize,stop),branches=branches)
+
+def fillArrays(hist,xvals,weights,yvals=None):
+    '''Bulk fill a histogram, falls back to single fills for labelled bins'''
+    if not len(xvals): return
+    if xvals.dtype.kind in 'OSU' or (yvals is not None and yvals.dtype.kind in 'OSU'):
+        if yvals is None:
+            for x,w in zip(xvals,weights): hist.Fill(x,w)
+        else:
+            for x,y,w in zip(xvals,yvals,weights): hist.Fill(x,y,w)
+        return
+    if yvals is None:
+        fill_hist(hist,xvals.astype(np.float64),weights=weights.astype(np.float64))
+    else:
+        fill_hist(hist,np.column_stack([xvals,yvals]).astype(np.float64),weights=weights.astype(np.float64))
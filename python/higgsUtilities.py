@@ -1,4 +1,5 @@
 from itertools import product, combinations_with_replacement
+from bisect import bisect_left, bisect_right
 import numpy as np
 from DevTools.Utilities.utilities import ZMASS, getCMSSWVersion
 
@@ -595,67 +596,147 @@ for sigMap in sigMaps:
 #    },
 #}
 
-def getSelectionMap(analysis,mass):
-    if analysis=='Hpp3l':
-        cutRegions = {
-            0: {
-                #'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hm1_pt)>1.38*mass-94,
-                'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hm1_pt)>min([0.5*mass+100,500]),
-                'zveto': lambda row: abs(row.z_mass-ZMASS)>10,
-                'met'  : lambda row: True,
-                'dr'   : lambda row: True, #row.hpp_deltaR<2.9,
-                'mass' : lambda row: row.hpp_mass>0.9*mass and row.hpp_mass<1.1*mass,
-            },
-            1: {
-                #'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hm1_pt)>1.07*mass+36,
-                'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hm1_pt)>min([mass+75,500]),
-                'zveto': lambda row: abs(row.z_mass-ZMASS)>10,
-                'met'  : lambda row: row.met_pt>80,
-                'dr'   : lambda row: row.hpp_deltaR<3, #2.9,
-                'mass' : lambda row: row.hpp_mass>0.4*mass and row.hpp_mass<1.1*mass,
-            },
-            2: {
-                #'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hm1_pt)>1.24*mass-14,
-                'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hm1_pt)>min([0.8*mass+125,500]),
-                'zveto': lambda row: abs(row.z_mass-ZMASS)>10,
-                'met'  : lambda row: row.met_pt>80,
-                'dr'   : lambda row: row.hpp_deltaR<3, #2.5,
-                'mass' : lambda row: row.hpp_mass>0.3*mass and row.hpp_mass<1.1*mass,
-            },
-        }
-    elif analysis=='Hpp4l':
-        cutRegions = {
-            0: {
-                #'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt)>1.23*mass+54,
-                'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt)>min([0.8*mass+75,500]),
-                'zveto': lambda row: abs(row.z_mass-ZMASS)>10,
-                'drpp' : lambda row: True,
-                'drmm' : lambda row: True,
-                'hpp'  : lambda row: row.hpp_mass>0.9*mass and row.hpp_mass<1.1*mass,
-                'hmm'  : lambda row: row.hmm_mass>0.9*mass and row.hmm_mass<1.1*mass,
-            },
-            1: {
-                #'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt)>1.30*mass-34,
-                'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt)>min([0.3*mass+200,500]),
-                'zveto': lambda row: abs(row.z_mass-ZMASS)>10,
-                'drpp' : lambda row: True, #row.hpp_deltaR<3.3,
-                'drmm' : lambda row: True, #row.hmm_deltaR<3.3,
-                'hpp'  : lambda row: row.hpp_mass>0.4*mass and row.hpp_mass<1.1*mass,
-                'hmm'  : lambda row: row.hmm_mass>0.4*mass and row.hmm_mass<1.1*mass,
-            },
-            2: {
-                #'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt)>0.56*mass+194,
-                'st'   : lambda row: (row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt)>min([0.25*mass+200,500]),
-                'zveto': lambda row: abs(row.z_mass-ZMASS)>10,
-                'drpp' : lambda row: True, #row.hpp_deltaR<2.5,
-                'drmm' : lambda row: True, #row.hmm_deltaR<2.5,
-                'hpp'  : lambda row: row.hpp_mass>0.3*mass and row.hpp_mass<1.1*mass,
-                'hmm'  : lambda row: row.hmm_mass>0.3*mass and row.hmm_mass<1.1*mass,
-            },
-        }
+# mass dependent cuts: st > min(a*mass+b,cap) and lo*mass < mass variable < hi*mass
+# mass independent cuts: zveto > value, met > value, dr < value (None always passes)
+selectionParams = {
+    'Hpp3l': {
+        0: {
+            'st'   : (0.5,100,500), # 1.38*mass-94
+            'zveto': 10,
+            'met'  : None,
+            'dr'   : None, # 2.9
+            'mass' : (0.9,1.1),
+        },
+        1: {
+            'st'   : (1.,75,500), # 1.07*mass+36
+            'zveto': 10,
+            'met'  : 80,
+            'dr'   : 3, # 2.9
+            'mass' : (0.4,1.1),
+        },
+        2: {
+            'st'   : (0.8,125,500), # 1.24*mass-14
+            'zveto': 10,
+            'met'  : 80,
+            'dr'   : 3, # 2.5
+            'mass' : (0.3,1.1),
+        },
+    },
+    'Hpp4l': {
+        0: {
+            'st'   : (0.8,75,500), # 1.23*mass+54
+            'zveto': 10,
+            'drpp' : None,
+            'drmm' : None,
+            'hpp'  : (0.9,1.1),
+            'hmm'  : (0.9,1.1),
+        },
+        1: {
+            'st'   : (0.3,200,500), # 1.30*mass-34
+            'zveto': 10,
+            'drpp' : None, # 3.3
+            'drmm' : None, # 3.3
+            'hpp'  : (0.4,1.1),
+            'hmm'  : (0.4,1.1),
+        },
+        2: {
+            'st'   : (0.25,200,500), # 0.56*mass+194
+            'zveto': 10,
+            'drpp' : None, # 2.5
+            'drmm' : None, # 2.5
+            'hpp'  : (0.3,1.1),
+            'hmm'  : (0.3,1.1),
+        },
+    },
+}
 
-    else:
-        cutRegions = {}
+selectionVariables = {
+    'Hpp3l': {
+        'st'   : lambda row: row.hpp1_pt+row.hpp2_pt+row.hm1_pt,
+        'mass' : lambda row: row.hpp_mass,
+    },
+    'Hpp4l': {
+        'st'   : lambda row: row.hpp1_pt+row.hpp2_pt+row.hmm1_pt+row.hmm2_pt,
+        'hpp'  : lambda row: row.hpp_mass,
+        'hmm'  : lambda row: row.hmm_mass,
+    },
+}
+
+# variable and whether it must be above the value
+selectionCuts = {
+    'zveto': (lambda row: abs(row.z_mass-ZMASS), True),
+    'met'  : (lambda row: row.met_pt, True),
+    'dr'   : (lambda row: row.hpp_deltaR, False),
+    'drpp' : (lambda row: row.hpp_deltaR, False),
+    'drmm' : (lambda row: row.hmm_deltaR, False),
+}
+
+class MassSelection(object):
+    '''
+    The selection of every mass point at once.
+
+    The st thresholds and mass window edges of the sorted masses are
+    precomputed, so each cut places an event with a bisection instead of
+    being evaluated for each mass. passing returns the range (first,last)
+    of the indices of the masses passing a cut, st optionally gives the
+    sum of lepton pts.
+    '''
+    def __init__(self, analysis, masses, st=None):
+        self.analysis = analysis
+        self.masses = sorted(masses)
+        self.index = dict([(mass,i) for i,mass in enumerate(self.masses)])
+        self.params = selectionParams[analysis]
+        self.variables = dict(selectionVariables[analysis])
+        if st is not None: self.variables['st'] = st
+        self.cuts = [cut for cut in self.params[0]]
+        self.edges = {}
+        for nTaus in self.params:
+            self.edges[nTaus] = {}
+            for cut, param in self.params[nTaus].iteritems():
+                if cut=='st':
+                    a, b, cap = param
+                    self.edges[nTaus][cut] = [min([a*mass+b,cap]) for mass in self.masses]
+                elif cut in self.variables:
+                    lo, hi = param
+                    self.edges[nTaus][cut] = ([lo*mass for mass in self.masses],[hi*mass for mass in self.masses])
+    def passing(self, row, nTaus, cut):
+        n = len(self.masses)
+        if cut=='st':
+            return 0, bisect_left(self.edges[nTaus][cut],self.variables[cut](row))
+        if cut in self.variables:
+            val = self.variables[cut](row)
+            lo, hi = self.edges[nTaus][cut]
+            return bisect_right(hi,val), bisect_left(lo,val)
+        param = self.params[nTaus][cut]
+        if param is None: return 0, n
+        variable, above = selectionCuts[cut]
+        val = variable(row)
+        return (0, n) if (val>param if above else val<param) else (0, 0)
+    def evaluate(self, row):
+        '''The ranges of masses passing each cut of each tau category'''
+        return dict([(nTaus,dict([(cut,self.passing(row,nTaus,cut)) for cut in self.cuts])) for nTaus in self.params])
+    def select(self, passing, mass):
+        '''Whether a mass passes each cut of each tau category, from evaluate'''
+        i = self.index[mass]
+        return dict([(nTaus,dict([(cut,first<=i<last) for cut,(first,last) in passing[nTaus].iteritems()])) for nTaus in passing])
+    def passes(self, row, nTaus, cut, i):
+        first, last = self.passing(row,nTaus,cut)
+        return first<=i<last
+    def getCut(self, nTaus, cut, mass):
+        i = self.index[mass]
+        return lambda row: self.passes(row,nTaus,cut,i)
+
+def intersectRanges(*ranges):
+    '''The range (first,last) of the mass indices passing all the ranges from MassSelection.evaluate'''
+    return max([first for first,last in ranges]), min([last for first,last in ranges])
+
+def getSelectionMap(analysis,mass,st=None):
+    '''Cuts for each tau category of a mass point, st optionally gives the sum of lepton pts'''
+    if analysis not in selectionParams: return {}
+    selection = MassSelection(analysis,[mass],st=st)
+    cutRegions = {}
+    for nTaus in selection.params:
+        cutRegions[nTaus] = dict([(cut,selection.getCut(nTaus,cut,mass)) for cut in selection.cuts])
     return cutRegions
 
 ###########################
@@ -700,6 +781,17 @@ def getSigMap(analysis,datadriven=False):
 def getScales(mode):
     return scales[mode]
 
+def getBRMatrix(analysis,modes,genChannels):
+    '''
+    The scale of each gen channel (columns) for each benchmark mode (rows).
+    The prediction of every mode is the product with the counts of the gen channels.
+    '''
+    if analysis=='Hpp3l':
+        rows = [[scales[mode].scale_Hpp3l(gen[:2],gen[2:]) for gen in genChannels] for mode in modes]
+    else:
+        rows = [[scales[mode].scale_Hpp4l(gen[:2],gen[2:]) for gen in genChannels] for mode in modes]
+    return np.array(rows,dtype=float).reshape(len(modes),len(genChannels))
+
 def getCategories(analysis):
     '''Get categories'''
     return cats
@@ -0,0 +1,108 @@
+'''
+Project 2D and 3D histograms onto an axis with numpy slices of the bin arrays.
+'''
+from array import array
+
+import numpy as np
+
+import ROOT
+
+dtypes = {
+    'D': np.float64,
+    'F': np.float32,
+    'I': np.int32,
+    'S': np.int16,
+    'C': np.int8,
+}
+
+def toArray(buf,n,dtype):
+    '''Copy a ROOT buffer of n values to a numpy array'''
+    if hasattr(buf,'SetSize'): buf.SetSize(n)
+    return np.array(np.frombuffer(buf,dtype=dtype,count=n),dtype=np.float64)
+
+def getHistArrays(hist):
+    '''
+    The bin contents and squared errors of a histogram, including under and
+    overflow, indexed as [z][y][x] (3D) or [y][x] (2D).
+    '''
+    n = hist.GetNcells()
+    content = toArray(hist.GetArray(),n,dtypes[hist.ClassName()[-1]])
+    if hist.GetSumw2N():
+        err2 = toArray(hist.GetSumw2().GetArray(),n,np.float64)
+    else:
+        err2 = np.abs(content)
+    shape = [hist.GetXaxis().GetNbins()+2]
+    if hist.GetDimension()>1: shape = [hist.GetYaxis().GetNbins()+2]+shape
+    if hist.GetDimension()>2: shape = [hist.GetZaxis().GetNbins()+2]+shape
+    return content.reshape(shape), err2.reshape(shape)
+
+def getBins(axis,binLabels=[],binRange=[0,-1]):
+    '''
+    The bins of an axis to sum over, one per bin label if given, otherwise
+    the range as in ProjectionX (all bins with under and overflow if the
+    last bin is before the first).
+    '''
+    n = axis.GetNbins()
+    if binLabels:
+        bins = [axis.FindFixBin(label) for label in binLabels]
+        return [b for b in bins if b>0 and b<=n]
+    first, last = binRange
+    if last<first: return range(n+2)
+    return range(max(first,0),min(last,n+1)+1)
+
+def buildHist(histName,axis,content,err2):
+    '''A TH1D with the binning of an axis, filled with the given arrays'''
+    n = axis.GetNbins()
+    if axis.GetXbins().GetSize():
+        hist = ROOT.TH1D(histName,histName,n,axis.GetXbins().GetArray())
+    else:
+        hist = ROOT.TH1D(histName,histName,n,axis.GetXmin(),axis.GetXmax())
+    hist.SetDirectory(0)
+    if axis.GetLabels():
+        for b in range(1,n+1):
+            hist.GetXaxis().SetBinLabel(b,axis.GetBinLabel(b))
+    hist.Sumw2()
+    hist.SetContent(array('d',content.tolist()))
+    hist.GetSumw2().Set(n+2,array('d',err2.tolist()))
+    hist.ResetStats()
+    return hist
+
+def sumBins(arr,selected):
+    '''Sum an array over the selected bins of each axis, None keeps the axis'''
+    for axis in reversed(range(len(selected))):
+        if selected[axis] is None: continue
+        arr = arr.take(selected[axis],axis=axis).sum(axis=axis)
+    return arr
+
+class Projector(object):
+    '''
+    Projections of a 2D or 3D histogram onto one axis.
+
+    The bin arrays are read once, every projection is then a sum of array
+    slices. The bins are selected with labels or ranges of the other axes,
+    in the order (x, y, z) skipping the projected axis, as in the
+    Projection methods of ROOT with the 'e' option.
+    '''
+
+    def __init__(self,hist):
+        self.hist = hist
+        self.dimension = hist.GetDimension()
+        self.content, self.err2 = getHistArrays(hist)
+        self.axes = {'x': hist.GetXaxis(), 'y': hist.GetYaxis(), 'z': hist.GetZaxis()}
+
+    def project(self,histName,direction,binLabels=[],binRanges=[]):
+        '''
+        Project onto an axis, binLabels and binRanges have one entry per
+        other axis.
+        '''
+        others = [a for a in ['x','y','z'][:self.dimension] if a!=direction]
+        # arrays are indexed [z][y][x]
+        index = dict([(a,self.dimension-1-i) for i,a in enumerate(['x','y','z'][:self.dimension])])
+        selected = [None]*self.dimension
+        for i,a in enumerate(others):
+            labels = binLabels[i] if i<len(binLabels) else []
+            binRange = binRanges[i] if i<len(binRanges) else [0,-1]
+            selected[index[a]] = getBins(self.axes[a],labels,binRange)
+        content = sumBins(self.content,selected)
+        err2 = sumBins(self.err2,selected)
+        return buildHist(histName,self.axes[direction],content,err2)
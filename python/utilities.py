@@ -4,6 +4,7 @@ import sys
 import hashlib
 import glob
 import logging
+import multiprocessing
 
 from DevTools.Utilities.utilities import python_mkdir, ZMASS, getCMSSWVersion
 from DevTools.Utilities.hdfsUtils import get_hdfs_root_files
@@ -21,6 +22,34 @@ def hashFile(*filenames,**kwargs):
                 buff = f.read(BUFFSIZE)
     return hasher.hexdigest()
 
+def fingerprintFiles(*filenames,**kwargs):
+    '''
+    A cheap replacement of hashFile for ntuples: the path, size and mtime of
+    each file, with the entries of treeName and the file UUID if given.
+    sampleBlocks>0 adds the hash of that many blocks spread over each file.
+    '''
+    treeName = kwargs.pop('treeName','')
+    sampleBlocks = kwargs.pop('sampleBlocks',0)
+    BUFFSIZE = kwargs.pop('BUFFSIZE',65536)
+    if treeName:
+        import ROOT
+    hasher = hashlib.md5()
+    for filename in filenames:
+        stat = os.stat(filename)
+        hasher.update('{0}:{1}:{2}'.format(filename,stat.st_size,int(stat.st_mtime)))
+        if treeName:
+            tfile = ROOT.TFile.Open(filename)
+            if tfile and not tfile.IsZombie():
+                tree = tfile.Get(treeName)
+                hasher.update(':{0}:{1}'.format(tree.GetEntries() if tree else -1,tfile.GetUUID().AsString()))
+                tfile.Close()
+        if sampleBlocks>0:
+            with open(filename,'rb') as f:
+                for i in range(sampleBlocks):
+                    f.seek(max(stat.st_size-BUFFSIZE,0)*i/max(sampleBlocks-1,1))
+                    hasher.update(f.read(BUFFSIZE))
+    return hasher.hexdigest()
+
 def hashString(*strings):
     hasher = hashlib.md5()
     for string in strings:
@@ -29,6 +58,19 @@ def hashString(*strings):
 
 
 
+def getEntryRanges(nEntries,nShards):
+    '''Split a number of entries into contiguous ranges'''
+    bounds = [nEntries*i/nShards for i in range(nShards+1)]
+    return [(bounds[i],bounds[i+1]) for i in range(nShards) if bounds[i+1]>bounds[i]]
+
+def runForked(func,argsList):
+    '''Run func for each set of args in a forked process'''
+    procs = [multiprocessing.Process(target=func,args=args) for args in argsList]
+    for p in procs: p.start()
+    for p in procs: p.join()
+    failed = [i for i,p in enumerate(procs) if p.exitcode!=0]
+    if failed: raise Exception('Processes {0} failed'.format(failed))
+
 def isData(sample):
     '''Test if sample is data'''
     dataSamples = ['DoubleMuon','DoubleEG','MuonEG','SingleMuon','SingleElectron','Tau']
@@ -307,6 +349,38 @@ latestHistograms['80X']['MuMuTauTau'] = {
     'muR0.5muF0.5'     : '2019-07-29_MuMuTauTauHistogramsNew_muR0.5muF0.5_80X_Moriond_v1',
 }
 
+# shifts that only change the event weight, filled in the same pass as the nominal
+# and stored in <shift>/ subdirectories of the nominal histograms
+weightShifts = {}
+weightShifts['MuMuTauTau'] = [
+    'lepUp', 'lepDown',
+    'trigUp', 'trigDown',
+    'puUp', 'puDown',
+    'fakeUp', 'fakeDown',
+    'btagUp', 'btagDown',
+    'tauUp', 'tauDown',
+] + ['muR{0:3.1f}muF{1:3.1f}'.format(muR,muF) for muR in [1.0,2.0,0.5] for muF in [1.0,2.0,0.5]]
+
+# the weight shifts that also change data, through the fake and prompt rates of the fake regions
+dataWeightShifts = {}
+dataWeightShifts['MuMuTauTau'] = [
+    'lepUp', 'lepDown',
+    'fakeUp', 'fakeDown',
+]
+
+def getWeightShifts(analysis,data=False):
+    if data: return dataWeightShifts.get(analysis,[])
+    return weightShifts.get(analysis,[])
+
+def getFlatShiftDirectory(analysis,shift,version=getCMSSWVersion(),sample=''):
+    '''
+    Directory of a weight shift in the nominal histograms, empty for other shifts.
+    Data only has the shifts of dataWeightShifts, the nominal is used for the others.
+    '''
+    if shift not in weightShifts.get(analysis,[]): return ''
+    if sample and isData(sample) and shift not in dataWeightShifts.get(analysis,[]): return ''
+    return shift
+
 def getNewFlatHistograms(analysis,sample,version=getCMSSWVersion(),shift='',base='newflat'):
     return getFlatHistograms(analysis,sample,version,shift,base)
 
@@ -316,6 +390,9 @@ def getNewProjectionHistograms(analysis,sample,version=getCMSSWVersion(),shift='
         
 def getFlatHistograms(analysis,sample,version=getCMSSWVersion(),shift='',base='flat'):
     flat = '{}/{}/{}.root'.format(base,analysis,sample)
+    if shift and shift in weightShifts.get(analysis,[]):
+        # stored in <shift>/ of the nominal histograms
+        return getFlatHistograms(analysis,sample,version=version,base=base)
     if shift in latestHistograms.get(version,{}).get(analysis,{}):
         baseDir = '/hdfs/store/user/dntaylor'
         flatpath = os.path.join(baseDir,latestHistograms[version][analysis][shift],sample)
@@ -328,6 +405,9 @@ def getFlatHistograms(analysis,sample,version=getCMSSWVersion(),shift='',base='f
         
 def getProjectionHistograms(analysis,sample,version=getCMSSWVersion(),shift='',base='projections'):
     proj = '{}/{}/{}.root'.format(base,analysis,sample)
+    if shift and shift in weightShifts.get(analysis,[]):
+        # stored in <shift>/ of the nominal projections
+        return getProjectionHistograms(analysis,sample,version=version,base=base)
     if shift in latestHistograms.get(version,{}).get(analysis,{}):
         baseDir = '/hdfs/store/user/dntaylor'
         projpath = os.path.join(baseDir,latestHistograms[version][analysis][shift],sample)
@@ -471,6 +551,41 @@ def getSkimPickle(analysis,sample,version=getCMSSWVersion(),shift=''):
     #    raise Exception('Unrecognized {0}'.format(':'.join([analysis,sample,version,shift])))
     return pfile
 
+def getSkimCounts(analysis,sample,version=getCMSSWVersion(),shift=''):
+    cfile = 'pickles/{0}/skims/{1}.cnt'.format(analysis,sample)
+    if shift and shift in latestSkims.get(version,{}).get(analysis,{}):
+        baseDir = '/hdfs/store/user/dntaylor'
+        cpath = os.path.join(baseDir,latestSkims[version][analysis][shift],sample)
+        # never the nominal store, without a shifted store the shifted pickle is read
+        cfile = os.path.join(cpath,'{0}.cnt.root'.format(sample))
+        fnames = glob.glob('{0}/*.root'.format(cpath))
+        if len(fnames)==0:
+            logging.warning('No such path {0}'.format(cpath))
+        for fname in fnames:
+            if '.cnt' in fname: cfile = fname
+    return cfile
+
+def getSkimScan(analysis,sample,version=getCMSSWVersion(),shift=''):
+    sfile = 'pickles/{0}/scans/{1}.pkl'.format(analysis,sample)
+    if shift and shift in latestSkims.get(version,{}).get(analysis,{}):
+        baseDir = '/hdfs/store/user/dntaylor'
+        spath = os.path.join(baseDir,latestSkims[version][analysis][shift],sample)
+        # never the nominal scans, a shifted skim without scans has none
+        sfile = os.path.join(spath,'{0}.scan.root'.format(sample))
+        fnames = glob.glob('{0}/*.root'.format(spath))
+        if len(fnames)==0:
+            logging.warning('No such path {0}'.format(spath))
+        for fname in fnames:
+            if '.scan' in fname: sfile = fname
+    return sfile
+
+def getEntryListFile(analysis,sample,version=getCMSSWVersion(),shift=''):
+    name = '_'.join([x for x in [sample,shift] if x])
+    return 'entrylists/{0}/{1}.root'.format(analysis,name)
+
+def getBranchJson(analysis,codeHash):
+    return 'jsons/{0}/branches/{1}.json'.format(analysis,codeHash)
+
 treeMap = {
     ''               : 'Tree',
     'Electron'       : 'ETree',
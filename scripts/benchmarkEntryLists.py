@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+'''
+Measure the time to draw the histograms of a sample with and without the
+per-selection entry lists of NtupleWrapper.
+
+Three passes are timed: no entry lists, entry lists built on the fly (first
+run), and entry lists read back from the entry list file (later runs).
+'''
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+import shutil
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from DevTools.Plotter.NtupleWrapper import NtupleWrapper
+from DevTools.Plotter.histParams import getHistParams, getHistSelections
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def timeDraws(wrapper,hists,selections):
+    '''Draw every histogram for every selection, returns the time and the integrals'''
+    integrals = []
+    start = time.time()
+    for selection in selections:
+        for histName, params in hists:
+            hist = wrapper.getTempHist(histName,selection,'1',params['xVariable'],params['xBinning'])
+            integrals += [hist.Integral() if hist else 0.]
+    return time.time()-start, integrals
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the NtupleWrapper entry lists')
+
+    parser.add_argument('analysis', type=str, help='Analysis of the ntuple')
+    parser.add_argument('sample', type=str, help='Sample to draw, a real sized one is most informative')
+    parser.add_argument('--hists', type=int, default=10, help='Number of histograms per selection')
+    parser.add_argument('--selections', nargs='+', type=str, default=['all'], help='Selections to draw')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None: argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    histParams = getHistParams(args.analysis,args.sample)
+    hists = sorted([(name,params) for name,params in histParams.iteritems() if params and 'yVariable' not in params])[:args.hists]
+    histSelections = getHistSelections(args.analysis,args.sample)
+    selections = [histSelections[s]['args'][0] for s in sorted(histSelections) if histSelections[s] and ('all' in args.selections or s in args.selections)]
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        entryListFile = os.path.join(tmpdir,'entrylists.root')
+        results = []
+        for label, useEntryLists in [('No entry lists',False),('Entry lists created',True),('Entry lists from file',True)]:
+            wrapper = NtupleWrapper(args.analysis,args.sample,useEntryLists=useEntryLists,entryListFile=entryListFile,tempCacheDirectory='')
+            nEntries = wrapper.getTree().GetEntries()
+            elapsed, integrals = timeDraws(wrapper,hists,selections)
+            results += [(label,elapsed,integrals)]
+            logging.info('{0:25}: {1:8.2f} s for {2} histograms'.format(label,elapsed,len(integrals)))
+        for label, elapsed, integrals in results[1:]:
+            if integrals!=results[0][2]: logging.warning('{0}: histograms differ from those without entry lists'.format(label))
+        if selections and nEntries:
+            passing = [wrapper._NtupleWrapper__getEntryList(selection).GetN() for selection in selections]
+            logging.info('Selections pass {0:.2%} of {1} entries on average'.format(float(sum(passing))/len(passing)/nEntries,nEntries))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
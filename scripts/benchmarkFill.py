@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+'''
+Measure the per event cost of NtupleFlattener.fill with the compiled
+fill plans against the previous name formatting implementation.
+'''
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+import tempfile
+import shutil
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from DevTools.Plotter.NtupleFlattener import NtupleFlattener
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+class Row(object):
+    '''A stand in for a tree entry'''
+    def __init__(self,nVars):
+        for i in range(nVars):
+            setattr(self,'var{0}'.format(i),random.uniform(0,100))
+
+class BenchmarkFlattener(NtupleFlattener):
+    '''A flattener with synthetic histograms'''
+    def __init__(self,nHists,nSelections,nChannels,nGenChannels,**kwargs):
+        self.histParams = {}
+        for i in range(nHists):
+            self.histParams['hist{0}'.format(i)] = {'x': lambda row, i=i: getattr(row,'var{0}'.format(i)), 'xBinning': [50,0,100], 'doGen': i%2==0}
+        self.selections = ['sel{0}'.format(i) for i in range(nSelections)]
+        self.channels = ['chan{0}'.format(i) for i in range(nChannels)]
+        self.genChannels = ['gen{0}'.format(i) for i in range(nGenChannels)]
+        super(BenchmarkFlattener,self).__init__('Benchmark','benchmark',**kwargs)
+
+def legacyFill(flattener,row,selection,weight,chan='all',genChan='all'):
+    '''The histogram fill before the fill plans were compiled'''
+    for hist in flattener.histParams:
+        if selection in flattener.selectionHists:
+            if hist not in flattener.selectionHists[selection]: continue
+        w = weight*flattener.histParams[hist]['mcscale'](row) if 'mcscale' in flattener.histParams[hist] and flattener.isData else weight
+        histName = flattener.histPrefix+'{0}/{1}'.format(selection,hist)
+        xval = flattener.histParams[hist]['x'](row)
+        flattener.hists[histName].Fill(xval,w)
+        if chan!='all':
+            histName = flattener.histPrefix+'{0}/{1}/{2}'.format(selection,chan,hist)
+            flattener.hists[histName].Fill(xval,w)
+        if genChan!='all':
+            histName = flattener.histPrefix+'{0}/{1}/gen_{2}/{3}'.format(selection,chan,genChan,hist)
+            if histName in flattener.hists: flattener.hists[histName].Fill(xval,w)
+
+def timeFill(func,flattener,rows,fills):
+    start = time.time()
+    for row in rows:
+        for selection, chan, genChan in fills:
+            func(row,selection,1.,chan,genChan)
+    flattener.fillBuffers.flush()
+    return (time.time()-start)/len(rows)
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the per event fill')
+
+    parser.add_argument('--events', type=int, default=2000, help='Number of events to fill')
+    parser.add_argument('--hists', type=int, default=200, help='Number of histograms')
+    parser.add_argument('--selections', type=int, default=10, help='Number of selections')
+    parser.add_argument('--channels', type=int, default=10, help='Number of channels')
+    parser.add_argument('--genChannels', type=int, default=5, help='Number of gen channels')
+    parser.add_argument('--fillsPerEvent', type=int, default=5, help='Number of selections filled per event')
+    parser.add_argument('--bufferSize', type=int, default=1000, help='Fills buffered per histogram, 0 to fill directly')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None: argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        flattener = BenchmarkFlattener(args.hists,args.selections,args.channels,args.genChannels,outputFile=os.path.join(tmpdir,'benchmark.root'),progressbar=None,bufferSize=args.bufferSize)
+        flattener._NtupleFlattener__initializeHistograms()
+        logging.info('Booked {0} histograms'.format(len(flattener.hists)))
+
+        rows = [Row(args.hists) for i in range(args.events)]
+        fills = [(random.choice(flattener.selections),random.choice(flattener.channels),random.choice(flattener.genChannels)) for i in range(args.fillsPerEvent)]
+
+        legacy = timeFill(lambda *a: legacyFill(flattener,*a),flattener,rows,fills)
+        compiled = timeFill(flattener.fillHists,flattener,rows,fills)
+        logging.info('Legacy fill:   {0:8.1f} us/event'.format(legacy*1e6))
+        logging.info('Compiled fill: {0:8.1f} us/event (first fills include compiling the plans)'.format(compiled*1e6))
+        logging.info('Speedup:       {0:8.2f}x'.format(legacy/compiled if compiled else 0.))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
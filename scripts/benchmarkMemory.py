@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+'''
+Compare the peak memory of NtupleFlattener with histograms created when
+booked against histograms created on first fill.
+'''
+import os
+import sys
+import random
+import logging
+import argparse
+import tempfile
+import shutil
+import resource
+import multiprocessing
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from DevTools.Plotter.NtupleFlattener import NtupleFlattener
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+class Row(object):
+    '''A stand in for a tree entry'''
+    def __init__(self,nVars):
+        for i in range(nVars):
+            setattr(self,'var{0}'.format(i),random.uniform(0,100))
+
+class BenchmarkFlattener(NtupleFlattener):
+    '''A flattener with synthetic histograms'''
+    def __init__(self,nHists,nBins,nSelections,nChannels,nGenChannels,**kwargs):
+        self.histParams = {}
+        for i in range(nHists):
+            self.histParams['hist{0}'.format(i)] = {'x': lambda row, i=i: getattr(row,'var{0}'.format(i)), 'xBinning': [nBins,0,100], 'doGen': i%2==0}
+        self.selections = ['sel{0}'.format(i) for i in range(nSelections)]
+        self.channels = ['chan{0}'.format(i) for i in range(nChannels)]
+        self.genChannels = ['gen{0}'.format(i) for i in range(nGenChannels)]
+        super(BenchmarkFlattener,self).__init__('Benchmark','benchmark',**kwargs)
+
+def measure(args,lazy,queue):
+    '''Book, fill a few selections, and write, then report the peak RSS'''
+    tmpdir = tempfile.mkdtemp()
+    try:
+        flattener = BenchmarkFlattener(args.hists,args.bins,args.selections,args.channels,args.genChannels,outputFile=os.path.join(tmpdir,'benchmark.root'),progressbar=None,lazyHists=lazy)
+        flattener._NtupleFlattener__initializeHistograms()
+        fills = [(random.choice(flattener.selections),random.choice(flattener.channels),random.choice(flattener.genChannels)) for i in range(args.filledCombinations)]
+        for i in range(args.events):
+            row = Row(args.hists)
+            for selection, chan, genChan in fills:
+                flattener.fill(row,selection,1.,chan,genChan)
+        flattener.write(verbose=False)
+        queue.put((flattener.hists.nCreated(),len(flattener.hists),resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.))
+    finally:
+        shutil.rmtree(tmpdir)
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the flattener peak memory')
+
+    parser.add_argument('--events', type=int, default=100, help='Number of events to fill')
+    parser.add_argument('--hists', type=int, default=30, help='Number of histograms')
+    parser.add_argument('--bins', type=int, default=1600, help='Number of bins per histogram')
+    parser.add_argument('--selections', type=int, default=30, help='Number of selections')
+    parser.add_argument('--channels', type=int, default=20, help='Number of channels')
+    parser.add_argument('--genChannels', type=int, default=10, help='Number of gen channels')
+    parser.add_argument('--filledCombinations', type=int, default=20, help='Number of selection/channel combinations filled')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None: argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    for label, lazy in [('Created when booked',False),('Created on first fill',True)]:
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=measure,args=(args,lazy,queue))
+        proc.start()
+        created, booked, peak = queue.get()
+        proc.join()
+        logging.info('{0:25}: {1:6d}/{2:6d} histograms created, peak RSS {3:8.1f} MB'.format(label,created,booked,peak))
+
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+'''
+Measure the setup time of the Hpp4l plots (hpp4lPlots.py) with the sample
+wrappers created when added against created on first use.
+'''
+import sys
+import time
+import logging
+import argparse
+import multiprocessing
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from DevTools.Plotter.Plotter import Plotter
+from DevTools.Plotter.higgsUtilities import getSigMap
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+allsamples = ['TT','TTV','Z','WZ','VVV','ZZ']
+signals = ['HppHmm500GeV']
+shifts = ['lep','trig','btag','pu','fake','ElectronEn','TauEn','MuonEn','JetEn']
+
+def measure(args,lazy,queue):
+    '''Set up the plotter as hpp4lPlots.py does, then read the nominal histograms requested'''
+    start = time.time()
+    sigMap = getSigMap('Hpp4l')
+    plotter = Plotter('Hpp4l',new=True)
+    plotter.addShiftUncertainty(*shifts[:args.shifts])
+    for s in allsamples:
+        plotter.addHistogramToStack(s,sigMap[s])
+    for signal in signals:
+        plotter.addHistogram(signal,sigMap[signal],signal=True)
+    wrappers = [w for analysis in plotter.sampleFiles.values() for w in analysis.values()]
+    wrappers += [w for shift in plotter.shiftFiles.values() for analysis in shift.values() for w in analysis.values()]
+    if not lazy:
+        for w in wrappers: w.wrapper()
+    setup = time.time()-start
+    for variable in args.variables:
+        for s in allsamples:
+            for sample in sigMap[s]:
+                plotter.sampleFiles['Hpp4l'][sample].getHist(variable)
+    total = time.time()-start
+    queue.put((setup,total,len(wrappers),len([w for w in wrappers if w.isCreated()])))
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the Hpp4l plotter startup')
+
+    parser.add_argument('--shifts', type=int, default=len(shifts), help='Number of shift uncertainties')
+    parser.add_argument('--variables', nargs='*', type=str, default=['default/count'], help='Nominal histograms read after the setup')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None: argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    for label, lazy in [('Created when added',False),('Created on first use',True)]:
+        queue = multiprocessing.Queue()
+        proc = multiprocessing.Process(target=measure,args=(args,lazy,queue))
+        proc.start()
+        setup, total, nWrappers, nCreated = queue.get()
+        proc.join()
+        logging.info('{0:22}: setup {1:7.2f} s, with first reads {2:7.2f} s, {3:5d}/{4:5d} wrappers created'.format(label,setup,total,nCreated,nWrappers))
+
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+'''
+Check that the wrapper of a weight shift reads the <shift>/ histograms
+filled in the nominal pass (newFlattenTrees.py --weightShifts).
+
+For each shift the histogram read by a shifted NtupleWrapper is compared
+with the <shift>/ histogram read directly from the nominal file.
+'''
+import os
+import sys
+import logging
+import argparse
+
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from DevTools.Plotter.NtupleWrapper import NtupleWrapper
+from DevTools.Plotter.utilities import getWeightShifts, getFlatShiftDirectory
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def checkShift(analysis,sample,shift,variable,nominal):
+    '''Compare the histogram of a shifted wrapper with the one in the nominal file, returns True if they agree'''
+    wrapper = NtupleWrapper(analysis,sample,shift=shift,tempCacheDirectory='')
+    if wrapper.flat!=nominal.flat:
+        logging.error('{0}: reads {1} instead of the nominal {2}'.format(shift,wrapper.flat,nominal.flat))
+        return False
+    directory = getFlatShiftDirectory(analysis,shift,sample=sample)
+    if not directory:
+        logging.info('{0}: not filled for {1}, the nominal is used'.format(shift,sample))
+        return True
+    tfile = ROOT.TFile.Open(nominal.flat)
+    expected = tfile.Get('{0}/{1}'.format(directory,variable)) if tfile else None
+    if not expected:
+        logging.error('{0}: {1}/{2} not found in {3}'.format(shift,directory,variable,nominal.flat))
+        if tfile: tfile.Close()
+        return False
+    hist = wrapper.getHist(variable)
+    agree = bool(hist) and hist.GetNbinsX()==expected.GetNbinsX() and all([hist.GetBinContent(b)==expected.GetBinContent(b) for b in range(expected.GetNbinsX()+2)])
+    tfile.Close()
+    if not agree:
+        logging.error('{0}: {1} does not match {2}/{1}'.format(shift,variable,directory))
+    return agree
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Check the weight shift histograms of a sample')
+
+    parser.add_argument('analysis', type=str, help='Analysis')
+    parser.add_argument('sample', type=str, help='Sample flattened with --weightShifts')
+    parser.add_argument('variable', type=str, help='Histogram to compare, e.g. default/count')
+    parser.add_argument('--shifts', nargs='*', type=str, default=[], help='Shifts to check, all weight shifts by default')
+
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    if argv is None: argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    shifts = args.shifts if args.shifts else getWeightShifts(args.analysis)
+    nominal = NtupleWrapper(args.analysis,args.sample,tempCacheDirectory='')
+    if not os.path.isfile(nominal.flat):
+        logging.error('No nominal histograms {0}'.format(nominal.flat))
+        return 1
+    failed = [shift for shift in shifts if not checkShift(args.analysis,args.sample,shift,args.variable,nominal)]
+    if failed:
+        logging.error('Failed: {0}'.format(' '.join(failed)))
+        return 1
+    logging.info('All {0} shifts read their <shift>/ histograms'.format(len(shifts)))
+    return 0
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+'''
+Script to convert json or pickle skims to count stores.
+'''
+import argparse
+import glob
+import os
+import sys
+import json
+import pickle
+import logging
+
+from DevTools.Utilities.utilities import python_mkdir
+from DevTools.Plotter.CountStore import writeCountStore
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Convert skims to count stores.')
+
+    parser.add_argument('analysis',type=str,help='Analysis of skims')
+    parser.add_argument('--samples', nargs='+', type=str, default=['*'], help='Samples to convert. Supports unix style wildcards.')
+    parser.add_argument('--overwrite', action='store_true', help='Replace existing count stores')
+
+    args = parser.parse_args(argv)
+
+    return args
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    jdir = 'jsons/{0}/skims'.format(args.analysis)
+    pdir = 'pickles/{0}/skims'.format(args.analysis)
+
+    python_mkdir(pdir)
+
+    # prefer the pickle, fall back to the json
+    sources = {}
+    for s in args.samples:
+        for fname in glob.glob('{0}/{1}.json'.format(jdir,s)):
+            sources[os.path.basename(fname)[:-5]] = fname
+        for fname in glob.glob('{0}/{1}.pkl'.format(pdir,s)):
+            sources[os.path.basename(fname)[:-4]] = fname
+
+    for i,sample in enumerate(sorted(sources)):
+        cntfile = '{0}/{1}.cnt'.format(pdir,sample)
+        if os.path.isfile(cntfile) and not args.overwrite:
+            logging.info('Skipping sample {0} of {1}: {2}'.format(i+1,len(sources),sample))
+            continue
+        logging.info('Converting sample {0} of {1}: {2}'.format(i+1,len(sources),sample))
+        if sources[sample].endswith('.pkl'):
+            with open(sources[sample],'rb') as f:
+                counts = pickle.load(f)
+        else:
+            with open(sources[sample],'r') as f:
+                counts = json.load(f)
+        writeCountStore(cntfile,counts)
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
@@ -30,6 +30,7 @@ def main(argv=None):
 
     jdir = 'jsons/{0}/skims'.format(args.analysis)
     pdir = 'pickles/{0}/skims'.format(args.analysis)
+    sdir = 'pickles/{0}/scans'.format(args.analysis)
     python_mkdir(jdir)
     python_mkdir(pdir)
 
@@ -43,6 +44,10 @@ def main(argv=None):
         files = glob.glob('{0}/*.root'.format(directory))
         jsons = [x for x in files if '.json' in x]
         pickles = [x for x in files if '.pkl' in x]
+        stores = [x for x in files if '.cnt' in x]
+        scans = [x for x in files if '.scan' in x]
+        if len(stores)>1:
+            logging.warning('{0} has the output of {1} jobs, only the first is copied. Use mergeSkims.py to combine them.'.format(destname,len(stores)))
         if jsons:
             jsonfile = '{0}/{1}.json'.format(jdir,destname)
             command = 'cp {0} {1}'.format(jsons[0],jsonfile)
@@ -51,6 +56,15 @@ def main(argv=None):
             pklfile = '{0}/{1}.pkl'.format(pdir,destname)
             command = 'cp {0} {1}'.format(pickles[0],pklfile)
             runCommand(command)
+        if stores:
+            cntfile = '{0}/{1}.cnt'.format(pdir,destname)
+            command = 'cp {0} {1}'.format(stores[0],cntfile)
+            runCommand(command)
+        if scans:
+            python_mkdir(sdir)
+            scanfile = '{0}/{1}.pkl'.format(sdir,destname)
+            command = 'cp {0} {1}'.format(scans[0],scanfile)
+            runCommand(command)
 
 
 if __name__ == "__main__":
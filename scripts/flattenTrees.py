@@ -36,6 +36,8 @@ def flatten(analysis,sample,**kwargs):
     job = kwargs.pop('job',0)
     multi = kwargs.pop('multi',False)
     useProof = kwargs.pop('useProof',False)
+    nWorkers = kwargs.pop('nWorkers',1)
+    batch = kwargs.pop('batch',False)
     intLumi = kwargs.pop('intLumi',float(getLumi()))
     if hasProgress and multi:
         pbar = kwargs.pop('progressbar',ProgressBar(widgets=['{0}: '.format(sample),' ',SimpleProgress(),' histograms ',Percentage(),' ',Bar(),' ',ETA()]))
@@ -45,9 +47,9 @@ def flatten(analysis,sample,**kwargs):
     if outputFile:
         flat = outputFile
         proj = outputFile.replace('.root','_projection.root')
-        flattener = FlattenTree(analysis,sample,inputFileList=inputFileList,flat=flat,proj=proj,shift=shift,countOnly=countOnly,useProof=useProof,intLumi=intLumi)
+        flattener = FlattenTree(analysis,sample,inputFileList=inputFileList,flat=flat,proj=proj,shift=shift,countOnly=countOnly,useProof=useProof,nWorkers=nWorkers,intLumi=intLumi)
     else:
-        flattener = FlattenTree(analysis,sample,inputFileList=inputFileList,shift=shift,countOnly=countOnly,useProof=useProof,intLumi=intLumi)
+        flattener = FlattenTree(analysis,sample,inputFileList=inputFileList,shift=shift,countOnly=countOnly,useProof=useProof,nWorkers=nWorkers,intLumi=intLumi)
 
     for histName, params in histParams.iteritems():
         flattener.addHistogram(histName,**params)
@@ -55,7 +57,7 @@ def flatten(analysis,sample,**kwargs):
     for selName, sel in histSelections.iteritems():
         if sel: flattener.addSelection(selName,**sel['kwargs'])
 
-    flattener.flattenAll(progressbar=pbar,njobs=njobs,job=job,multi=multi)
+    flattener.flattenAll(progressbar=pbar,njobs=njobs,job=job,multi=multi,batch=batch)
 
 def getSampleDirectories(analysis,sampleList):
     source = getNtupleDirectory(analysis)
@@ -103,7 +105,9 @@ def parse_command_line(argv):
     parser.add_argument('--channels', nargs='+', type=str, default=['all'], help='Channels to project.')
     parser.add_argument('--skipProjection', action='store_true', help='Skip projecting')
     parser.add_argument('--intLumi', type=float, default=float(getLumi()), nargs='?', help='Override luminosity from full run')
-    #parser.add_argument('--useProof', action='store_true', help='Use PROOF')
+    parser.add_argument('--useProof', action='store_true', help='Draw each sample with a local pool of processes over groups of files')
+    parser.add_argument('--nWorkers', type=int, default=4, help='Number of processes per sample with --useProof')
+    parser.add_argument('--batch', action='store_true', help='Fill all histograms of a sample in one pass over the ntuple')
     parser.add_argument('-j',type=int,default=1,help='Number of cores to use')
 
     return parser.parse_args(argv)
@@ -152,6 +156,9 @@ def main(argv=None):
                 njobs=njobs,
                 job=job,
                 intLumi=args.intLumi,
+                batch=args.batch,
+                useProof=args.useProof,
+                nWorkers=args.nWorkers,
                 )
     elif args.j>1 and hasProgress:
         multi = MultiProgress(args.j)
@@ -160,7 +167,7 @@ def main(argv=None):
             if sample.endswith('.root'): sample = sample[:-5]
             histParams = getSelectedHistParams(args.analysis,args.hists,sample,shift=args.shift,countOnly=args.countOnly)
             histSelections = getSelectedHistSelections(args.analysis,args.selections,sample,shift=args.shift,countOnly=args.countOnly)
-            multi.addJob(sample,flatten,args=(args.analysis,sample,),kwargs={'histParams':histParams,'histSelections':histSelections,'shift':args.shift,'countOnly':args.countOnly,'multi':True,'intLumi':args.intLumi,})
+            multi.addJob(sample,flatten,args=(args.analysis,sample,),kwargs={'histParams':histParams,'histSelections':histSelections,'shift':args.shift,'countOnly':args.countOnly,'multi':True,'intLumi':args.intLumi,'batch':args.batch,'useProof':args.useProof,'nWorkers':args.nWorkers,})
         multi.retrieve()
     else:
         for directory in directories:
@@ -175,8 +182,10 @@ def main(argv=None):
                     shift=args.shift,
                     countOnly=args.countOnly,
                     multi=False,
-                    #useProof=args.useProof,
                     intLumi=args.intLumi,
+                    batch=args.batch,
+                    useProof=args.useProof,
+                    nWorkers=args.nWorkers,
                     )
 
     logging.info('Finished')
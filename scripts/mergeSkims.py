@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+'''
+Script to merge the skims of jobs over parts of a sample from output of farmout.
+'''
+import argparse
+import glob
+import os
+import sys
+import logging
+from DevTools.Utilities.utilities import python_mkdir
+from DevTools.Plotter.CountStore import mergeCountStores, exportCountStore
+from DevTools.Plotter.JointScan import mergeJointScanFiles
+
+logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(asctime)s.%(msecs)03d %(levelname)s %(name)s: %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+
+def parse_command_line(argv):
+    parser = argparse.ArgumentParser(description='Merge skims from directory.')
+
+    parser.add_argument('analysis',type=str,help='Analysis of skims')
+    parser.add_argument('input',type=str,help='Input top-level directory to merge, each subdirectory has the output of the jobs of a sample.')
+    parser.add_argument('--maxOpen',type=int,default=64,help='Maximum number of count stores open at once')
+
+    args = parser.parse_args(argv)
+
+    return args
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    args = parse_command_line(argv)
+
+    jdir = 'jsons/{0}/skims'.format(args.analysis)
+    pdir = 'pickles/{0}/skims'.format(args.analysis)
+    sdir = 'pickles/{0}/scans'.format(args.analysis)
+    python_mkdir(jdir)
+    python_mkdir(pdir)
+
+
+    alldirs = sorted(glob.glob('{0}/*'.format(args.input)))
+
+    for i,directory in enumerate(alldirs):
+        if not os.path.isdir(directory): continue
+        destname = os.path.basename(os.path.normpath(directory))
+        stores = sorted(glob.glob('{0}/*.cnt.root'.format(directory)))
+        scans = sorted(glob.glob('{0}/*.scan.root'.format(directory)))
+        logging.info('Merging sample {0} of {1}: {2} ({3} jobs)'.format(i+1,len(alldirs),destname,len(stores)))
+        if stores:
+            cntfile = '{0}/{1}.cnt'.format(pdir,destname)
+            mergeCountStores(stores,cntfile,maxOpen=args.maxOpen)
+            exportCountStore(cntfile,'{0}/{1}.json'.format(jdir,destname))
+        if scans:
+            python_mkdir(sdir)
+            mergeJointScanFiles(scans,'{0}/{1}.pkl'.format(sdir,destname))
+
+
+if __name__ == "__main__":
+    status = main()
+    sys.exit(status)
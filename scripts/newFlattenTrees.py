@@ -50,6 +50,13 @@ def flatten(analysis,sample,**kwargs):
     njobs = kwargs.pop('njobs',1)
     job = kwargs.pop('job',0)
     skipHists = kwargs.pop('skipHists',False)
+    columnar = kwargs.pop('columnar',False)
+    prune = kwargs.pop('pruneBranches',False)
+    validate = kwargs.pop('validateBranches',False)
+    shards = kwargs.pop('shards',1)
+    weightShifts = kwargs.pop('weightShifts',False)
+    bufferSize = kwargs.pop('bufferSize',1000)
+    lazyHists = not kwargs.pop('eagerHists',False)
     multi = kwargs.pop('multi',False)
     if hasProgress:
         pbar = kwargs.pop('progressbar',ProgressBar(widgets=['{0}: '.format(sample),' ',SimpleProgress(),' ',Percentage(),' ',Bar(),' ',ETA()]))
@@ -57,9 +64,9 @@ def flatten(analysis,sample,**kwargs):
         pbar = None
 
     if outputFile:
-        flattener = flatteners[analysis](sample,inputFileList=inputFileList,outputFile=outputFile,shift=shift,progressbar=pbar,skipHists=skipHists)
+        flattener = flatteners[analysis](sample,inputFileList=inputFileList,outputFile=outputFile,shift=shift,progressbar=pbar,skipHists=skipHists,columnar=columnar,pruneBranches=prune,validateBranches=validate,shards=shards,weightShifts=weightShifts,bufferSize=bufferSize,lazyHists=lazyHists)
     else:
-        flattener = flatteners[analysis](sample,inputFileList=inputFileList,shift=shift,progressbar=pbar,skipHists=skipHists)
+        flattener = flatteners[analysis](sample,inputFileList=inputFileList,shift=shift,progressbar=pbar,skipHists=skipHists,columnar=columnar,pruneBranches=prune,validateBranches=validate,shards=shards,weightShifts=weightShifts,bufferSize=bufferSize,lazyHists=lazyHists)
 
     flattener.flatten()
 
@@ -77,8 +84,15 @@ def parse_command_line(argv):
     parser.add_argument('analysis', type=str, help='Analysis to process')
     parser.add_argument('shift', type=str, default='', nargs='?', help='Shift to apply to scale factors')
     parser.add_argument('--skipHists', action='store_true', help='Skip histograms')
+    parser.add_argument('--columnar', action='store_true', help='Process trees in chunks of numpy arrays')
+    parser.add_argument('--pruneBranches', action='store_true', help='Only read branches used by the flattener')
+    parser.add_argument('--validateBranches', action='store_true', help='Fail if a branch disabled by --pruneBranches is read, slower')
     parser.add_argument('--samples', nargs='+', type=str, default=['*'], help='Samples to flatten. Supports unix style wildcards.')
     parser.add_argument('-j',type=int,default=1,help='Number of cores to use')
+    parser.add_argument('--weightShifts', action='store_true', help='Fill all weight shifts in the same pass as the nominal')
+    parser.add_argument('--shards',type=int,default=1,help='Number of processes to split each sample into')
+    parser.add_argument('--bufferSize',type=int,default=1000,help='Fills buffered per histogram before passing to ROOT, 0 to fill directly')
+    parser.add_argument('--eagerHists', action='store_true', help='Create all histograms before flattening instead of on first fill')
 
     return parser.parse_args(argv)
 
@@ -117,13 +131,20 @@ def main(argv=None):
                 #inputFileList=inputFileList,
                 outputFile=outputFile,
                 shift=args.shift,
+                columnar=args.columnar,
+                pruneBranches=args.pruneBranches,
+                validateBranches=args.validateBranches,
+                shards=args.shards,
+                weightShifts=args.weightShifts,
+                bufferSize=args.bufferSize,
+                eagerHists=args.eagerHists,
                 )
     elif args.j>1 and hasProgress:
         multi = MultiProgress(args.j)
         for directory in directories:
             sample = directory.split('/')[-1]
             if sample.endswith('.root'): sample = sample[:-5]
-            multi.addJob(sample,flatten,args=(args.analysis,sample,),kwargs={'shift':args.shift,'multi':True,'skipHists':args.skipHists,})
+            multi.addJob(sample,flatten,args=(args.analysis,sample,),kwargs={'shift':args.shift,'multi':True,'skipHists':args.skipHists,'columnar':args.columnar,'pruneBranches':args.pruneBranches,'validateBranches':args.validateBranches,'shards':args.shards,'weightShifts':args.weightShifts,'bufferSize':args.bufferSize,'eagerHists':args.eagerHists,})
         multi.retrieve()
     else:
         for directory in directories:
@@ -134,6 +155,13 @@ def main(argv=None):
                     shift=args.shift,
                     multi=False,
                     skipHists=args.skipHists,
+                    columnar=args.columnar,
+                    pruneBranches=args.pruneBranches,
+                    validateBranches=args.validateBranches,
+                    shards=args.shards,
+                    weightShifts=args.weightShifts,
+                    bufferSize=args.bufferSize,
+                    eagerHists=args.eagerHists,
                     )
 
     logging.info('Finished')
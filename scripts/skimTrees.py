@@ -30,6 +30,11 @@ def skim(analysis,sample,**kwargs):
     outputFile = kwargs.pop('outputFile','')
     shift = kwargs.pop('shift','')
     multi = kwargs.pop('multi',False)
+    prune = kwargs.pop('pruneBranches',False)
+    validate = kwargs.pop('validateBranches',False)
+    shards = kwargs.pop('shards',1)
+    shardBy = kwargs.pop('shardBy','events')
+    normalizationFiles = kwargs.pop('normalizationFiles',[])
     if hasProgress and multi:
         pbar = kwargs.pop('progressbar',ProgressBar(widgets=['{0}: '.format(sample),' ',SimpleProgress(),' events ',Percentage(),' ',Bar(),' ',ETA()]))
     else:
@@ -45,9 +50,9 @@ def skim(analysis,sample,**kwargs):
         return
 
     if outputFile:
-        skimmer = skimMap[analysis](sample,inputFileList=inputFileList,outputFile=outputFile,shift=shift,progressbar=pbar)
+        skimmer = skimMap[analysis](sample,inputFileList=inputFileList,outputFile=outputFile,shift=shift,progressbar=pbar,pruneBranches=prune,validateBranches=validate,shards=shards,shardBy=shardBy,normalizationFiles=normalizationFiles)
     else:
-        skimmer = skimMap[analysis](sample,inputFileList=inputFileList,shift=shift,progressbar=pbar)
+        skimmer = skimMap[analysis](sample,inputFileList=inputFileList,shift=shift,progressbar=pbar,pruneBranches=prune,validateBranches=validate,shards=shards,shardBy=shardBy,normalizationFiles=normalizationFiles)
 
     skimmer.skim()
 
@@ -65,7 +70,12 @@ def parse_command_line(argv):
     parser.add_argument('analysis', type=str, choices=['WZ','ZZ','DY','Charge','TauCharge','Hpp3l','Hpp4l','Electron','Muon','Tau','DijetFakeRate','WTauFakeRate','WFakeRate'], help='Analysis to process')
     parser.add_argument('shift', type=str, default='', nargs='?', help='Shift to apply to scale factors')
     parser.add_argument('--samples', nargs='+', type=str, default=['*'], help='Samples to flatten. Supports unix style wildcards.')
+    parser.add_argument('--pruneBranches', action='store_true', help='Only read branches used by the skimmer')
+    parser.add_argument('--validateBranches', action='store_true', help='Fail if a branch disabled by --pruneBranches is read, slower')
     parser.add_argument('-j',type=int,default=1,help='Number of cores to use')
+    parser.add_argument('--shards',type=int,default=1,help='Number of processes to split each sample into')
+    parser.add_argument('--shardBy',type=str,default='events',choices=['events','files'],help='Split samples into ranges of events or groups of files')
+    parser.add_argument('--normalizeToSample',action='store_true',help='On condor, normalize with all files in the directory of the input files (for jobs over part of a sample, merge with mergeSkims.py)')
 
     return parser.parse_args(argv)
 
@@ -87,6 +97,7 @@ def main(argv=None):
             inputfiles = [x.strip() for x in f.readlines()]
             jobparams = inputfiles[0].split('/')
             sample = jobparams[-2]
+        normalizationFiles = glob.glob('{0}/*.root'.format(os.path.dirname(inputfiles[0]))) if args.normalizeToSample else []
         grid = True
     else:
         directories = getSampleDirectories(args.analysis,args.samples)
@@ -97,13 +108,18 @@ def main(argv=None):
              sample,
              outputFile=outputFile,
              shift=args.shift,
+             pruneBranches=args.pruneBranches,
+             validateBranches=args.validateBranches,
+             shards=args.shards,
+             shardBy=args.shardBy,
+             normalizationFiles=normalizationFiles,
              )
     elif args.j>1 and hasProgress:
         multi = MultiProgress(args.j)
         for directory in directories:
             sample = directory.split('/')[-1]
             if sample.endswith('.root'): sample = sample[:-5]
-            multi.addJob(sample,skim,args=(args.analysis,sample,),kwargs={'shift':args.shift,'multi':True,})
+            multi.addJob(sample,skim,args=(args.analysis,sample,),kwargs={'shift':args.shift,'multi':True,'pruneBranches':args.pruneBranches,'validateBranches':args.validateBranches,'shards':args.shards,'shardBy':args.shardBy,})
         multi.retrieve()
     else:
         for directory in directories:
@@ -113,6 +129,10 @@ def main(argv=None):
                  sample,
                  shift=args.shift,
                  multi=False,
+                 pruneBranches=args.pruneBranches,
+                 validateBranches=args.validateBranches,
+                 shards=args.shards,
+                 shardBy=args.shardBy,
                  )
 
     logging.info('Finished')